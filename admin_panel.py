@@ -2,8 +2,8 @@
 Web Admin Panel - загрузка документов через браузер
 """
 from fastapi import FastAPI, UploadFile, File, Form, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse, JSONResponse
-import os
 import sys
 from pathlib import Path
 import logging
@@ -12,9 +12,9 @@ import uvicorn
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-# УДАЛЕНО: from backend.config import config
+from backend.config import config
 from backend.utils.document_processor import DocumentProcessor
-from backend.rag.rag_engine import RAGEngine
+from backend.rag.factory import create_rag_engine
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -31,35 +31,13 @@ rag_engines = {}
 def init_rag_engines():
     """Инициализация RAG систем"""
     try:
-        rag_engines['ntd'] = RAGEngine(
-            api_key=os.getenv("DEEPSEEK_API_KEY"),
-            pinecone_api_key=os.getenv("PINECONE_API_KEY"),
-            index_name=os.getenv("PINECONE_INDEX", "sveta1"),
-            agent_type='ntd',
-            embedding_model=os.getenv("EMBEDDING_MODEL", "voyage-multilingual-2"),
-            embedding_dimension=int(os.getenv("EMBEDDING_DIMENSION", "1024")),
-            base_url=os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com").strip(),
-            ai_provider=os.getenv("AI_PROVIDER", "deepseek"),
-            voyage_api_key=os.getenv("VOYAGE_API_KEY"),
-            embedding_provider=os.getenv("EMBEDDING_PROVIDER", "voyage")
-        )
+        rag_engines['ntd'] = create_rag_engine('ntd')
         logger.info("✅ RAG НТД инициализирован")
     except Exception as e:
         logger.error(f"❌ Ошибка RAG НТД: {e}")
 
     try:
-        rag_engines['docs'] = RAGEngine(
-            api_key=os.getenv("DEEPSEEK_API_KEY"),
-            pinecone_api_key=os.getenv("PINECONE_API_KEY"),
-            index_name=os.getenv("PINECONE_INDEX", "sveta1"),
-            agent_type='docs',
-            embedding_model=os.getenv("EMBEDDING_MODEL", "voyage-multilingual-2"),
-            embedding_dimension=int(os.getenv("EMBEDDING_DIMENSION", "1024")),
-            base_url=os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com").strip(),
-            ai_provider=os.getenv("AI_PROVIDER", "deepseek"),
-            voyage_api_key=os.getenv("VOYAGE_API_KEY"),
-            embedding_provider=os.getenv("EMBEDDING_PROVIDER", "voyage")
-        )
+        rag_engines['docs'] = create_rag_engine('docs')
         logger.info("✅ RAG Договоры инициализирован")
     except Exception as e:
         logger.error(f"❌ Ошибка RAG Договоры: {e}")
@@ -70,6 +48,12 @@ async def startup_event():
     logger.info("🚀 Запуск Admin Panel...")
     init_rag_engines()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """При остановке приложения — закрываем HTTP-соединения"""
+    for rag in rag_engines.values():
+        await rag.aclose()
+
 @app.get("/", response_class=HTMLResponse)
 async def admin_panel():
     """Главная страница админ-панели"""
@@ -712,12 +696,16 @@ async def upload_documents(
     
     try:
         processor = DocumentProcessor(
-            chunk_size=int(os.getenv("CHUNK_SIZE", "500")),
-            chunk_overlap=int(os.getenv("CHUNK_OVERLAP", "100"))
+            chunk_size=config.CHUNK_SIZE,
+            chunk_overlap=config.CHUNK_OVERLAP
         )
         
         total_chunks = 0
         processed_files = 0
+        cache_hits = 0
+        cache_misses = 0
+        unchanged = 0
+        deleted = 0
         
         for file in files:
             # Проверка формата
@@ -756,17 +744,30 @@ async def upload_documents(
             
             # Загрузка в векторную БД
             logger.info(f"📤 Загрузка {len(documents)} чанков в {agent_type}...")
-            rag_engines[agent_type].add_documents(documents)
+            stats = await rag_engines[agent_type].aadd_documents(documents)
             
             total_chunks += len(documents)
             processed_files += 1
+            cache_hits += stats['cache_hits']
+            cache_misses += stats['cache_misses']
+            unchanged += stats['unchanged']
+            deleted += stats['deleted']
             
-            logger.info(f"✅ {file.filename} загружен ({len(documents)} чанков)")
+            logger.info(
+                f"✅ {file.filename} загружен ({len(documents)} чанков: "
+                f"{stats['upserted']} обновлено, {stats['unchanged']} без изменений, "
+                f"{stats['deleted']} удалено; "
+                f"кэш: {stats['cache_hits']} попаданий / {stats['cache_misses']} промахов)"
+            )
         
         return {
             "success": True,
             "total": processed_files,
             "chunks": total_chunks,
+            "cache_hits": cache_hits,
+            "cache_misses": cache_misses,
+            "unchanged": unchanged,
+            "deleted": deleted,
             "agent_type": agent_type
         }
     
@@ -819,7 +820,7 @@ async def delete_document(
 
 @app.get("/list-files")
 async def list_files(agent_type: str):
-    """Получить список загруженных файлов (оптимизированная версия)"""
+    """Получить список загруженных файлов (из реестра документов)"""
     if agent_type not in ['ntd', 'docs']:
         return JSONResponse(
             status_code=400,
@@ -833,45 +834,15 @@ async def list_files(agent_type: str):
         )
     
     try:
-        # Инициализируем индекс, если нужно
-        if rag_engines[agent_type].index is None:
-            rag_engines[agent_type].init_index()
-        
-        # Получаем уникальные имена файлов через метаданные
-        filenames = set()
-        search_filter = {"agent_type": agent_type}
-        
-        # Загружаем постранично (максимум 1000 векторов за раз)
-        batch_size = 1000
-        total_fetched = 0
-        max_total = 10000  # Максимум для бесплатного тарифа
-        
-        while total_fetched < max_total:
-            results = rag_engines[agent_type].index.query(
-                vector=[0] * 1024,
-                top_k=batch_size,
-                include_metadata=True,
-                filter=search_filter,
-                offset=total_fetched  # Постраничная навигация
-            )
-            
-            if not results['matches']:
-                break
-                
-            for match in results['matches']:
-                filename = match['metadata'].get('filename')
-                if filename:
-                    filenames.add(filename)
-            
-            total_fetched += len(results['matches'])
-            
-            # Если получили меньше, чем запрашивали — больше данных нет
-            if len(results['matches']) < batch_size:
-                break
+        rag = rag_engines[agent_type]
+        
+        # Список берётся из реестра документов; пустой реестр один раз восстанавливается по индексу
+        # (SQLite и сканирование индекса — в пуле потоков, не в event loop)
+        filenames = await run_in_threadpool(rag.list_documents)
         
         return {
             "success": True,
-            "files": sorted(list(filenames)),
+            "files": filenames,
             "count": len(filenames),
             "agent_type": agent_type
         }
@@ -0,0 +1,165 @@
+"""
+Runtime - несколько Telegram-агентов в одном процессе
+Боты задаются конфигурацией: AGENTS=ntd,docs и токен на каждого агента
+(TELEGRAM_BOT_TOKEN_NTD, TELEGRAM_BOT_TOKEN_DOCS). Все агенты работают
+на общих ресурсах одного RAGEngine (см. RAGEngine.for_agent): клиент
+эмбеддингов, подключение к индексу, кэши, SQLite-хранилища, пулы потоков.
+Без AGENTS запускается один бот по TELEGRAM_BOT_TOKEN и AGENT_TYPE, а если
+их нет — все известные агенты, для которых задан TELEGRAM_BOT_TOKEN_<АГЕНТ>.
+"""
+from contextlib import contextmanager
+import asyncio
+import logging
+import os
+import signal
+from typing import Dict, Iterable, List, Optional, Set
+
+from backend.bot.telegram_agent import TelegramAgent
+from backend.config import config
+from backend.rag.factory import create_rag_engine
+from backend.rag.rag_engine import RAGEngine
+
+logger = logging.getLogger(__name__)
+
+# Названия агентов по умолчанию (переопределяются через AGENT_NAME_<АГЕНТ>)
+AGENT_NAMES = {
+    "ntd": "Агент НТД",
+    "docs": "Агент Договоры",
+}
+
+
+def load_bot_configs(agent_types: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Боты из конфигурации
+
+    Args:
+        agent_types: типы агентов (по умолчанию — из AGENTS)
+
+    Returns:
+        [{"agent_type", "token", "name"}, ...]
+    """
+    if agent_types is None:
+        agent_types = config.AGENTS
+
+    if not agent_types:
+        # Прежний режим: один бот на процесс
+        token = os.getenv("TELEGRAM_BOT_TOKEN")
+        agent_type = os.getenv("AGENT_TYPE")
+        if token and agent_type:
+            return [{"agent_type": agent_type, "token": token, "name": _agent_name(agent_type)}]
+        # Иначе — известные агенты, для которых задан токен (как в .env из инструкции)
+        agent_types = [a for a in AGENT_NAMES if os.getenv(f"TELEGRAM_BOT_TOKEN_{a.upper()}")]
+        if not agent_types:
+            logger.error("❌ Не заданы токены ботов: AGENTS + TELEGRAM_BOT_TOKEN_<АГЕНТ> или TELEGRAM_BOT_TOKEN + AGENT_TYPE")
+            return []
+
+    configs = []
+    for agent_type in dict.fromkeys(agent_types):
+        token = os.getenv(f"TELEGRAM_BOT_TOKEN_{agent_type.upper()}")
+        if not token:
+            logger.error(f"❌ Нет TELEGRAM_BOT_TOKEN_{agent_type.upper()} — агент {agent_type} не запущен")
+            continue
+        configs.append({"agent_type": agent_type, "token": token, "name": _agent_name(agent_type)})
+    return configs
+
+
+def _agent_name(agent_type: str) -> str:
+    return os.getenv(f"AGENT_NAME_{agent_type.upper()}") or AGENT_NAMES.get(agent_type, f"Агент {agent_type}")
+
+
+def create_agent(bot_config: Dict, rag: RAGEngine) -> TelegramAgent:
+    """TelegramAgent с параметрами ответа и очереди вопросов из конфигурации"""
+    return TelegramAgent(
+        bot_config["token"],
+        rag,
+        bot_config["name"],
+        stream_answers=config.STREAM_ANSWERS,
+        stream_edit_interval=config.STREAM_EDIT_INTERVAL,
+        max_concurrent_questions=config.MAX_CONCURRENT_QUESTIONS,
+        max_queued_questions=config.MAX_QUEUED_QUESTIONS
+    )
+
+
+@contextmanager
+def _stop_on_signals(agents: Iterable[TelegramAgent]):
+    """
+    Один обработчик SIGINT/SIGTERM, останавливающий polling всех агентов
+    (у каждого агента свой Dispatcher, и обработчик сигнала в event loop
+    остаётся только от последнего — остальные боты не остановились бы)
+    """
+    loop = asyncio.get_running_loop()
+    agents = list(agents)
+    stopping: Set[asyncio.Task] = set()
+
+    def stop_all():
+        logger.info("🛑 Получен сигнал остановки, останавливаем ботов...")
+        for agent in agents:
+            task = loop.create_task(agent.stop())
+            stopping.add(task)
+            task.add_done_callback(stopping.discard)
+
+    installed = []
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_all)
+            installed.append(sig)
+        except NotImplementedError:
+            # Windows: Ctrl+C прерывает asyncio.run, finally всё равно выполняется
+            pass
+    try:
+        yield
+    finally:
+        for sig in installed:
+            loop.remove_signal_handler(sig)
+
+
+async def run_bots(agent_types: Optional[List[str]] = None):
+    """
+    Запуск всех ботов конфигурации (long polling или общий webhook-сервер)
+
+    Args:
+        agent_types: типы агентов (по умолчанию — из AGENTS)
+    """
+    bot_configs = load_bot_configs(agent_types)
+    if not bot_configs:
+        return
+
+    # Общие ресурсы принадлежат базовому движку; агенты получают движки-представления,
+    # aclose которых ничего не закрывает — базовый движок закрывается в finally
+    shared = create_rag_engine()
+    agents: Dict[str, TelegramAgent] = {}
+    try:
+        for bot_config in bot_configs:
+            rag = shared.for_agent(bot_config["agent_type"])
+            rag.init_index()
+            agents[bot_config["agent_type"]] = create_agent(bot_config, rag)
+        logger.info(f"✅ Агентов в процессе: {len(agents)} ({', '.join(agents)})")
+
+        # BOT_MODE=webhook — обновления присылает Telegram (можно несколько реплик за балансировщиком)
+        if config.BOT_MODE == "webhook":
+            from backend.bot.webhook import WebhookServer
+
+            if not config.WEBHOOK_URL:
+                logger.error("❌ Для BOT_MODE=webhook нужен WEBHOOK_URL")
+                for agent in agents.values():
+                    await agent.close()
+                return
+            server = WebhookServer(
+                public_url=config.WEBHOOK_URL,
+                secret_token=config.WEBHOOK_SECRET or None,
+                host=config.WEBHOOK_HOST,
+                port=config.WEBHOOK_PORT,
+                queue_size=config.WEBHOOK_QUEUE_SIZE,
+                workers=config.WEBHOOK_WORKERS
+            )
+            for agent_type, agent in agents.items():
+                server.add_agent(agent_type, agent)
+            # serve закрывает агентов (сессии ботов, очереди) при остановке сервера
+            await server.serve()
+        else:
+            # start закрывает агента при остановке polling
+            with _stop_on_signals(agents.values()):
+                await asyncio.gather(*(agent.start(handle_signals=False) for agent in agents.values()))
+    finally:
+        await shared.aclose()
+        logger.info("🛑 Общие ресурсы агентов закрыты")
@@ -0,0 +1,134 @@
+"""
+Chat Scheduler - очередь вопросов перед обработчиком TelegramAgent
+
+- очередь на каждый чат; вопросы одного чата обрабатываются по порядку
+- общий лимит одновременно обрабатываемых вопросов (эмбеддинги + поиск + LLM)
+- round-robin между чатами: чат с 20 вопросами не задерживает остальных
+- новый вопрос заменяет ещё не начатый предыдущий вопрос того же чата
+- при переполнении вопрос не ставится в очередь (ответ «занят»)
+"""
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[None]]
+
+
+class ChatScheduler:
+    """Планировщик вопросов с очередями по чатам"""
+
+    def __init__(self, max_concurrency: int = 4, max_queued: int = 100):
+        """
+        Args:
+            max_concurrency: сколько вопросов обрабатывается одновременно (всего)
+            max_queued: сколько вопросов может ждать в очередях (всего)
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued
+
+        self._queues: Dict[int, Deque[Job]] = {}
+        # Чаты с ожидающими вопросами, которые сейчас не обрабатываются (порядок обхода)
+        self._ready: Deque[int] = deque()
+        self._running: Set[int] = set()
+        self._queued = 0
+
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+
+        self._stats = {"completed": 0, "failed": 0, "superseded": 0, "rejected": 0}
+
+    def submit(self, chat_id: int, job: Job) -> bool:
+        """
+        Поставить вопрос в очередь чата
+
+        Ещё не начатые вопросы этого чата отменяются — отвечаем на последний.
+
+        Returns:
+            False — очереди переполнены, вопрос не принят
+        """
+        self._ensure_workers()
+
+        # Очередь чата создаётся только для принятого вопроса
+        queue = self._queues.get(chat_id)
+        pending = len(queue) if queue is not None else 0
+        if self._queued - pending + 1 > self.max_queued:
+            self._stats["rejected"] += 1
+            logger.warning(f"⚠️ Очередь вопросов переполнена ({self._queued}), чат {chat_id} — отказ")
+            return False
+
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+        elif queue:
+            self._stats["superseded"] += len(queue)
+            self._queued -= len(queue)
+            queue.clear()
+            logger.info(f"⏭ Чат {chat_id}: предыдущий вопрос заменён новым")
+
+        queue.append(job)
+        self._queued += 1
+        if chat_id not in self._running and chat_id not in self._ready:
+            self._ready.append(chat_id)
+        self._wakeup.set()
+        return True
+
+    def _ensure_workers(self):
+        """Воркеры запускаются при первом вопросе (нужен работающий event loop)"""
+        if self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"chat-scheduler-{i}")
+            for i in range(self.max_concurrency)
+        ]
+
+    async def _worker(self):
+        while True:
+            while not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            chat_id = self._ready.popleft()
+            queue = self._queues.get(chat_id)
+            if not queue:
+                self._queues.pop(chat_id, None)
+                continue
+
+            job = queue.popleft()
+            self._queued -= 1
+            self._running.add(chat_id)
+            try:
+                await job()
+                self._stats["completed"] += 1
+            except Exception as e:
+                self._stats["failed"] += 1
+                logger.error(f"❌ Ошибка обработки вопроса чата {chat_id}: {e}")
+            finally:
+                self._running.discard(chat_id)
+                # В конец очереди обхода — следующим идёт вопрос другого чата
+                if queue:
+                    self._ready.append(chat_id)
+                    self._wakeup.set()
+                elif chat_id in self._queues and not self._queues[chat_id]:
+                    del self._queues[chat_id]
+
+    def stats(self) -> Dict:
+        """Состояние очередей и счётчики"""
+        return {
+            "running": len(self._running),
+            "queued": self._queued,
+            "chats_waiting": len(self._ready),
+            **self._stats
+        }
+
+    async def stop(self):
+        """Остановка воркеров; ожидающие вопросы отбрасываются"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queues.clear()
+        self._ready.clear()
+        self._queued = 0
@@ -0,0 +1,113 @@
+"""
+Streaming Reply - ответ в Telegram, который дописывается по мере генерации
+Первое сообщение отправляется с первыми токенами, дальше оно редактируется
+не чаще раза в edit_interval секунд (Telegram ограничивает частоту правок).
+Текст длиннее лимита сообщения продолжается в следующем сообщении.
+"""
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+# Лимит Telegram — 4096 символов, оставляем место под курсор
+MAX_MESSAGE_LENGTH = 4000
+
+CURSOR = " ▌"
+
+
+class StreamingReply:
+    """Постепенно дописываемый ответ на сообщение пользователя"""
+
+    def __init__(self, message: Message, edit_interval: float = 1.0):
+        """
+        Args:
+            message: сообщение пользователя, на которое отвечаем
+            edit_interval: минимальный интервал между правками одного сообщения (сек)
+        """
+        self.message = message
+        self.edit_interval = edit_interval
+        self.text = ""
+
+        self._sent: Optional[Message] = None
+        self._shown = ""
+        self._next_edit = 0.0
+
+    @property
+    def started(self) -> bool:
+        """Отправлено ли уже первое сообщение"""
+        return self._sent is not None
+
+    async def append(self, delta: str):
+        """Добавить фрагмент; сообщение обновляется, если подошло время правки"""
+        self.text += delta
+        if self._sent is None:
+            if self.text.strip():
+                await self._start_message()
+            return
+        if len(self.text) > MAX_MESSAGE_LENGTH:
+            await self._roll_over()
+        elif time.monotonic() >= self._next_edit:
+            await self._edit(self.text + CURSOR)
+
+    async def finish(self, suffix: str = ""):
+        """Финальный текст без курсора, suffix (источники) — в конце ответа"""
+        if self._sent is None and not self.text.strip():
+            await self.message.answer(suffix.strip() or "…")
+            return
+        if self._sent is None:
+            await self._start_message()
+        while len(self.text) > MAX_MESSAGE_LENGTH:
+            await self._roll_over()
+
+        if len(self.text) + len(suffix) <= MAX_MESSAGE_LENGTH:
+            await self._edit(self.text + suffix, force=True)
+        else:
+            await self._edit(self.text, force=True)
+            if suffix.strip():
+                await self.message.answer(suffix.strip())
+
+    async def _start_message(self):
+        self._sent = await self.message.answer(self.text + CURSOR)
+        self._shown = self.text + CURSOR
+        self._next_edit = time.monotonic() + self.edit_interval
+
+    async def _roll_over(self):
+        """Закрыть заполненное сообщение и продолжить текст в новом"""
+        head, self.text = self._split(self.text)
+        await self._edit(head, force=True)
+        self._sent = None
+        if self.text.strip():
+            await self._start_message()
+
+    @staticmethod
+    def _split(text: str) -> List[str]:
+        """Разрез по последнему абзацу / пробелу в пределах лимита"""
+        cut = text.rfind("\n", 0, MAX_MESSAGE_LENGTH)
+        if cut < MAX_MESSAGE_LENGTH // 2:
+            cut = text.rfind(" ", 0, MAX_MESSAGE_LENGTH)
+        if cut < MAX_MESSAGE_LENGTH // 2:
+            cut = MAX_MESSAGE_LENGTH
+        return [text[:cut], text[cut:].lstrip()]
+
+    async def _edit(self, text: str, force: bool = False):
+        if self._sent is None or text == self._shown:
+            return
+        try:
+            await self._sent.edit_text(text)
+            self._shown = text
+            self._next_edit = time.monotonic() + self.edit_interval
+        except TelegramRetryAfter as e:
+            # Промежуточные правки пропускаем, финальную — повторяем после паузы
+            logger.warning(f"⚠️ Telegram ограничил правки на {e.retry_after} с")
+            self._next_edit = time.monotonic() + e.retry_after
+            if force:
+                await asyncio.sleep(e.retry_after)
+                await self._edit(text, force=True)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                raise
@@ -5,7 +5,11 @@ import logging
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
 from aiogram.types import Message
-from typing import Optional
+from functools import partial
+from typing import Dict, List, Optional
+
+from backend.bot.scheduler import ChatScheduler
+from backend.bot.streaming_reply import StreamingReply
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,17 +18,38 @@ logger = logging.getLogger(__name__)
 class TelegramAgent:
     """Telegram бот-агент для обработки запросов"""
     
-    def __init__(self, bot_token: str, rag_engine, agent_name: str = "Агент"):
+    def __init__(
+        self,
+        bot_token: str,
+        rag_engine,
+        agent_name: str = "Агент",
+        stream_answers: bool = True,
+        stream_edit_interval: float = 1.0,
+        max_concurrent_questions: int = 4,
+        max_queued_questions: int = 100
+    ):
         """
         Args:
             bot_token: токен бота
             rag_engine: экземпляр RAGEngine
             agent_name: название агента (для логов)
+            stream_answers: показывать ответ по мере генерации (правками сообщения)
+            stream_edit_interval: минимальный интервал между правками сообщения (сек)
+            max_concurrent_questions: сколько вопросов обрабатывается одновременно
+            max_queued_questions: сколько вопросов может ждать в очередях чатов
         """
         self.bot = Bot(token=bot_token)
         self.dp = Dispatcher()
         self.rag_engine = rag_engine
         self.agent_name = agent_name
+        self.stream_answers = stream_answers
+        self.stream_edit_interval = stream_edit_interval
+        
+        # Очереди вопросов по чатам: общий лимит, round-robin, замена неначатых вопросов
+        self.scheduler = ChatScheduler(
+            max_concurrency=max_concurrent_questions,
+            max_queued=max_queued_questions
+        )
         
         # Регистрируем обработчики
         self._register_handlers()
@@ -69,56 +94,111 @@ class TelegramAgent:
         
         @self.dp.message(F.text)
         async def handle_question(message: Message):
-            """Обработчик текстовых вопросов"""
-            user_question = message.text
-    
-            logger.info(f"{self.agent_name} - Получен вопрос от {message.from_user.id}: {user_question}")
+            """Обработчик текстовых вопросов: вопрос ставится в очередь чата"""
+            logger.info(f"{self.agent_name} - Получен вопрос от {message.from_user.id}: {message.text}")
             
-            # Отправляем "печатает..."
-            await message.bot.send_chat_action(
-                chat_id=message.chat.id,
-                action="typing"
-            )
-            
-            try:
-                if self.rag_engine:
-                    # Поиск релевантных документов
-                    documents = self.rag_engine.search(user_question)
-            
-                    if documents:
-                        # Генерация ответа на основе найденных документов
-                        answer_text = self.rag_engine.generate_answer(
-                            query=user_question,
-                            context_documents=documents
-                        )
-                        response = f"{answer_text}\n\n"
-                    
-                    # Добавляем источники
-                        response += "📄 Источники:\n"
-                        for i, doc in enumerate(documents, 1):
-                            score = doc.get('score', 0)
-                            filename = doc.get('metadata', {}).get('filename', f'Документ {i}')
-                            response += f"{i}. {filename} (релевантность: {score:.2%})\n"
-                    else:
-                        response = "❌ Не удалось найти информацию по вашему запросу."
-                else:
-                    response = "⚠️ Система поиска временно недоступна."
+            if not self.scheduler.submit(message.chat.id, partial(self._answer_question, message)):
+                await message.answer("⏳ Сейчас очень много вопросов. Пожалуйста, повторите свой через минуту.")
+    
+    async def _answer_question(self, message: Message):
+        """Поиск по базе знаний и ответ на вопрос (запускается планировщиком)"""
+        user_question = message.text
         
-                await message.answer(response)
-                logger.info(f"{self.agent_name} - Ответ отправлен")
-                
-            except Exception as e:
-                logger.error(f"{self.agent_name} - Ошибка: {e}")
-                await message.answer("❌ Произошла ошибка при обработке запроса.")
+        # Отправляем "печатает..."
+        await message.bot.send_chat_action(
+            chat_id=message.chat.id,
+            action="typing"
+        )
         
+        try:
+            if self.rag_engine:
+                # Поиск релевантных документов
+                # (async-методы: медленный вопрос не задерживает других пользователей)
+                documents = await self.rag_engine.asearch(
+                    user_question,
+                    top_k=self.rag_engine.rerank_candidates or None
+                )
+                # Разнообразные фрагменты: не больше N из одного файла, без дублей
+                documents = await self.rag_engine.arerank(documents)
+
+                if documents and self.stream_answers:
+                    # Ответ показывается по мере генерации, источники — в конце
+                    await self._stream_answer(message, user_question, documents)
+                    logger.info(f"{self.agent_name} - Ответ отправлен (потоково)")
+                    return
+                elif documents:
+                    # Генерация ответа на основе найденных документов
+                    answer_text = await self.rag_engine.agenerate_answer(
+                        query=user_question,
+                        context_documents=documents
+                    )
+                    response = f"{answer_text}\n\n" + self._format_sources(documents)
+                else:
+                    response = "❌ Не удалось найти информацию по вашему запросу."
+            else:
+                response = "⚠️ Система поиска временно недоступна."
+    
+            await message.answer(response)
+            logger.info(f"{self.agent_name} - Ответ отправлен")
+            
+        except Exception as e:
+            logger.error(f"{self.agent_name} - Ошибка: {e}")
+            await message.answer("❌ Произошла ошибка при обработке запроса.")
+    
+    @staticmethod
+    def _format_sources(documents: List[Dict]) -> str:
+        """Список источников ответа"""
+        response = "📄 Источники:\n"
+        for i, doc in enumerate(documents, 1):
+            score = doc.get('score', 0)
+            filename = doc.get('metadata', {}).get('filename', f'Документ {i}')
+            response += f"{i}. {filename} (релевантность: {score:.2%})\n"
+        return response
+    
+    async def _stream_answer(self, message: Message, question: str, documents: List[Dict]):
+        """Потоковый ответ: первое сообщение с первыми токенами, дальше — правки"""
+        reply = StreamingReply(message, edit_interval=self.stream_edit_interval)
+        try:
+            async for delta in self.rag_engine.astream_answer(
+                query=question,
+                context_documents=documents
+            ):
+                await reply.append(delta)
+        except Exception as e:
+            if not reply.started:
+                raise
+            # Часть ответа уже показана — дописываем пометку, а не новое сообщение
+            logger.error(f"{self.agent_name} - Генерация прервана: {e}")
+            reply.text += "\n\n⚠️ Генерация ответа прервалась."
+        await reply.finish("\n\n" + self._format_sources(documents))
     
-    async def start(self):
-        """Запуск бота"""
+    async def start(self, handle_signals: bool = True):
+        """
+        Запуск бота (long polling; webhook — см. backend.bot.webhook)
+
+        Args:
+            handle_signals: остановка по SIGINT/SIGTERM силами aiogram; при нескольких
+                ботах в процессе — False и общий обработчик, вызывающий stop
+        """
         logger.info(f"{self.agent_name} - Запуск...")
         try:
-            await self.dp.start_polling(self.bot)
+            await self.dp.start_polling(self.bot, handle_signals=handle_signals)
         finally:
-            await self.bot.session.close()
+            await self.close()
+
+    async def stop(self):
+        """Остановка long polling (start завершается и закрывает агента)"""
+        try:
+            await self.dp.stop_polling()
+        except RuntimeError:
+            # Polling ещё не запущен или уже остановлен
+            pass
+    
+    async def close(self):
+        """Остановка очереди вопросов и закрытие сетевых сессий"""
+        await self.scheduler.stop()
+        await self.bot.session.close()
+        await self.rag_engine.aclose()
 
 
 # Пример использования
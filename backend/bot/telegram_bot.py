@@ -10,10 +10,10 @@ from typing import Optional
 import sys
 import os
 
-# Добавляем путь к backend
-sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+# Добавляем корень проекта (импорты вида backend.*)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from rag.rag_engine import RAGEngine
+from backend.rag.rag_engine import RAGEngine
 
 
 class TelegramAIBot:
@@ -174,36 +174,18 @@ class TelegramAIBot:
 
 async def main():
     """
-    Запуск обоих ботов одновременно
+    Запуск обоих ботов одновременно — в общем runtime (backend/bot/runtime.py):
+    один RAGEngine на двоих, токены TELEGRAM_BOT_TOKEN_NTD и TELEGRAM_BOT_TOKEN_DOCS
     """
+    from backend.bot.runtime import run_bots
+
     # Настройка логирования
     logging.basicConfig(
         level=logging.INFO,
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
-    
-    # TODO: Загрузить из .env
-    TOKEN_NTD = os.getenv("TELEGRAM_BOT_TOKEN_NTD")
-    TOKEN_DOCS = os.getenv("TELEGRAM_BOT_TOKEN_DOCS")
-    
-    if not TOKEN_NTD or not TOKEN_DOCS:
-        print("❌ Ошибка: не заданы токены ботов в .env")
-        print("Установите TELEGRAM_BOT_TOKEN_NTD и TELEGRAM_BOT_TOKEN_DOCS")
-        return
-    
-    # Создаем RAG engines (пока без реальной инициализации)
-    rag_ntd = RAGEngine(ai_provider="openai", model="gpt-4")
-    rag_docs = RAGEngine(ai_provider="openai", model="gpt-4")
-    
-    # Создаем ботов
-    bot_ntd = TelegramAIBot(TOKEN_NTD, "НТД", rag_ntd)
-    bot_docs = TelegramAIBot(TOKEN_DOCS, "Договоры", rag_docs)
-    
-    # Запускаем оба бота одновременно
-    await asyncio.gather(
-        bot_ntd.start(),
-        bot_docs.start()
-    )
+
+    await run_bots(["ntd", "docs"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,148 @@
+"""
+Webhook Server - приём обновлений Telegram через webhook (вместо long polling)
+
+- FastAPI + uvicorn, как в админ-панели; один сервер обслуживает несколько ботов
+  (у каждого свой путь /webhook/<имя>)
+- проверка заголовка X-Telegram-Bot-Api-Secret-Token
+- обновления кладутся в ограниченную локальную очередь и сразу получают 200;
+  при переполнении — 503, и Telegram повторит доставку позже
+- состояния нет: несколько реплик за балансировщиком принимают обновления
+  на один и тот же URL
+"""
+from typing import Dict, List, Optional
+import asyncio
+import hmac
+import logging
+import secrets
+
+from aiogram.types import Update
+from fastapi import FastAPI, Header, Request, Response
+import uvicorn
+
+from backend.bot.telegram_agent import TelegramAgent
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """HTTP-сервер webhook для одного или нескольких TelegramAgent"""
+
+    def __init__(
+        self,
+        public_url: str,
+        secret_token: Optional[str] = None,
+        host: str = "0.0.0.0",
+        port: int = 8080,
+        queue_size: int = 1000,
+        workers: int = 4
+    ):
+        """
+        Args:
+            public_url: внешний адрес сервера (https://bot.example.com), к нему добавляется путь бота
+            secret_token: секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+                (одинаковый на всех репликах; None — случайный, только для одной реплики)
+            host: адрес, на котором слушает uvicorn
+            port: порт uvicorn
+            queue_size: максимум обновлений в локальной очереди
+            workers: сколько обновлений обрабатывается одновременно
+        """
+        if not secret_token:
+            secret_token = secrets.token_urlsafe(32)
+            logger.warning("⚠️ WEBHOOK_SECRET не задан — сгенерирован случайный (несколько реплик так работать не будут)")
+
+        self.public_url = public_url.rstrip("/")
+        self.secret_token = secret_token
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        self.workers = workers
+
+        self.agents: Dict[str, TelegramAgent] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._stats = {"received": 0, "rejected": 0, "unauthorized": 0, "failed": 0}
+
+        self.app = FastAPI(title="AI Agents Webhook")
+        self._register_routes()
+
+    def add_agent(self, name: str, agent: TelegramAgent):
+        """Бот, обновления которого приходят на /webhook/<name>"""
+        self.agents[name] = agent
+
+    def _register_routes(self):
+        @self.app.post("/webhook/{name}")
+        async def receive_update(
+            name: str,
+            request: Request,
+            secret: Optional[str] = Header(None, alias=SECRET_HEADER)
+        ):
+            if not secret or not hmac.compare_digest(secret, self.secret_token):
+                self._stats["unauthorized"] += 1
+                return Response(status_code=401)
+            if name not in self.agents:
+                return Response(status_code=404)
+
+            try:
+                data = await request.json()
+            except ValueError:
+                return Response(status_code=400)
+
+            try:
+                self._queue.put_nowait((name, data))
+            except asyncio.QueueFull:
+                self._stats["rejected"] += 1
+                logger.warning(f"⚠️ Очередь обновлений переполнена ({self.queue_size})")
+                return Response(status_code=503)
+            self._stats["received"] += 1
+            return Response(status_code=200)
+
+        @self.app.get("/health")
+        async def health():
+            return {
+                "bots": list(self.agents),
+                "queued": self._queue.qsize() if self._queue is not None else 0,
+                **self._stats
+            }
+
+    async def _worker(self):
+        while True:
+            name, data = await self._queue.get()
+            agent = self.agents[name]
+            try:
+                update = Update.model_validate(data, context={"bot": agent.bot})
+                await agent.dp.feed_update(agent.bot, update)
+            except Exception as e:
+                self._stats["failed"] += 1
+                logger.error(f"❌ {agent.agent_name} - ошибка обработки обновления: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _set_webhooks(self):
+        for name, agent in self.agents.items():
+            url = f"{self.public_url}/webhook/{name}"
+            await agent.bot.set_webhook(
+                url=url,
+                secret_token=self.secret_token,
+                allowed_updates=agent.dp.resolve_used_update_types()
+            )
+            logger.info(f"✅ {agent.agent_name} - webhook: {url}")
+
+    async def serve(self):
+        """Регистрация webhook у Telegram и запуск HTTP-сервера (до остановки)"""
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        workers: List[asyncio.Task] = [
+            asyncio.create_task(self._worker(), name=f"webhook-worker-{i}")
+            for i in range(self.workers)
+        ]
+        server = uvicorn.Server(uvicorn.Config(self.app, host=self.host, port=self.port, log_level="info"))
+        try:
+            # Webhook при остановке не снимается: его продолжают обслуживать другие реплики
+            await self._set_webhooks()
+            await server.serve()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            for agent in self.agents.values():
+                await agent.close()
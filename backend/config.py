@@ -42,7 +42,7 @@ class Config:
     def DEEPSEEK_BASE_URL(self):
         return os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
 
-    # Embeddings
+    # Embeddings: voyage (Voyage AI) или local (CPU, без сети)
     @property
     def EMBEDDING_PROVIDER(self):
         return os.getenv("EMBEDDING_PROVIDER", "voyage")
@@ -55,6 +55,36 @@ class Config:
     def EMBEDDING_DIMENSION(self):
         return int(os.getenv("EMBEDDING_DIMENSION", "1024"))
 
+    @property
+    def EMBEDDING_BATCH_SIZE(self):
+        return int(os.getenv("EMBEDDING_BATCH_SIZE", "128"))
+
+    @property
+    def EMBEDDING_BATCH_TOKENS(self):
+        return int(os.getenv("EMBEDDING_BATCH_TOKENS", "100000"))
+
+    @property
+    def EMBEDDING_MAX_CONCURRENCY(self):
+        return int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+
+    # Кэш эмбеддингов (пустой путь — кэш выключен)
+    @property
+    def EMBEDDING_CACHE_PATH(self):
+        return os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.db")
+
+    @property
+    def EMBEDDING_CACHE_MAX_ENTRIES(self):
+        return int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+    # Кэш эмбеддингов запросов (0 — выключен)
+    @property
+    def QUERY_CACHE_SIZE(self):
+        return int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+
+    @property
+    def QUERY_CACHE_TTL(self):
+        return float(os.getenv("QUERY_CACHE_TTL", "3600"))
+
     # Pinecone
     @property
     def PINECONE_API_KEY(self):
@@ -64,6 +94,178 @@ class Config:
     def PINECONE_INDEX(self):
         return os.getenv("PINECONE_INDEX", "sveta1")
 
+    # Загрузка векторов: размер запроса, параллельность, повторы
+    @property
+    def UPSERT_MAX_BYTES(self):
+        return int(os.getenv("UPSERT_MAX_BYTES", "1900000"))
+
+    @property
+    def UPSERT_CONCURRENCY(self):
+        return int(os.getenv("UPSERT_CONCURRENCY", "4"))
+
+    @property
+    def UPSERT_MAX_RETRIES(self):
+        return int(os.getenv("UPSERT_MAX_RETRIES", "3"))
+
+    # Реестр загруженных документов (список файлов без запросов к индексу).
+    # Заполняется там, где загружаются документы; поиск по номеру документа
+    # (IDENTIFIER_FAST_PATH) работает у бота, только если файл реестра общий
+    @property
+    def DOCUMENT_REGISTRY_PATH(self):
+        return os.getenv("DOCUMENT_REGISTRY_PATH", "data/documents.db")
+
+    # Локальное хранилище полных текстов чанков (в индексе — только поля фильтров).
+    # С Pinecone по умолчанию выключено: админ-панель и бот работают на разных
+    # машинах и не видят один SQLite-файл, поэтому текст остаётся в метаданных
+    @property
+    def CHUNK_STORE_PATH(self):
+        default = "data/chunks.db" if self.VECTOR_STORE == "local" else ""
+        return os.getenv("CHUNK_STORE_PATH", default)
+
+    # BM25-индекс для гибридного поиска (пусто — только семантический поиск).
+    # С Pinecone по умолчанию выключен, как и CHUNK_STORE_PATH: индекс заполняется
+    # там, где загружаются документы, и у бота на другой машине был бы пустым
+    @property
+    def LEXICAL_INDEX_PATH(self):
+        default = "data/lexical.db" if self.VECTOR_STORE == "local" else ""
+        return os.getenv("LEXICAL_INDEX_PATH", default)
+
+    @property
+    def HYBRID_RRF_K(self):
+        return int(os.getenv("HYBRID_RRF_K", "60"))
+
+    # Поиск по номеру документа (ГОСТ, СНиП, ТУ, СП, договор) только в его файлах
+    @property
+    def IDENTIFIER_FAST_PATH(self):
+        return os.getenv("IDENTIFIER_FAST_PATH", "true").lower() == "true"
+
+    # Пул потоков для блокирующих вызовов async-поиска (SDK Pinecone, SQLite)
+    @property
+    def RAG_IO_THREADS(self):
+        return int(os.getenv("RAG_IO_THREADS", "8"))
+
+    # MMR-переранжирование: кандидаты поиска → top_k разнообразных фрагментов (0 — выключено)
+    @property
+    def RERANK_CANDIDATES(self):
+        return int(os.getenv("RERANK_CANDIDATES", "30"))
+
+    @property
+    def RERANK_LAMBDA(self):
+        return float(os.getenv("RERANK_LAMBDA", "0.7"))
+
+    @property
+    def RERANK_MAX_PER_FILE(self):
+        return int(os.getenv("RERANK_MAX_PER_FILE", "2"))
+
+    @property
+    def RERANK_MIN_SCORE(self):
+        return float(os.getenv("RERANK_MIN_SCORE", "0.0"))
+
+    # Бюджет токенов на контекст документов в промпте (0 — без ограничения)
+    @property
+    def CONTEXT_MAX_TOKENS(self):
+        return int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+
+    # Сжатие контекста до относящихся к вопросу предложений: terms, embedding или пусто
+    @property
+    def CONTEXT_COMPRESSION(self):
+        return os.getenv("CONTEXT_COMPRESSION", "")
+
+    @property
+    def COMPRESSION_KEEP_RATIO(self):
+        return float(os.getenv("COMPRESSION_KEEP_RATIO", "0.3"))
+
+    @property
+    def COMPRESSION_NEIGHBOURS(self):
+        return int(os.getenv("COMPRESSION_NEIGHBOURS", "1"))
+
+    # Потоковые ответы: сообщение дописывается правками не чаще раза в STREAM_EDIT_INTERVAL сек
+    @property
+    def STREAM_ANSWERS(self):
+        return os.getenv("STREAM_ANSWERS", "true").lower() == "true"
+
+    @property
+    def STREAM_EDIT_INTERVAL(self):
+        return float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+
+    # Планировщик вопросов: одновременно обрабатываемые и ожидающие (сверх — ответ «занят»)
+    @property
+    def MAX_CONCURRENT_QUESTIONS(self):
+        return int(os.getenv("MAX_CONCURRENT_QUESTIONS", "4"))
+
+    @property
+    def MAX_QUEUED_QUESTIONS(self):
+        return int(os.getenv("MAX_QUEUED_QUESTIONS", "100"))
+
+    # Агенты одного процесса (ntd,docs); токены — TELEGRAM_BOT_TOKEN_<АГЕНТ>
+    @property
+    def AGENTS(self):
+        return [a.strip() for a in os.getenv("AGENTS", "").split(",") if a.strip()]
+
+    # Режим получения обновлений: polling или webhook
+    @property
+    def BOT_MODE(self):
+        return os.getenv("BOT_MODE", "polling")
+
+    # Внешний адрес webhook-сервера (https://...), к нему добавляется /webhook/<агент>
+    @property
+    def WEBHOOK_URL(self):
+        return os.getenv("WEBHOOK_URL", "")
+
+    # Секрет заголовка X-Telegram-Bot-Api-Secret-Token (одинаковый на всех репликах)
+    @property
+    def WEBHOOK_SECRET(self):
+        return os.getenv("WEBHOOK_SECRET", "")
+
+    @property
+    def WEBHOOK_HOST(self):
+        return os.getenv("WEBHOOK_HOST", "0.0.0.0")
+
+    @property
+    def WEBHOOK_PORT(self):
+        return int(os.getenv("WEBHOOK_PORT", "8080"))
+
+    @property
+    def WEBHOOK_QUEUE_SIZE(self):
+        return int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+
+    @property
+    def WEBHOOK_WORKERS(self):
+        return int(os.getenv("WEBHOOK_WORKERS", "4"))
+
+    # Хранилище векторов: pinecone или local (NumPy в процессе, без сети)
+    @property
+    def VECTOR_STORE(self):
+        return os.getenv("VECTOR_STORE", "pinecone")
+
+    @property
+    def VECTOR_STORE_PATH(self):
+        return os.getenv("VECTOR_STORE_PATH", "data/vector_store")
+
+    # Раздельные namespace (Pinecone) / коллекции (local) для агентов вместо фильтра.
+    # Включать после переноса векторов: python -m backend.utils.migrate_namespaces
+    @property
+    def VECTOR_NAMESPACES(self):
+        return os.getenv("VECTOR_NAMESPACES", "false").lower() == "true"
+
+    # Тип векторов в снимке на диске: float32 или float16 (вдвое меньше памяти)
+    @property
+    def VECTOR_STORE_DTYPE(self):
+        return os.getenv("VECTOR_STORE_DTYPE", "float32")
+
+    # Приближённый поиск для local-хранилища: ivf или пусто (точный поиск)
+    @property
+    def ANN_INDEX(self):
+        return os.getenv("ANN_INDEX", "")
+
+    @property
+    def ANN_NLIST(self):
+        return int(os.getenv("ANN_NLIST", "0"))
+
+    @property
+    def ANN_NPROBE(self):
+        return int(os.getenv("ANN_NPROBE", "16"))
+
     # RAG параметры
     @property
     def CHUNK_SIZE(self):
@@ -94,9 +296,9 @@ class Config:
             required.append("AGENT_TYPE")
         if not self.DEEPSEEK_API_KEY:
             required.append("DEEPSEEK_API_KEY")
-        if not self.VOYAGE_API_KEY:
+        if self.EMBEDDING_PROVIDER == "voyage" and not self.VOYAGE_API_KEY:
             required.append("VOYAGE_API_KEY")
-        if not self.PINECONE_API_KEY:
+        if self.VECTOR_STORE == "pinecone" and not self.PINECONE_API_KEY:
             required.append("PINECONE_API_KEY")
 
         if required:
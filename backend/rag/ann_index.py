@@ -0,0 +1,342 @@
+"""
+ANN Index - приближённый поиск ближайших соседей (IVF-flat) для LocalVectorStore
+
+Векторы разбиваются на nlist кластеров (сферический k-means по выборке),
+запрос сравнивается с центроидами и сканирует только nprobe ближайших списков.
+- вставки инкрементальные: строка добавляется в список ближайшего центроида
+- удаления — tombstone: строка помечается и пропускается при поиске,
+  физически списки чистятся при снимке или компактизации хранилища
+- nprobe управляет балансом recall/latency, recall_report помогает его выбрать
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class IVFFlatIndex:
+    """Инвертированные списки над строками float32-матрицы хранилища"""
+
+    TOMBSTONE = -1
+
+    def __init__(
+        self,
+        dimension: int,
+        nlist: int = 0,
+        nprobe: int = 16,
+        min_vectors: int = 20000,
+        kmeans_iterations: int = 10,
+        seed: int = 0
+    ):
+        """
+        Args:
+            dimension: размерность векторов
+            nlist: число кластеров (0 — sqrt(N) при обучении)
+            nprobe: сколько ближайших списков сканировать при поиске
+            min_vectors: с какого размера хранилища обучать индекс
+                (на меньших объёмах точный поиск быстрее)
+            kmeans_iterations: итераций k-means при обучении
+            seed: seed для воспроизводимости обучения
+        """
+        self.dimension = dimension
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_vectors = min_vectors
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0
+        self._lists: List[np.ndarray] = []
+        self._list_sizes: Optional[np.ndarray] = None
+        # Номер списка для каждой строки хранилища (TOMBSTONE — удалена/не в индексе)
+        self._assign = np.full(0, self.TOMBSTONE, dtype=np.int32)
+        self.tombstones = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def needs_training(self, size: int) -> bool:
+        """Пора (пере)обучить: хранилище доросло до порога или выросло в 4 раза"""
+        if not self.is_trained:
+            return size >= self.min_vectors
+        return size >= 4 * self.trained_size
+
+    # -- обучение -------------------------------------------------------
+
+    def _nearest(self, vectors: np.ndarray, chunk: int = 16384) -> np.ndarray:
+        """Ближайший центроид для каждой строки (блоками, чтобы не раздувать память)"""
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk):
+            block = vectors[start:start + chunk] @ self.centroids.T
+            labels[start:start + chunk] = np.argmax(block, axis=1)
+        return labels
+
+    def train(self, vectors: np.ndarray, rows: np.ndarray):
+        """
+        Обучение центроидов и раскладка строк по спискам
+
+        Args:
+            vectors: нормированные векторы живых строк
+            rows: номера этих строк в хранилище
+        """
+        started = time.perf_counter()
+        n = len(vectors)
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(self.seed)
+
+        sample_size = min(n, nlist * 64)
+        sample = vectors[rng.choice(n, sample_size, replace=False)]
+        self.centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.kmeans_iterations):
+            labels = self._nearest(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            # Пустые кластеры пересеиваем случайными точками выборки
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.centroids = (sums / norms).astype(np.float32)
+
+        self.trained_size = n
+        self.rebuild(vectors, rows)
+        logger.info(
+            f"✅ IVF-индекс обучен: {n} векторов, nlist={nlist}, "
+            f"{(time.perf_counter() - started):.1f} сек"
+        )
+
+    def rebuild(self, vectors: np.ndarray, rows: np.ndarray):
+        """Переразложить строки по спискам с текущими центроидами"""
+        labels = self._nearest(vectors) if len(vectors) else np.empty(0, dtype=np.int32)
+        self.assign(rows, labels)
+
+    def assign(self, rows: np.ndarray, labels: np.ndarray):
+        """Построить списки по готовой раскладке строк (без пересчёта расстояний)"""
+        nlist = len(self.centroids)
+        rows = np.asarray(rows, dtype=np.int64)
+        labels = np.asarray(labels, dtype=np.int32)
+
+        capacity = int(rows.max()) + 1 if len(rows) else 0
+        self._assign = np.full(max(capacity, 1024), self.TOMBSTONE, dtype=np.int32)
+        self._assign[rows] = labels
+
+        order = np.argsort(labels, kind="stable")
+        sizes = np.bincount(labels, minlength=nlist)
+        bounds = np.concatenate([[0], np.cumsum(sizes)])
+        self._lists = [
+            rows[order[bounds[i]:bounds[i + 1]]]
+            for i in range(nlist)
+        ]
+        self._list_sizes = sizes.astype(np.int64)
+        self.tombstones = 0
+
+    def labels(self, rows: np.ndarray) -> np.ndarray:
+        """Текущие номера списков для строк (TOMBSTONE — не в индексе)"""
+        rows = np.asarray(rows, dtype=np.int64)
+        labels = np.full(len(rows), self.TOMBSTONE, dtype=np.int32)
+        known = rows < len(self._assign)
+        labels[known] = self._assign[rows[known]]
+        return labels
+
+    def reset(self):
+        """Сброс к необученному состоянию"""
+        self.centroids = None
+        self.trained_size = 0
+        self._lists = []
+        self._list_sizes = None
+        self._assign = np.full(0, self.TOMBSTONE, dtype=np.int32)
+        self.tombstones = 0
+
+    def save(self, path, labels: np.ndarray):
+        """
+        Сохранение обученного индекса рядом со снимком хранилища
+
+        Args:
+            path: файл .npz
+            labels: номера списков для строк снимка (по порядку)
+        """
+        np.savez(
+            path,
+            centroids=self.centroids,
+            labels=labels.astype(np.int32),
+            trained_size=np.int64(self.trained_size)
+        )
+
+    def load(self, path):
+        """Восстановление индекса из .npz (строки снимка — 0..N-1)"""
+        with np.load(path) as data:
+            self.centroids = data["centroids"].astype(np.float32)
+            self.trained_size = int(data["trained_size"])
+            labels = data["labels"]
+        indexed = np.flatnonzero(labels != self.TOMBSTONE)
+        self.assign(indexed, labels[indexed])
+
+    # -- изменения ------------------------------------------------------
+
+    def _ensure_assign(self, capacity: int):
+        if capacity > len(self._assign):
+            assign = np.full(max(capacity, 2 * len(self._assign)), self.TOMBSTONE, dtype=np.int32)
+            assign[:len(self._assign)] = self._assign
+            self._assign = assign
+
+    def add(self, vectors: np.ndarray, rows: np.ndarray):
+        """
+        Инкрементальная вставка (или замена) строк.
+        Старая запись заменённой строки остаётся в своём списке, но
+        перестаёт совпадать с _assign и отбрасывается при поиске.
+        """
+        if not self.is_trained or len(rows) == 0:
+            return
+
+        labels = self._nearest(vectors)
+        self._ensure_assign(int(rows.max()) + 1)
+        self._assign[rows] = labels
+
+        for label in np.unique(labels):
+            new_rows = rows[labels == label].astype(np.int64)
+            size = self._list_sizes[label]
+            current = self._lists[label]
+            if size + len(new_rows) > len(current):
+                grown = np.empty(max(2 * len(current), size + len(new_rows)), dtype=np.int64)
+                grown[:size] = current[:size]
+                current = grown
+                self._lists[label] = current
+            current[size:size + len(new_rows)] = new_rows
+            self._list_sizes[label] = size + len(new_rows)
+
+    def remove(self, rows: np.ndarray):
+        """Tombstone-удаление строк"""
+        if not self.is_trained or len(rows) == 0:
+            return
+        rows = rows[rows < len(self._assign)]
+        self.tombstones += int(np.count_nonzero(self._assign[rows] != self.TOMBSTONE))
+        self._assign[rows] = self.TOMBSTONE
+
+    # -- поиск ----------------------------------------------------------
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """Строки из nprobe ближайших списков (без tombstone и устаревших записей)"""
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        closeness = self.centroids @ query
+        probe = np.argpartition(-closeness, nprobe - 1)[:nprobe]
+
+        sizes = self._list_sizes[probe]
+        rows = np.concatenate([self._lists[l][:s] for l, s in zip(probe, sizes)])
+        if len(rows) == 0:
+            return rows
+        labels = np.repeat(probe.astype(np.int32), sizes)
+        return rows[self._assign[rows] == labels]
+
+    def search(
+        self,
+        gather: Callable[[np.ndarray], np.ndarray],
+        query: np.ndarray,
+        top_k: int,
+        mask: np.ndarray,
+        nprobe: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Приближённый top-k
+
+        Args:
+            gather: функция «номера строк → float32-матрица их векторов»
+            query: нормированный вектор запроса
+            top_k: сколько результатов вернуть
+            mask: булева маска допустимых строк (живые + фильтр метаданных)
+            nprobe: переопределение nprobe для этого запроса
+
+        Returns:
+            (строки, scores) по убыванию score; строк может быть меньше top_k
+        """
+        rows = self.candidates(query, nprobe)
+        rows = rows[mask[rows]]
+        if len(rows) == 0:
+            return rows, np.empty(0, dtype=np.float32)
+
+        scores = gather(rows) @ query
+        k = min(top_k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return rows[top], scores[top]
+
+    def stats(self) -> Dict:
+        return {
+            "type": "ivf_flat",
+            "trained": self.is_trained,
+            "nlist": len(self.centroids) if self.is_trained else self.nlist,
+            "nprobe": self.nprobe,
+            "indexed": int(np.count_nonzero(self._assign != self.TOMBSTONE)),
+            "tombstones": self.tombstones
+        }
+
+
+def recall_report(
+    store,
+    queries: np.ndarray,
+    top_k: int = 10,
+    nprobe_values: tuple = (1, 2, 4, 8, 16, 32, 64),
+    filter: Optional[Dict] = None
+) -> List[Dict]:
+    """
+    recall@k приближённого поиска относительно точного для разных nprobe
+
+    Args:
+        store: LocalVectorStore с обученным IVF-индексом
+        queries: матрица запросов
+        top_k: k для recall@k
+        nprobe_values: какие nprobe проверить
+
+    Returns:
+        [{"nprobe", "recall", "latency_ms"}, ...]
+    """
+    exact = []
+    started = time.perf_counter()
+    for query in queries:
+        exact.append({m["id"] for m in store.query(query, top_k, filter, False, exact=True)})
+    exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    report = [{"nprobe": "exact", "recall": 1.0, "latency_ms": round(exact_ms, 3)}]
+    for nprobe in nprobe_values:
+        hits = 0
+        started = time.perf_counter()
+        for query, truth in zip(queries, exact):
+            found = store.query(query, top_k, filter, False, nprobe=nprobe)
+            hits += len(truth & {m["id"] for m in found})
+        latency_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        total = sum(len(truth) for truth in exact)
+        report.append({
+            "nprobe": nprobe,
+            "recall": round(hits / total, 4) if total else 1.0,
+            "latency_ms": round(latency_ms, 3)
+        })
+    return report
+
+
+if __name__ == "__main__":
+    # Отчёт recall@k на синтетических кластеризованных данных:
+    #   python -m backend.rag.ann_index [N] [DIM]
+    import sys
+    from backend.rag.vector_store import LocalVectorStore
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    rng = np.random.default_rng(42)
+    centers = rng.normal(size=(max(1, n // 500), dim)).astype(np.float32)
+    data = centers[rng.integers(0, len(centers), n)] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+
+    store = LocalVectorStore(dim, ann_index=IVFFlatIndex(dim, min_vectors=1))
+    store.upsert([{"id": str(i), "values": v, "metadata": {}} for i, v in enumerate(data)])
+    queries = data[rng.choice(n, 100, replace=False)] + 0.1 * rng.normal(size=(100, dim)).astype(np.float32)
+
+    print(f"N={n}, dim={dim}, {store.ann_index.stats()}")
+    for row in recall_report(store, queries):
+        print(f"nprobe={row['nprobe']:>5}  recall@10={row['recall']:.3f}  {row['latency_ms']:.2f} ms")
@@ -0,0 +1,99 @@
+"""
+Chunk Store - локальное хранилище текстов чанков на SQLite
+Ключ — id вектора. Текст хранится целиком (без обрезки), а в индексе
+векторов остаются только небольшие поля для фильтрации: ответы на поиск
+и upsert-запросы становятся легче, тексты найденных чанков читаются
+одним запросом.
+"""
+from typing import List, Dict
+from pathlib import Path
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkStore:
+    """Тексты чанков по id вектора"""
+
+    # SQLite ограничивает число параметров в одном запросе
+    _QUERY_CHUNK = 500
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: путь к файлу SQLite
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                vector_id TEXT PRIMARY KEY,
+                text TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+        logger.info(f"✅ Хранилище текстов чанков: {self.path}")
+
+    def put_many(self, texts: Dict[str, str]):
+        """Сохранение (или замена) текстов чанков"""
+        if not texts:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (vector_id, text) VALUES (?, ?)",
+                    list(texts.items())
+                )
+
+    def get_many(self, ids: List[str]) -> Dict[str, str]:
+        """
+        Тексты чанков по id
+
+        Returns:
+            словарь {id: текст} только для найденных id
+        """
+        found = {}
+        unique_ids = list(dict.fromkeys(ids))
+        with self._lock:
+            for i in range(0, len(unique_ids), self._QUERY_CHUNK):
+                part = unique_ids[i:i + self._QUERY_CHUNK]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT vector_id, text FROM chunks WHERE vector_id IN ({placeholders})",
+                    part
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def delete_many(self, ids: List[str]):
+        """Удаление текстов чанков"""
+        if not ids:
+            return
+        with self._lock:
+            with self._conn:
+                for i in range(0, len(ids), self._QUERY_CHUNK):
+                    part = ids[i:i + self._QUERY_CHUNK]
+                    placeholders = ",".join("?" * len(part))
+                    self._conn.execute(
+                        f"DELETE FROM chunks WHERE vector_id IN ({placeholders})",
+                        part
+                    )
+
+    def count(self) -> int:
+        """Число сохранённых чанков"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def close(self):
+        """Закрытие соединения с SQLite"""
+        with self._lock:
+            self._conn.close()
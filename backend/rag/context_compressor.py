@@ -0,0 +1,124 @@
+"""
+Context Compressor - экстрактивное сжатие отрывков перед генерацией ответа
+Из 500-символьного чанка к вопросу обычно относятся одно-два предложения.
+Предложения оцениваются по вопросу (совпадение терминов с весом IDF или
+близость эмбеддингов), в промпт идут лучшие из них вместе с соседними —
+чтобы не терять контекст пунктов и ссылок.
+"""
+from typing import Callable, List, Dict, Optional
+import math
+import re
+
+import numpy as np
+
+from backend.rag.lexical_index import normalize_tokens
+
+# Конец предложения: знак препинания и пробел перед заглавной буквой, цифрой
+# или маркером списка (номера 12.1.004-91 и «т. е.» не разрываются)
+_SENTENCE_END = re.compile(r"(?<=[.!?…;])\s+(?=[«\"(\-–—•]?[A-ZА-ЯЁ0-9])|\n+")
+
+_GAP = " … "
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Предложения текста
+
+    >>> split_sentences("Пункт 4.2. Ширина прохода — не менее 1 м. Основание: ГОСТ 12.1.004-91.")
+    ['Пункт 4.2.', 'Ширина прохода — не менее 1 м.', 'Основание: ГОСТ 12.1.004-91.']
+    """
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+def term_scores(query: str, sentences: List[str]) -> np.ndarray:
+    """Сумма IDF терминов запроса, встречающихся в предложении"""
+    query_tokens = set(normalize_tokens(query))
+    if not query_tokens or not sentences:
+        return np.zeros(len(sentences), dtype=np.float32)
+
+    sentence_tokens = [set(normalize_tokens(sentence)) & query_tokens for sentence in sentences]
+    frequency: Dict[str, int] = {}
+    for tokens in sentence_tokens:
+        for token in tokens:
+            frequency[token] = frequency.get(token, 0) + 1
+
+    n = len(sentences)
+    idf = {token: math.log(1.0 + n / count) for token, count in frequency.items()}
+    return np.array(
+        [sum(idf[token] for token in tokens) for tokens in sentence_tokens],
+        dtype=np.float32
+    )
+
+
+def embedding_scores(query_embedding: List[float], sentence_embeddings: List[List[float]]) -> np.ndarray:
+    """Косинусная близость предложений к запросу"""
+    matrix = np.asarray(sentence_embeddings, dtype=np.float32)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+    norms[norms == 0] = 1.0
+    return (matrix @ query) / norms
+
+
+def compress_passages(
+    passages: List[Dict],
+    score: Callable[[List[str]], np.ndarray],
+    keep_ratio: float = 0.3,
+    neighbours: int = 1
+) -> List[Dict]:
+    """
+    Отрывки, в которых оставлены только лучшие предложения и их соседи
+
+    Args:
+        passages: отрывки ({"text", ...}), например из merge_adjacent
+        score: оценка предложений по вопросу (все предложения всех отрывков разом)
+        keep_ratio: доля лучших предложений (от общего числа), которые сохраняются
+        neighbours: сколько соседних предложений сохранять с каждой стороны
+
+    Returns:
+        копии отрывков со сжатым текстом; пропуски отмечены « … »,
+        в каждом отрывке остаётся хотя бы лучшее предложение
+    """
+    sentences = [split_sentences(passage['text']) for passage in passages]
+    flat = [sentence for group in sentences for sentence in group]
+    if not flat:
+        return passages
+
+    scores = np.asarray(score(flat), dtype=np.float32)
+    keep_count = max(1, math.ceil(len(flat) * keep_ratio))
+    threshold = np.sort(scores)[-keep_count]
+
+    compressed = []
+    offset = 0
+    for passage, group in zip(passages, sentences):
+        group_scores = scores[offset:offset + len(group)]
+        offset += len(group)
+        if not group:
+            continue
+
+        top = set(np.flatnonzero((group_scores >= threshold) & (group_scores > 0)).tolist())
+        if not top:
+            top = {int(np.argmax(group_scores))}
+        keep = sorted({
+            j
+            for i in top
+            for j in range(max(0, i - neighbours), min(len(group), i + neighbours + 1))
+        })
+
+        parts = []
+        previous: Optional[int] = None
+        for i in keep:
+            if previous is not None and i != previous + 1:
+                parts.append(_GAP)
+            elif previous is not None:
+                parts.append(" ")
+            parts.append(group[i])
+            previous = i
+        text = "".join(parts)
+        if keep[0] > 0:
+            text = "… " + text
+        if keep[-1] < len(group) - 1:
+            text += " …"
+
+        compressed.append({**passage, 'text': text})
+
+    return compressed
@@ -0,0 +1,134 @@
+"""
+Context Packer - сборка контекста для промпта в пределах бюджета токенов
+- соседние чанки одного файла (chunk_id подряд) склеиваются в один отрывок
+- перекрытие чанков (chunk_overlap символов) при склейке убирается
+- отрывки идут по убыванию релевантности, пока хватает бюджета;
+  не поместившийся отрывок обрезается по границе предложения
+"""
+from typing import List, Dict
+import re
+
+from backend.rag.embeddings import VoyageEmbeddings
+
+# Та же грубая оценка, что и при батчинге эмбеддингов (~3 символа на токен)
+estimate_tokens = VoyageEmbeddings.estimate_tokens
+
+# Короче — совпадение конца и начала чанков может быть случайным
+_MIN_OVERLAP = 10
+
+# Обрезанный отрывок короче этого не добавляется
+_MIN_PASSAGE_TOKENS = 50
+
+
+def strip_overlap(previous: str, text: str, max_overlap: int) -> str:
+    """
+    Текст следующего чанка без начала, повторяющего конец предыдущего
+
+    >>> strip_overlap("Первое. Второе предложение.", "Второе предложение. Третье.", 100)
+    ' Третье.'
+    """
+    for size in range(min(max_overlap, len(previous), len(text)), _MIN_OVERLAP - 1, -1):
+        if previous.endswith(text[:size]):
+            return text[size:]
+    return "\n" + text
+
+
+def merge_adjacent(documents: List[Dict], max_overlap: int = 100) -> List[Dict]:
+    """
+    Склейка соседних чанков одного файла в отрывки
+
+    Returns:
+        [{"text", "score", "filename", "chunk_ids"}, ...]; score отрывка —
+        лучший score его чанков
+    """
+    by_file: Dict[str, List[Dict]] = {}
+    passages = []
+    for doc in documents:
+        metadata = doc.get('metadata', {})
+        chunk_id = metadata.get('chunk_id')
+        if chunk_id is None:
+            passages.append({
+                'text': doc['text'],
+                'score': doc.get('score', 0.0),
+                'filename': metadata.get('filename'),
+                'chunk_ids': []
+            })
+            continue
+        by_file.setdefault(metadata.get('filename'), []).append(doc)
+
+    for filename, chunks in by_file.items():
+        chunks = sorted(chunks, key=lambda doc: int(doc['metadata']['chunk_id']))
+        current = None
+        for doc in chunks:
+            chunk_id = int(doc['metadata']['chunk_id'])
+            score = doc.get('score', 0.0)
+            if current is not None and chunk_id == current['chunk_ids'][-1]:
+                continue  # дубль чанка
+            if current is not None and chunk_id == current['chunk_ids'][-1] + 1:
+                current['text'] += strip_overlap(current['text'], doc['text'], max_overlap)
+                current['score'] = max(current['score'], score)
+                current['chunk_ids'].append(chunk_id)
+                continue
+            current = {
+                'text': doc['text'],
+                'score': score,
+                'filename': filename,
+                'chunk_ids': [chunk_id]
+            }
+            passages.append(current)
+
+    return passages
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Начало текста в пределах max_tokens, по границе предложения, если она есть"""
+    limit = max(0, (max_tokens - 1) * 3)
+    if len(text) <= limit:
+        return text
+    head = text[:limit]
+    ends = [match.end() for match in re.finditer(r"[.!?…](?=\s|$)", head)]
+    if ends and ends[-1] > limit // 2:
+        head = head[:ends[-1]]
+    return head.rstrip() + " …"
+
+
+def fill_budget(passages: List[Dict], max_tokens: int) -> List[Dict]:
+    """
+    Отрывки по убыванию score, пока хватает бюджета токенов (0 — без ограничения)
+
+    Returns:
+        [{"text", "score", "filename", "chunk_ids", "tokens"}, ...]
+    """
+    packed = []
+    remaining = max_tokens
+    for passage in sorted(passages, key=lambda passage: passage['score'], reverse=True):
+        text = passage['text']
+        tokens = estimate_tokens(text)
+        if max_tokens > 0 and tokens > remaining:
+            if remaining < _MIN_PASSAGE_TOKENS:
+                continue  # возможно, поместится отрывок покороче
+            text = _truncate(text, remaining)
+            tokens = estimate_tokens(text)
+        packed.append({**passage, 'text': text, 'tokens': tokens})
+        remaining -= tokens
+
+    return packed
+
+
+def pack_context(
+    documents: List[Dict],
+    max_tokens: int,
+    max_overlap: int = 100
+) -> List[Dict]:
+    """
+    Отрывки для промпта в пределах бюджета токенов
+
+    Args:
+        documents: результаты поиска ({"text", "score", "metadata"})
+        max_tokens: бюджет токенов на весь контекст (0 — без ограничения)
+        max_overlap: перекрытие чанков в символах (chunk_overlap)
+
+    Returns:
+        отрывки по убыванию score: [{"text", "score", "filename", "chunk_ids", "tokens"}, ...]
+    """
+    return fill_budget(merge_adjacent(documents, max_overlap), max_tokens)
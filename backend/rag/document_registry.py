@@ -0,0 +1,246 @@
+"""
+Document Registry - реестр загруженных документов на SQLite
+Для каждого файла агента хранит хэш содержимого, размер, время загрузки
+и список чанков (номер чанка, id вектора, хэш текста).
+Список файлов, проверка наличия и удаление по имени — локальные
+запросы по первичному ключу, без обращения к хранилищу векторов.
+"""
+from typing import List, Dict, Optional, Tuple
+from pathlib import Path
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+from backend.rag.query_analyzer import normalize_name
+
+logger = logging.getLogger(__name__)
+
+# size NULL — размер файла не известен (документ восстановлен по метаданным векторов)
+_DOCUMENTS_TABLE = """
+CREATE TABLE IF NOT EXISTS {name} (
+    agent_type TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    size INTEGER,
+    chunk_count INTEGER NOT NULL,
+    ingested_at REAL NOT NULL,
+    PRIMARY KEY (agent_type, filename)
+);
+"""
+
+
+class DocumentRegistry:
+    """Реестр документов: (agent_type, filename) → метаданные и чанки"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: путь к файлу SQLite
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # Файл общий для нескольких RAGEngine (и процессов) — ждём блокировку, а не падаем
+        self._conn = sqlite3.connect(str(self.path), timeout=30.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        # Сравнение имён файлов с номерами документов (см. find_filenames)
+        self._conn.create_function("normalize_name", 1, normalize_name, deterministic=True)
+        self._conn.executescript(
+            _DOCUMENTS_TABLE.format(name="documents") + """
+            CREATE TABLE IF NOT EXISTS chunks (
+                agent_type TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                vector_id TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                PRIMARY KEY (agent_type, filename, chunk_id),
+                FOREIGN KEY (agent_type, filename)
+                    REFERENCES documents (agent_type, filename) ON DELETE CASCADE
+            );
+            """
+        )
+        self._conn.commit()
+        self._migrate_size_column()
+        logger.info(f"✅ Реестр документов: {self.path}")
+
+    def _migrate_size_column(self):
+        """Реестры первых версий хранили size NOT NULL (0 — «не известен»)"""
+        columns = {row[1]: row[3] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        if not columns.get("size"):
+            return
+        # Пересоздание таблицы без каскадного удаления чанков
+        self._conn.execute("PRAGMA foreign_keys=OFF")
+        try:
+            with self._conn:
+                self._conn.execute(_DOCUMENTS_TABLE.format(name="documents_new"))
+                self._conn.execute(
+                    """
+                    INSERT INTO documents_new
+                    SELECT agent_type, filename, content_hash, NULLIF(size, 0), chunk_count, ingested_at
+                    FROM documents
+                    """
+                )
+                self._conn.execute("DROP TABLE documents")
+                self._conn.execute("ALTER TABLE documents_new RENAME TO documents")
+        finally:
+            self._conn.execute("PRAGMA foreign_keys=ON")
+        logger.info("🔧 Реестр документов: размер файла теперь может быть не известен (NULL)")
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        """Хэш текста чанка"""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def content_hash(text_hashes: List[str]) -> str:
+        """Хэш документа — от хэшей его чанков по порядку"""
+        digest = hashlib.sha256()
+        for value in text_hashes:
+            digest.update(value.encode("ascii"))
+        return digest.hexdigest()
+
+    def record(
+        self,
+        agent_type: str,
+        filename: str,
+        chunks: List[Tuple[int, str, str]],
+        size: Optional[int] = None
+    ):
+        """
+        Запись документа (заменяет прежнюю версию файла)
+
+        Args:
+            agent_type: тип агента
+            filename: имя файла
+            chunks: [(chunk_id, vector_id, text_hash), ...]
+            size: размер файла в байтах (None — не известен)
+        """
+        chunks = sorted(chunks)
+        content_hash = self.content_hash([text_hash for _, _, text_hash in chunks])
+
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "DELETE FROM documents WHERE agent_type = ? AND filename = ?",
+                    (agent_type, filename)
+                )
+                self._conn.execute(
+                    """
+                    INSERT INTO documents
+                        (agent_type, filename, content_hash, size, chunk_count, ingested_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (agent_type, filename, content_hash, size, len(chunks), time.time())
+                )
+                self._conn.executemany(
+                    """
+                    INSERT INTO chunks (agent_type, filename, chunk_id, vector_id, text_hash)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    [(agent_type, filename, *chunk) for chunk in chunks]
+                )
+
+    def get(self, agent_type: str, filename: str) -> Optional[Dict]:
+        """Метаданные документа или None"""
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT filename, content_hash, size, chunk_count, ingested_at
+                FROM documents WHERE agent_type = ? AND filename = ?
+                """,
+                (agent_type, filename)
+            ).fetchone()
+        return self._document(row) if row else None
+
+    def exists(self, agent_type: str, filename: str) -> bool:
+        """Есть ли документ в реестре"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM documents WHERE agent_type = ? AND filename = ?",
+                (agent_type, filename)
+            ).fetchone()
+        return row is not None
+
+    def chunks(self, agent_type: str, filename: str) -> List[Dict]:
+        """Чанки документа [{chunk_id, vector_id, text_hash}, ...] по порядку"""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT chunk_id, vector_id, text_hash FROM chunks
+                WHERE agent_type = ? AND filename = ? ORDER BY chunk_id
+                """,
+                (agent_type, filename)
+            ).fetchall()
+        return [
+            {"chunk_id": chunk_id, "vector_id": vector_id, "text_hash": text_hash}
+            for chunk_id, vector_id, text_hash in rows
+        ]
+
+    def list_documents(self, agent_type: str) -> List[Dict]:
+        """Документы агента, отсортированные по имени"""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT filename, content_hash, size, chunk_count, ingested_at
+                FROM documents WHERE agent_type = ? ORDER BY filename
+                """,
+                (agent_type,)
+            ).fetchall()
+        return [self._document(row) for row in rows]
+
+    def find_filenames(self, agent_type: str, fragment: str) -> List[str]:
+        """
+        Имена файлов агента, содержащие fragment. Обе стороны приводятся
+        к одному виду (normalize_name): длинные тире — дефисы, без учёта регистра
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT filename FROM documents
+                WHERE agent_type = ? AND instr(normalize_name(filename), ?) > 0
+                ORDER BY filename
+                """,
+                (agent_type, normalize_name(fragment))
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def remove(self, agent_type: str, filename: str) -> bool:
+        """Удаление документа и его чанков. Returns: был ли документ в реестре"""
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.execute(
+                    "DELETE FROM documents WHERE agent_type = ? AND filename = ?",
+                    (agent_type, filename)
+                )
+        return cursor.rowcount > 0
+
+    def stats(self, agent_type: Optional[str] = None) -> Dict:
+        """Число документов и чанков (всего или по агенту)"""
+        where, params = ("WHERE agent_type = ?", (agent_type,)) if agent_type else ("", ())
+        with self._lock:
+            documents, chunks = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(chunk_count), 0) FROM documents {where}",
+                params
+            ).fetchone()
+        return {"documents": documents, "chunks": chunks}
+
+    @staticmethod
+    def _document(row) -> Dict:
+        filename, content_hash, size, chunk_count, ingested_at = row
+        return {
+            "filename": filename,
+            "content_hash": content_hash,
+            "size": size,
+            "chunks": chunk_count,
+            "ingested_at": ingested_at
+        }
+
+    def close(self):
+        """Закрытие соединения с SQLite"""
+        with self._lock:
+            self._conn.close()
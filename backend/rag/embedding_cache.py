@@ -0,0 +1,226 @@
+"""
+Embedding Cache - кэши эмбеддингов
+- EmbeddingCache: постоянный кэш документов на SQLite.
+  Ключ: sha256(model, input_type, текст чанка) — повторная загрузка
+  исправленного файла переиспользует эмбеддинги неизменённых чанков
+- QueryEmbeddingCache: in-memory LRU+TTL кэш эмбеддингов запросов
+"""
+from typing import List, Dict, Optional, Tuple
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """Content-addressed кэш эмбеддингов с ограничением размера и LRU-вытеснением"""
+
+    # SQLite ограничивает число параметров в одном запросе
+    _QUERY_CHUNK = 500
+
+    def __init__(self, path: str, max_entries: int = 200000):
+        """
+        Args:
+            path: путь к файлу SQLite
+            max_entries: максимум записей, лишние вытесняются по LRU
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+
+        # Счётчики за всё время жизни процесса
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)"
+        )
+        self._conn.commit()
+        logger.info(f"✅ Кэш эмбеддингов: {self.path} ({len(self)} записей)")
+
+    @staticmethod
+    def make_key(model: str, input_type: str, text: str) -> str:
+        """Ключ кэша — хэш (модель, тип входа, текст)"""
+        digest = hashlib.sha256()
+        for part in (model, input_type, text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    @staticmethod
+    def _encode(vector: List[float]) -> bytes:
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _decode(blob: bytes) -> List[float]:
+        values = array("f")
+        values.frombytes(blob)
+        return values.tolist()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """
+        Получение эмбеддингов по ключам (с обновлением LRU-отметки)
+
+        Returns:
+            словарь {ключ: вектор} только для найденных ключей
+        """
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+
+        with self._lock:
+            for i in range(0, len(unique_keys), self._QUERY_CHUNK):
+                part = unique_keys[i:i + self._QUERY_CHUNK]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = self._decode(blob)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+        hits = sum(1 for key in keys if key in found)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        """Сохранение эмбеддингов в кэш с последующим вытеснением по LRU"""
+        if not items:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, self._encode(vector), now) for key, vector in items.items()]
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Удаление самых давно использованных записей сверх max_entries"""
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                """
+                DELETE FROM embeddings WHERE key IN (
+                    SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?
+                )
+                """,
+                (excess,)
+            )
+            logger.info(f"🧹 Кэш эмбеддингов: вытеснено {excess} записей")
+
+    def stats(self) -> Dict:
+        """Статистика кэша"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        """Закрытие соединения с SQLite"""
+        with self._lock:
+            self._conn.close()
+
+
+class QueryEmbeddingCache:
+    """In-memory LRU-кэш эмбеддингов поисковых запросов с временем жизни записей"""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600.0):
+        """
+        Args:
+            max_size: максимум запросов в кэше
+            ttl: время жизни записи в секундах
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Нормализация запроса: регистр, ё/е, лишние пробелы и знаки в конце"""
+        text = query.casefold().replace("ё", "е")
+        return " ".join(text.split()).rstrip("?!.,;: ")
+
+    def get(self, model: str, query: str) -> Optional[List[float]]:
+        """Эмбеддинг запроса из кэша или None"""
+        key = (model, self.normalize(query))
+        now = time.monotonic()
+
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] > now:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._items[key]
+            self.misses += 1
+            return None
+
+    def put(self, model: str, query: str, embedding: List[float]):
+        """Сохранение эмбеддинга запроса"""
+        key = (model, self.normalize(query))
+
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, embedding)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def stats(self) -> Dict:
+        """Статистика кэша"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._items),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+    def clear(self):
+        """Очистка кэша"""
+        with self._lock:
+            self._items.clear()
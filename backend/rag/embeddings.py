@@ -0,0 +1,393 @@
+"""
+Embeddings - провайдеры эмбеддингов для RAGEngine
+- VoyageEmbeddings / AsyncVoyageEmbeddings: Voyage AI (сеть)
+- LocalEmbeddings: локальные эмбеддинги на CPU без сети
+  (хэширование n-грамм символов и слов, подходит для русского текста)
+"""
+from typing import List, Dict, Optional
+from functools import lru_cache
+import asyncio
+import hashlib
+import logging
+import math
+import re
+
+import httpx
+
+from backend.rag.rate_limiter import rate_governor
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingProvider:
+    """
+    Интерфейс провайдера эмбеддингов.
+    Наследник обязан реализовать embed_batch; остальные методы
+    выражены через него (async-версии по умолчанию уходят в поток).
+    """
+    
+    # Идентификатор модели — входит в ключи кэшей эмбеддингов
+    model: str = ""
+    
+    def embed_batch(self, texts: List[str], input_type: str = "document") -> List[List[float]]:
+        """Эмбеддинги для списка текстов в порядке входа"""
+        raise NotImplementedError
+    
+    def embed(self, text: str, input_type: str = "document") -> List[float]:
+        """Получить эмбеддинг для одного текста"""
+        return self.embed_batch([text], input_type)[0]
+    
+    def embed_query(self, text: str) -> List[float]:
+        """Эмбеддинг для поискового запроса"""
+        return self.embed(text, input_type="query")
+    
+    async def aembed_batch(self, texts: List[str], input_type: str = "document") -> List[List[float]]:
+        """Асинхронные эмбеддинги для списка текстов"""
+        return await asyncio.to_thread(self.embed_batch, texts, input_type)
+    
+    async def aembed(self, text: str, input_type: str = "document") -> List[float]:
+        """Асинхронный эмбеддинг для одного текста"""
+        return (await self.aembed_batch([text], input_type))[0]
+    
+    async def aembed_query(self, text: str) -> List[float]:
+        """Асинхронный эмбеддинг для поискового запроса"""
+        return await self.aembed(text, input_type="query")
+    
+    async def aclose(self):
+        """Освобождение ресурсов провайдера"""
+
+
+class VoyageEmbeddings(EmbeddingProvider):
+    """Клиент для Voyage AI Embeddings"""
+    
+    def __init__(
+        self, 
+        api_key: str, 
+        model: str = "voyage-multilingual-2",
+        max_batch_size: int = 128,
+        max_batch_tokens: int = 100000
+    ):
+        """
+        Args:
+            api_key: ключ Voyage AI
+            model: модель эмбеддингов
+            max_batch_size: максимум текстов в одном запросе /embeddings
+            max_batch_tokens: бюджет токенов на один запрос (оценочно)
+        """
+        self.api_key = api_key
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.base_url = "https://api.voyageai.com/v1"  # ✅ ПРОБЕЛЫ УБРАНЫ!
+    
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """
+        Грубая оценка числа токенов без токенизатора.
+        Для русского текста ~3 символа на токен — берём с запасом.
+        """
+        return len(text) // 3 + 1
+    
+    def _split_batches(self, texts: List[str]) -> List[List[int]]:
+        """
+        Разбивка текстов на батчи по количеству и бюджету токенов
+        
+        Returns:
+            список батчей, каждый батч — список индексов исходных текстов
+        """
+        batches = []
+        current = []
+        current_tokens = 0
+        
+        for i, text in enumerate(texts):
+            tokens = self.estimate_tokens(text)
+            if current and (
+                len(current) >= self.max_batch_size
+                or current_tokens + tokens > self.max_batch_tokens
+            ):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(i)
+            current_tokens += tokens
+        
+        if current:
+            batches.append(current)
+        
+        return batches
+    
+    def _post_batch(
+        self,
+        client: httpx.Client,
+        headers: Dict,
+        batch: List[str],
+        input_type: str
+    ) -> List[List[float]]:
+        """Один запрос /embeddings для батча (через регулятор с повторами)"""
+        payload = {
+            "model": self.model,
+            "input": batch,
+            "input_type": input_type
+        }
+        
+        # Повторы, Retry-After и темп запросов — на стороне общего регулятора
+        response = rate_governor.get("voyage").call(
+            lambda: client.post(
+                f"{self.base_url.strip()}/embeddings",  # ✅ ДОБАВЛЕН .strip() для надёжности
+                headers=headers,
+                json=payload
+            ),
+            tokens=sum(self.estimate_tokens(text) for text in batch)
+        )
+        return self._parse_embeddings(response, batch)
+    
+    @staticmethod
+    def _parse_embeddings(response: httpx.Response, batch: List[str]) -> List[List[float]]:
+        """Эмбеддинги из ответа Voyage в порядке входных текстов"""
+        data = response.json()["data"]
+        
+        # Voyage возвращает index для каждого элемента — восстанавливаем порядок
+        data = sorted(data, key=lambda item: item.get("index", 0))
+        if len(data) != len(batch):
+            raise ValueError(
+                f"Voyage вернул {len(data)} эмбеддингов вместо {len(batch)}"
+            )
+        return [item["embedding"] for item in data]
+    
+    def embed_batch(self, texts: List[str], input_type: str = "document") -> List[List[float]]:
+        """
+        Получить эмбеддинги для списка текстов.
+        Тексты упаковываются в батчи (max_batch_size / max_batch_tokens),
+        порядок результата совпадает с порядком входа.
+        """
+        if not texts:
+            return []
+        
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        all_embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        batches = self._split_batches(texts)
+        
+        # Один клиент на весь вызов — без повторного TLS-рукопожатия на каждый батч
+        with httpx.Client(timeout=60.0) as client:
+            for n, batch in enumerate(batches, 1):
+                embeddings = self._post_batch(
+                    client,
+                    headers,
+                    [texts[i] for i in batch],
+                    input_type
+                )
+                for i, embedding in zip(batch, embeddings):
+                    all_embeddings[i] = embedding
+                
+                if len(batches) > 1:
+                    logger.info(f"📦 Батч {n}/{len(batches)}: {len(batch)} текстов")
+        
+        return all_embeddings
+
+
+class AsyncVoyageEmbeddings(VoyageEmbeddings):
+    """
+    Asyncio-версия клиента Voyage AI.
+    Один долгоживущий httpx.AsyncClient (keep-alive, HTTP/2 если доступен)
+    и семафор, ограничивающий число одновременных запросов.
+    Синхронные методы родителя продолжают работать.
+    """
+    
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "voyage-multilingual-2",
+        max_batch_size: int = 128,
+        max_batch_tokens: int = 100000,
+        max_concurrency: int = 4
+    ):
+        """
+        Args:
+            max_concurrency: максимум одновременных запросов к Voyage
+        """
+        super().__init__(api_key, model, max_batch_size, max_batch_tokens)
+        self.max_concurrency = max_concurrency
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Ленивое создание общего AsyncClient (внутри работающего event loop)"""
+        if self._client is None or self._client.is_closed:
+            try:
+                import h2  # noqa: F401 — HTTP/2 только если установлен пакет h2
+                http2 = True
+            except ImportError:
+                http2 = False
+            
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url.strip(),
+                timeout=60.0,
+                http2=http2,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                    keepalive_expiry=60.0
+                )
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            logger.info(f"✅ Voyage AsyncClient создан (HTTP/2: {http2})")
+        return self._client
+    
+    async def _apost_batch(self, batch: List[str], input_type: str) -> List[List[float]]:
+        """Асинхронный запрос /embeddings для батча (через регулятор с повторами)"""
+        client = self._get_client()
+        payload = {
+            "model": self.model,
+            "input": batch,
+            "input_type": input_type
+        }
+        
+        async def send() -> httpx.Response:
+            async with self._semaphore:
+                return await client.post("/embeddings", json=payload)
+        
+        response = await rate_governor.get("voyage").acall(
+            send,
+            tokens=sum(self.estimate_tokens(text) for text in batch)
+        )
+        return self._parse_embeddings(response, batch)
+    
+    async def aembed_batch(self, texts: List[str], input_type: str = "document") -> List[List[float]]:
+        """
+        Асинхронные эмбеддинги для списка текстов.
+        Батчи отправляются параллельно (не больше max_concurrency одновременно),
+        порядок результата совпадает с порядком входа.
+        """
+        if not texts:
+            return []
+        
+        batches = self._split_batches(texts)
+        results = await asyncio.gather(*[
+            self._apost_batch([texts[i] for i in batch], input_type)
+            for batch in batches
+        ])
+        
+        all_embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        for batch, embeddings in zip(batches, results):
+            for i, embedding in zip(batch, embeddings):
+                all_embeddings[i] = embedding
+        
+        return all_embeddings
+    
+    async def aclose(self):
+        """Закрытие общего AsyncClient"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class LocalEmbeddings(EmbeddingProvider):
+    """
+    Локальные эмбеддинги без сети (feature hashing).
+    Признаки: слова и n-граммы символов слов (устойчивы к русской морфологии),
+    каждый признак хэшируется в индекс и знак вектора размерности dimension.
+    Веса — сублинейная частота, вектор нормируется по L2.
+    Качество ниже нейросетевых моделей, зато ноль задержки — для тестов,
+    бенчмарков, dev-окружения и аварийного режима.
+    """
+    
+    _TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+    
+    def __init__(self, dimension: int = 1024, ngram_range: tuple = (3, 5)):
+        """
+        Args:
+            dimension: размерность векторов (должна совпадать с индексом)
+            ngram_range: минимальная и максимальная длина n-грамм символов
+        """
+        self.dimension = dimension
+        self.ngram_range = ngram_range
+        self.model = f"local-ngram-{ngram_range[0]}-{ngram_range[1]}-{dimension}"
+        # Хэш признака считается один раз для всего процесса
+        self._slot = lru_cache(maxsize=200000)(self._hash_feature)
+    
+    def _hash_feature(self, feature: str):
+        """Индекс и знак признака в векторе"""
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dimension, 1.0 if (value >> 63) & 1 else -1.0
+    
+    def _features(self, text: str) -> Dict[str, int]:
+        """Частоты признаков текста"""
+        counts: Dict[str, int] = {}
+        text = text.casefold().replace("ё", "е")
+        min_n, max_n = self.ngram_range
+        
+        for token in self._TOKEN_RE.findall(text):
+            word = f"w:{token}"
+            counts[word] = counts.get(word, 0) + 1
+            
+            padded = f"<{token}>"
+            for n in range(min_n, max_n + 1):
+                for i in range(len(padded) - n + 1):
+                    gram = padded[i:i + n]
+                    counts[gram] = counts.get(gram, 0) + 1
+        
+        return counts
+    
+    def _embed_one(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimension
+        for feature, count in self._features(text).items():
+            index, sign = self._slot(feature)
+            vector[index] += sign * (1.0 + math.log(count))
+        
+        norm = math.sqrt(sum(x * x for x in vector))
+        if norm > 0:
+            vector = [x / norm for x in vector]
+        return vector
+    
+    def embed_batch(self, texts: List[str], input_type: str = "document") -> List[List[float]]:
+        """Эмбеддинги для списка текстов (запросы и документы в одном пространстве)"""
+        return [self._embed_one(text) for text in texts]
+
+
+def create_embedding_provider(
+    provider: str,
+    model: str = "voyage-multilingual-2",
+    dimension: int = 1024,
+    voyage_api_key: Optional[str] = None,
+    batch_size: int = 128,
+    batch_tokens: int = 100000,
+    max_concurrency: int = 4
+) -> Optional[EmbeddingProvider]:
+    """
+    Создание провайдера эмбеддингов по имени из конфигурации
+    
+    Args:
+        provider: 'voyage' или 'local'
+        
+    Returns:
+        провайдер или None, если он не настроен (например, нет ключа Voyage)
+    """
+    if provider == "local":
+        embedder = LocalEmbeddings(dimension=dimension)
+        logger.info(f"✅ Локальные эмбеддинги инициализированы: {embedder.model}")
+        return embedder
+    
+    if provider == "voyage":
+        if not voyage_api_key:
+            return None
+        embedder = AsyncVoyageEmbeddings(
+            api_key=voyage_api_key,
+            model=model,
+            max_batch_size=batch_size,
+            max_batch_tokens=batch_tokens,
+            max_concurrency=max_concurrency
+        )
+        logger.info(f"✅ Voyage AI инициализирован: {model}")
+        return embedder
+    
+    logger.error(f"Неизвестный провайдер эмбеддингов: {provider}")
+    return None
@@ -0,0 +1,63 @@
+"""
+RAG Factory - RAGEngine из конфигурации приложения (backend/config.py)
+Единственное место, где настройки окружения превращаются в параметры
+движка: бот, админ-панель и скрипты загрузки получают одинаковые значения
+по умолчанию (реестр, хранилище текстов, namespace и т.д.).
+"""
+from typing import Optional
+
+from backend.config import config
+from backend.rag.rag_engine import RAGEngine
+
+
+def create_rag_engine(agent_type: Optional[str] = None) -> RAGEngine:
+    """
+    RAGEngine по текущей конфигурации (без подключения к индексу)
+
+    Args:
+        agent_type: тип агента ('ntd', 'docs'); None — базовый движок для for_agent
+    """
+    return RAGEngine(
+        api_key=config.get_api_key(),
+        pinecone_api_key=config.PINECONE_API_KEY,
+        index_name=config.PINECONE_INDEX,
+        agent_type=agent_type,
+        embedding_model=config.EMBEDDING_MODEL,
+        embedding_dimension=config.EMBEDDING_DIMENSION,
+        base_url=config.get_base_url(),
+        ai_provider=config.AI_PROVIDER,
+        voyage_api_key=config.get_embedding_api_key(),
+        embedding_provider=config.EMBEDDING_PROVIDER,
+        embedding_batch_size=config.EMBEDDING_BATCH_SIZE,
+        embedding_batch_tokens=config.EMBEDDING_BATCH_TOKENS,
+        embedding_max_concurrency=config.EMBEDDING_MAX_CONCURRENCY,
+        embedding_cache_path=config.EMBEDDING_CACHE_PATH or None,
+        embedding_cache_max_entries=config.EMBEDDING_CACHE_MAX_ENTRIES,
+        query_cache_size=config.QUERY_CACHE_SIZE,
+        query_cache_ttl=config.QUERY_CACHE_TTL,
+        registry_path=config.DOCUMENT_REGISTRY_PATH or None,
+        chunk_store_path=config.CHUNK_STORE_PATH or None,
+        lexical_index_path=config.LEXICAL_INDEX_PATH or None,
+        hybrid_rrf_k=config.HYBRID_RRF_K,
+        identifier_fast_path=config.IDENTIFIER_FAST_PATH,
+        io_threads=config.RAG_IO_THREADS,
+        rerank_candidates=config.RERANK_CANDIDATES,
+        rerank_lambda=config.RERANK_LAMBDA,
+        rerank_max_per_file=config.RERANK_MAX_PER_FILE,
+        rerank_min_score=config.RERANK_MIN_SCORE,
+        context_max_tokens=config.CONTEXT_MAX_TOKENS,
+        chunk_overlap=config.CHUNK_OVERLAP,
+        context_compression=config.CONTEXT_COMPRESSION or None,
+        compression_keep_ratio=config.COMPRESSION_KEEP_RATIO,
+        compression_neighbours=config.COMPRESSION_NEIGHBOURS,
+        upsert_max_bytes=config.UPSERT_MAX_BYTES,
+        upsert_concurrency=config.UPSERT_CONCURRENCY,
+        upsert_max_retries=config.UPSERT_MAX_RETRIES,
+        vector_store=config.VECTOR_STORE,
+        vector_store_path=config.VECTOR_STORE_PATH or None,
+        vector_store_dtype=config.VECTOR_STORE_DTYPE,
+        vector_namespaces=config.VECTOR_NAMESPACES,
+        ann_index=config.ANN_INDEX or None,
+        ann_nlist=config.ANN_NLIST,
+        ann_nprobe=config.ANN_NPROBE
+    )
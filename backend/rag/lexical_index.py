@@ -0,0 +1,239 @@
+"""
+Lexical Index - локальный полнотекстовый индекс чанков (BM25)
+Дополняет семантический поиск там, где важны точные токены:
+номера ГОСТ/СНиП/ТУ, пункты и номера договоров.
+
+- SQLite FTS5 с ранжированием bm25()
+- нормализация для русского языка: регистр, ё/е, лёгкий стемминг
+  окончаний, стоп-слова; идентификаторы вида 12.1.004-91 сохраняются
+  целиком и дополнительно разбиваются на части
+- разделы по агентам, как namespace в индексе векторов
+"""
+from typing import List, Dict, Optional, Tuple
+from pathlib import Path
+import json
+import logging
+import re
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Идентификаторы (12.1.004-91, 2.01.07-85, 47/2024) и обычные слова
+_TOKEN_RE = re.compile(r"\d+(?:[./\-]\d+)+|[a-zа-я0-9]+")
+
+_STOP_WORDS = frozenset(
+    "и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по "
+    "только ее мне было вот от меня еще нет о из ему теперь когда даже ну ли если уже "
+    "или ни быть был него до вас нибудь опять уж вам ведь там потом себя ничего ей "
+    "может они тут где есть надо ней для мы тебя их чем была сам чтоб без будто чего "
+    "раз тоже себе под будет ж тогда кто этот того потому этого какой совсем ним здесь "
+    "этом один почти мой тем чтобы нее были куда зачем всех никогда можно при наконец "
+    "два об другой хоть после над больше тот через эти нас про всего них какая много "
+    "разве три эту моя впрочем хорошо свою этой перед иногда лучше чуть том нельзя "
+    "такой им более всегда конечно всю между".split()
+)
+
+# Окончания для лёгкого стемминга (длинные проверяются первыми)
+_ENDINGS = tuple(sorted(
+    (
+        "иями ями ами ого его ому ему ыми ими ой ей ий ый ая яя ое ее ие ые ую юю "
+        "ов ев ах ях ам ям ом ем ия ья ью ии ь а я о е ы и у ю"
+    ).split(),
+    key=len,
+    reverse=True
+))
+
+
+def _stem(word: str) -> str:
+    """Отсечение окончания (основа не короче 3 букв)"""
+    if len(word) <= 4 or not word.isalpha():
+        return word
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def normalize_tokens(text: str) -> List[str]:
+    """
+    Токены для индекса и запроса
+
+    >>> normalize_tokens("ГОСТ 12.1.004-91 «Пожарная безопасность»")
+    ['гост', '12.1.004-91', '12', '1', '004', '91', 'пожарн', 'безопасност']
+    """
+    text = text.casefold().replace("ё", "е")
+    tokens = []
+    for token in _TOKEN_RE.findall(text):
+        if token[0].isdigit() and not token.isdigit():
+            # Идентификатор целиком + его части (для частичных совпадений)
+            tokens.append(token)
+            tokens.extend(part for part in re.split(r"[./\-]", token) if part)
+        elif token not in _STOP_WORDS:
+            tokens.append(_stem(token))
+    return tokens
+
+
+class LexicalIndex:
+    """BM25-индекс чанков на SQLite FTS5"""
+
+    # SQLite ограничивает число параметров в одном запросе
+    _QUERY_CHUNK = 500
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: путь к файлу SQLite
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                rowid INTEGER PRIMARY KEY,
+                vector_id TEXT NOT NULL UNIQUE,
+                agent_type TEXT NOT NULL,
+                filename TEXT,
+                metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_docs_file ON docs(agent_type, filename);
+            CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+                tokens,
+                tokenize = "unicode61 remove_diacritics 0 tokenchars '.-/'"
+            );
+            """
+        )
+        self._conn.commit()
+        logger.info(f"✅ Лексический индекс: {self.path}")
+
+    def add_many(self, agent_type: str, items: List[Tuple[str, str, Dict]]):
+        """
+        Индексирование (или переиндексирование) чанков
+
+        Args:
+            agent_type: раздел агента
+            items: [(id вектора, текст, метаданные без текста), ...]
+        """
+        if not items:
+            return
+        with self._lock:
+            with self._conn:
+                self._delete_ids([vector_id for vector_id, _, _ in items])
+                for vector_id, text, metadata in items:
+                    cursor = self._conn.execute(
+                        "INSERT INTO docs (vector_id, agent_type, filename, metadata) VALUES (?, ?, ?, ?)",
+                        (vector_id, agent_type, metadata.get('filename'),
+                         json.dumps(metadata, ensure_ascii=False))
+                    )
+                    self._conn.execute(
+                        "INSERT INTO docs_fts (rowid, tokens) VALUES (?, ?)",
+                        (cursor.lastrowid, " ".join(normalize_tokens(text)))
+                    )
+
+    def _delete_ids(self, ids: List[str]):
+        for i in range(0, len(ids), self._QUERY_CHUNK):
+            part = ids[i:i + self._QUERY_CHUNK]
+            placeholders = ",".join("?" * len(part))
+            rowids = [
+                (row[0],) for row in self._conn.execute(
+                    f"SELECT rowid FROM docs WHERE vector_id IN ({placeholders})", part
+                )
+            ]
+            self._conn.executemany("DELETE FROM docs_fts WHERE rowid = ?", rowids)
+            self._conn.executemany("DELETE FROM docs WHERE rowid = ?", rowids)
+
+    def delete_many(self, ids: List[str]):
+        """Удаление чанков по id вектора"""
+        if not ids:
+            return
+        with self._lock:
+            with self._conn:
+                self._delete_ids(ids)
+
+    def delete_file(self, agent_type: str, filename: str):
+        """Удаление всех чанков файла"""
+        with self._lock:
+            with self._conn:
+                rowids = [
+                    (row[0],) for row in self._conn.execute(
+                        "SELECT rowid FROM docs WHERE agent_type = ? AND filename = ?",
+                        (agent_type, filename)
+                    )
+                ]
+                self._conn.executemany("DELETE FROM docs_fts WHERE rowid = ?", rowids)
+                self._conn.executemany("DELETE FROM docs WHERE rowid = ?", rowids)
+
+    def search(
+        self,
+        agent_type: str,
+        query: str,
+        top_k: int,
+        filter: Optional[Dict] = None
+    ) -> List[Dict]:
+        """
+        BM25-поиск в разделе агента
+
+        Args:
+            agent_type: раздел агента
+            query: текст запроса
+            top_k: сколько результатов вернуть
+            filter: условия на поля метаданных: значение / {"$eq": ...} / {"$in": [...]}
+
+        Returns:
+            [{"id", "score", "metadata"}, ...] по убыванию score (score = -bm25)
+        """
+        tokens = list(dict.fromkeys(normalize_tokens(query)))
+        if not tokens:
+            return []
+        # Каждый токен — фраза в кавычках: спецсимволы FTS5 не интерпретируются
+        match = " OR ".join('"' + token.replace('"', '""') + '"' for token in tokens)
+
+        conditions, params = "", []
+        for key, value in (filter or {}).items():
+            if isinstance(value, dict) and "$in" in value:
+                values = list(value["$in"])
+                placeholders = ",".join("?" * len(values))
+                conditions += f" AND json_extract(d.metadata, ?) IN ({placeholders})"
+                params.extend([f"$.{key}", *values])
+                continue
+            if isinstance(value, dict):
+                value = value.get("$eq")
+            if value is None:
+                continue
+            conditions += f" AND json_extract(d.metadata, ?) = ?"
+            params.extend([f"$.{key}", value])
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT d.vector_id, bm25(docs_fts) AS rank, d.metadata
+                FROM docs_fts JOIN docs d ON d.rowid = docs_fts.rowid
+                WHERE docs_fts MATCH ? AND d.agent_type = ?{conditions}
+                ORDER BY rank LIMIT ?
+                """,
+                [match, agent_type, *params, top_k]
+            ).fetchall()
+
+        return [
+            {"id": vector_id, "score": -rank, "metadata": json.loads(metadata)}
+            for vector_id, rank, metadata in rows
+        ]
+
+    def count(self, agent_type: Optional[str] = None) -> int:
+        """Число проиндексированных чанков"""
+        with self._lock:
+            if agent_type is None:
+                return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM docs WHERE agent_type = ?", (agent_type,)
+            ).fetchone()[0]
+
+    def close(self):
+        """Закрытие соединения с SQLite"""
+        with self._lock:
+            self._conn.close()
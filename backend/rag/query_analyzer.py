@@ -0,0 +1,76 @@
+"""
+Query Analyzer - распознавание номеров документов в вопросе
+Категории — те же, что у DocumentProcessor.extract_metadata_from_filename
+(ГОСТ, СНиП, ТУ, Договор, Контракт, Соглашение) плюс СП.
+Найденный номер позволяет искать только по файлам этого документа:
+через реестр документов и BM25, без запроса эмбеддинга.
+"""
+from typing import List, Dict
+import re
+
+# Номер норматива: 12.1.004-91, Р 52289-2004, 2.01.07-85, 20.13330.2016
+_NUMBER = r"(\d+(?:[.\-–—]\d+)+|\d{4,})"
+
+DOC_TYPE_PATTERNS = {
+    'ГОСТ': re.compile(r"\bГОСТ(?:\s*(?:Р|ISO|IEC|EN))*\s*" + _NUMBER, re.IGNORECASE),
+    'СНиП': re.compile(r"\bСНиП\s*(?:[IVX]+[.\-–])?" + _NUMBER, re.IGNORECASE),
+    'ТУ': re.compile(r"\bТУ\s*" + _NUMBER),
+    'СП': re.compile(r"\bСП\s*" + _NUMBER),
+}
+
+_CONTRACT_PATTERN = re.compile(
+    r"\b(договор|контракт|соглашени)\w*\s*(?:№|No\.?|N|номер)\s*(\d[\w\-/]*)",
+    re.IGNORECASE
+)
+_CONTRACT_TYPES = {'договор': 'Договор', 'контракт': 'Контракт', 'соглашени': 'Соглашение'}
+
+
+def normalize_number(number: str) -> str:
+    """Единый вид номера: длинные тире → дефис"""
+    return re.sub(r"[–—]", "-", number)
+
+
+def normalize_name(text: str) -> str:
+    """Вид имени файла / номера для сравнения: дефисы, регистр, ё → е"""
+    return normalize_number(text).casefold().replace("ё", "е")
+
+
+def analyze_query(query: str) -> List[Dict]:
+    """
+    Номера документов в тексте вопроса
+
+    >>> analyze_query("что в СНиП 2.01.07-85 про снеговую нагрузку")
+    [{'doc_type': 'СНиП', 'number': '2.01.07-85'}]
+
+    Returns:
+        [{"doc_type", "number"}, ...] в порядке появления, без повторов
+    """
+    found = []
+    for doc_type, pattern in DOC_TYPE_PATTERNS.items():
+        for match in pattern.finditer(query):
+            found.append((match.start(), doc_type, normalize_number(match.group(1))))
+    for match in _CONTRACT_PATTERN.finditer(query):
+        doc_type = _CONTRACT_TYPES[match.group(1).casefold()]
+        found.append((match.start(), doc_type, normalize_number(match.group(2))))
+
+    result = []
+    for _, doc_type, number in sorted(found):
+        item = {'doc_type': doc_type, 'number': number}
+        if item not in result:
+            result.append(item)
+    return result
+
+
+def filename_matches(filename: str, identifier: Dict) -> bool:
+    """
+    Относится ли файл к документу с этим номером.
+    Номер ищется целиком (12.1.004 не совпадает с 12.1.0045); для коротких
+    номеров (договоры №47) в имени должен быть и тип документа
+    """
+    name = normalize_name(filename)
+    number = normalize_name(identifier['number'])
+    if not re.search(r"(?<![0-9.])" + re.escape(number) + r"(?![0-9]|\.\d)", name):
+        return False
+    if re.fullmatch(r"\w{1,4}", number):
+        return identifier['doc_type'].casefold()[:7] in name
+    return True
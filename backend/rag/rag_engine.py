@@ -2,94 +2,42 @@
 RAG Engine - система поиска по векторным базам знаний
 Поддержка: Voyage AI (embeddings) + DeepSeek (генерация)
 """
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+import copy
+import hashlib
+import json
 import logging
-import httpx
+import os
+import random
 import time
-import re
+import httpx
+import numpy as np
+
+from backend.rag.chunk_store import ChunkStore
+from backend.rag.context_compressor import compress_passages, embedding_scores, term_scores
+from backend.rag.context_packer import fill_budget, merge_adjacent
+from backend.rag.document_registry import DocumentRegistry
+from backend.rag.embedding_cache import EmbeddingCache, QueryEmbeddingCache
+# Клиенты Voyage реэкспортируются для совместимости со старыми импортами
+from backend.rag.embeddings import (  # noqa: F401
+    AsyncVoyageEmbeddings,
+    EmbeddingProvider,
+    LocalEmbeddings,
+    VoyageEmbeddings,
+    create_embedding_provider,
+)
+from backend.rag.lexical_index import LexicalIndex
+from backend.rag.query_analyzer import analyze_query, filename_matches
+from backend.rag.rate_limiter import rate_governor
+from backend.rag.reranker import mmr_select
+from backend.rag.vector_store import VectorStore, create_vector_store
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class VoyageEmbeddings:
-    """Клиент для Voyage AI Embeddings"""
-    
-    def __init__(
-        self, 
-        api_key: str, 
-        model: str = "voyage-multilingual-2"
-    ):
-        self.api_key = api_key
-        self.model = model
-        self.base_url = "https://api.voyageai.com/v1"  # ✅ ПРОБЕЛЫ УБРАНЫ!
-    
-    def embed(self, text: str, input_type: str = "document") -> List[float]:
-        """Получить эмбеддинг для одного текста"""
-        return self.embed_batch([text], input_type)[0]
-    
-    def embed_query(self, text: str) -> List[float]:
-        """Эмбеддинг для поискового запроса"""
-        return self.embed(text, input_type="query")
-    
-    def embed_batch(self, texts: List[str], input_type: str = "document") -> List[List[float]]:
-        """Получить эмбеддинги для списка текстов с соблюдением rate limit"""
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-    
-        all_embeddings = []
-    
-        for i, text in enumerate(texts):
-            payload = {
-                "model": self.model,
-                "input": [text],
-                "input_type": input_type
-            }
-        
-            max_retries = 3
-            retry_delay = 2.0
-        
-            for attempt in range(max_retries + 1):
-                try:
-                    with httpx.Client(timeout=60.0) as client:
-                        response = client.post(
-                            f"{self.base_url.strip()}/embeddings",  # ✅ ДОБАВЛЕН .strip() для надёжности
-                            headers=headers,
-                            json=payload
-                        )
-                
-                    if response.status_code == 429:
-                        if attempt < max_retries:
-                            logger.warning(f"⚠️ Rate limit hit (попытка {attempt + 1}). Ждём {retry_delay} сек...")
-                            time.sleep(retry_delay)
-                            retry_delay *= 1.5  # экспоненциальная задержка
-                            continue
-                        else:
-                            response.raise_for_status()  # выбросит исключение
-                
-                    response.raise_for_status()
-                    data = response.json()
-                    embedding = data["data"][0]["embedding"]
-                    all_embeddings.append(embedding)
-                    break  # успех — выходим из цикла попыток
-                
-                except Exception as e:
-                    if attempt < max_retries:
-                        logger.warning(f"⚠️ Ошибка при запросе (попытка {attempt + 1}): {e}")
-                        time.sleep(retry_delay)
-                        retry_delay *= 1.5
-                    else:
-                        logger.error(f"❌ Все попытки исчерпаны для текста: {text[:50]}...")
-                        raise e
-        
-            # Задержка между чанками (чтобы не спамить)
-            if i < len(texts) - 1:
-                time.sleep(1.2)
-    
-        return all_embeddings
-
-
 class RAGEngine:
     """Система RAG для поиска и генерации ответов с поддержкой фильтров"""
     
@@ -105,7 +53,39 @@ class RAGEngine:
         base_url: str = None,
         ai_provider: str = "deepseek",
         voyage_api_key: str = None,
-        embedding_provider: str = "voyage"
+        embedding_provider: str = "voyage",
+        embedding_batch_size: int = 128,
+        embedding_batch_tokens: int = 100000,
+        embedding_max_concurrency: int = 4,
+        embedding_cache_path: Optional[str] = None,
+        embedding_cache_max_entries: int = 200000,
+        query_cache_size: int = 1024,
+        query_cache_ttl: float = 3600.0,
+        registry_path: Optional[str] = None,
+        chunk_store_path: Optional[str] = None,
+        lexical_index_path: Optional[str] = None,
+        hybrid_rrf_k: int = 60,
+        identifier_fast_path: bool = True,
+        io_threads: int = 8,
+        rerank_candidates: int = 30,
+        rerank_lambda: float = 0.7,
+        rerank_max_per_file: int = 2,
+        rerank_min_score: float = 0.0,
+        context_max_tokens: int = 3000,
+        chunk_overlap: int = 100,
+        context_compression: Optional[str] = None,
+        compression_keep_ratio: float = 0.3,
+        compression_neighbours: int = 1,
+        upsert_max_bytes: int = 1900000,
+        upsert_concurrency: int = 4,
+        upsert_max_retries: int = 3,
+        vector_store: str = "pinecone",
+        vector_store_path: Optional[str] = None,
+        vector_store_dtype: str = "float32",
+        vector_namespaces: bool = False,
+        ann_index: Optional[str] = None,
+        ann_nlist: int = 0,
+        ann_nprobe: int = 16
     ):
         """
         Args:
@@ -119,7 +99,51 @@ class RAGEngine:
             base_url: базовый URL API (для DeepSeek)
             ai_provider: провайдер AI для генерации (deepseek)
             voyage_api_key: ключ Voyage AI для эмбеддингов
-            embedding_provider: провайдер эмбеддингов (voyage)
+            embedding_provider: провайдер эмбеддингов ('voyage' или 'local' — без сети)
+            embedding_batch_size: максимум чанков в одном запросе эмбеддингов
+            embedding_batch_tokens: бюджет токенов на один запрос эмбеддингов
+            embedding_max_concurrency: максимум одновременных async-запросов к Voyage
+            embedding_cache_path: путь к SQLite-кэшу эмбеддингов (None — без кэша)
+            embedding_cache_max_entries: максимум записей в кэше эмбеддингов
+            query_cache_size: размер in-memory кэша эмбеддингов запросов (0 — выключен)
+            query_cache_ttl: время жизни записи кэша запросов в секундах
+            registry_path: путь к SQLite-реестру документов (None — без реестра)
+            chunk_store_path: путь к SQLite-хранилищу текстов чанков
+                (None — текст хранится в метаданных вектора, до 8000 символов);
+                файл должен быть доступен всем процессам, которые ищут по индексу
+            lexical_index_path: путь к BM25-индексу чанков (None — только семантический поиск);
+                как и chunk_store_path, должен заполняться тем же процессом / машиной, что ищет
+            hybrid_rrf_k: константа reciprocal rank fusion при слиянии BM25 и векторного поиска
+            identifier_fast_path: искать по номеру документа (ГОСТ, СНиП, ТУ, СП, договор)
+                только в его файлах — через реестр и BM25, без эмбеддинга запроса
+                (реестр должен быть тем же, в который пишет загрузка документов)
+            io_threads: размер пула потоков для блокирующих вызовов async-методов
+                (SDK Pinecone, SQLite) — ограничивает их параллелизм
+            rerank_candidates: сколько результатов поиска отдавать на MMR-переранжирование
+                (0 — без переранжирования, в ответ идут первые top_k)
+            rerank_lambda: вес релевантности в MMR (1.0 — без учёта разнообразия)
+            rerank_max_per_file: максимум фрагментов из одного файла (0 — без ограничения;
+                не действует при поиске по файлам документа, названного в вопросе)
+            rerank_min_score: фрагменты с score ниже порога в ответ не попадают
+            context_max_tokens: бюджет токенов на контекст в промпте (0 — без ограничения)
+            chunk_overlap: перекрытие чанков в символах (убирается при склейке соседних чанков)
+            context_compression: сжатие отрывков до предложений, относящихся к вопросу:
+                'terms' (совпадение терминов), 'embedding' (близость к эмбеддингу запроса)
+                или None — без сжатия
+            compression_keep_ratio: доля лучших предложений, сохраняемых при сжатии
+            compression_neighbours: сколько соседних предложений сохранять с каждой стороны
+            upsert_max_bytes: предельный размер одного upsert-запроса в байтах (лимит Pinecone — 2 МБ)
+            upsert_concurrency: сколько upsert-батчей отправляется параллельно
+            upsert_max_retries: сколько раз повторять неудавшийся батч
+            vector_store: хранилище векторов ('pinecone' или 'local' — NumPy в процессе)
+            vector_store_path: каталог локального хранилища (None — только в памяти)
+            vector_store_dtype: тип векторов в снимке локального хранилища ('float32' или 'float16')
+            vector_namespaces: хранить векторы агента в своём namespace / коллекции
+                (False — общий раздел с фильтром по agent_type; включать после
+                переноса векторов: python -m backend.utils.migrate_namespaces)
+            ann_index: приближённый индекс локального хранилища ('ivf' или None — точный поиск)
+            ann_nlist: число кластеров IVF (0 — sqrt(N))
+            ann_nprobe: сколько списков IVF сканировать (больше — выше recall, медленнее)
         """
         self.api_key = api_key
         self.pinecone_api_key = pinecone_api_key
@@ -132,19 +156,103 @@ class RAGEngine:
         self.agent_type = agent_type
         self.embedding_provider = embedding_provider
         self.voyage_api_key = voyage_api_key
+        self.upsert_max_bytes = upsert_max_bytes
+        self.upsert_concurrency = upsert_concurrency
+        self.upsert_max_retries = upsert_max_retries
+        self.vector_store_backend = vector_store
+        self.vector_store_path = vector_store_path
+        self.vector_store_dtype = vector_store_dtype
+        self.vector_namespaces = vector_namespaces
+        self.ann_index = ann_index
+        self.ann_nlist = ann_nlist
+        self.ann_nprobe = ann_nprobe
+        
+        # Инициализация провайдера эмбеддингов (voyage или local)
+        self.embedder: Optional[EmbeddingProvider] = create_embedding_provider(
+            embedding_provider,
+            model=embedding_model,
+            dimension=embedding_dimension,
+            voyage_api_key=voyage_api_key,
+            batch_size=embedding_batch_size,
+            batch_tokens=embedding_batch_tokens,
+            max_concurrency=embedding_max_concurrency
+        )
         
-        # Инициализация Voyage клиента
-        if embedding_provider == "voyage" and voyage_api_key:
-            self.voyage_client = VoyageEmbeddings(
-                api_key=voyage_api_key,
-                model=embedding_model
+        # Постоянный кэш эмбеддингов документов
+        if embedding_cache_path:
+            self.embedding_cache = EmbeddingCache(
+                embedding_cache_path,
+                max_entries=embedding_cache_max_entries
             )
-            logger.info(f"✅ Voyage AI инициализирован: {embedding_model}")
         else:
-            self.voyage_client = None
+            self.embedding_cache = None
         
-        # Будет инициализирован при подключении
-        self.index = None
+        # Кэш эмбеддингов повторяющихся вопросов пользователей
+        if query_cache_size > 0:
+            self.query_cache = QueryEmbeddingCache(query_cache_size, query_cache_ttl)
+        else:
+            self.query_cache = None
+        
+        # Реестр загруженных документов (список файлов без запросов к индексу)
+        if registry_path:
+            self.registry = DocumentRegistry(registry_path)
+        else:
+            self.registry = None
+        
+        # Полные тексты чанков хранятся локально, в индексе — только поля фильтров
+        if chunk_store_path:
+            self.chunk_store = ChunkStore(chunk_store_path)
+        else:
+            self.chunk_store = None
+        
+        # BM25-индекс для гибридного поиска (точные номера ГОСТ, пунктов, договоров)
+        if lexical_index_path:
+            self.lexical_index = LexicalIndex(lexical_index_path)
+            self._lexical_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="lexical")
+        else:
+            self.lexical_index = None
+            self._lexical_pool = None
+        self.hybrid_rrf_k = hybrid_rrf_k
+        
+        # Блокирующие вызовы async-пути (asearch, arerank, agenerate_answer)
+        self._io_pool = ThreadPoolExecutor(max_workers=io_threads, thread_name_prefix="rag-io")
+        # Общий AsyncClient DeepSeek (соединения переиспользуются между вопросами и агентами)
+        self._llm_client: Optional[httpx.AsyncClient] = httpx.AsyncClient(timeout=60.0)
+        self.identifier_fast_path = identifier_fast_path
+        self.rerank_candidates = rerank_candidates
+        self.rerank_lambda = rerank_lambda
+        self.rerank_max_per_file = rerank_max_per_file
+        self.rerank_min_score = rerank_min_score
+        self.context_max_tokens = context_max_tokens
+        self.chunk_overlap = chunk_overlap
+        self.context_compression = context_compression
+        self.compression_keep_ratio = compression_keep_ratio
+        self.compression_neighbours = compression_neighbours
+        
+        # Будет инициализировано при подключении (init_index)
+        self.vector_store: Optional[VectorStore] = None
+        
+        # False — ресурсы принадлежат другому движку (см. for_agent), aclose их не закрывает
+        self._owns_resources = True
+        # Реестр уже сверялся с индексом (см. backfill_registry)
+        self._registry_backfilled = False
+        # Предупреждение о пустом реестре при поиске по номеру документа уже выведено
+        self._registry_empty_warned = False
+    
+    def _require_embedder(self) -> EmbeddingProvider:
+        """Провайдер эмбеддингов или ValueError, если он не настроен"""
+        if self.embedder is None:
+            logger.error("Не настроен провайдер эмбеддингов")
+            raise ValueError("Не настроен провайдер эмбеддингов")
+        return self.embedder
+    
+    @property
+    def _query_cache_model(self) -> str:
+        """
+        Ключ модели в кэше запросов: провайдер и модель эмбеддингов.
+        Агента в ключе нет — эмбеддинг вопроса от агента не зависит (см. for_agent)
+        """
+        return f"{self.embedding_provider}:{self.embedder.model}"
     
     def create_embedding(self, text: str, is_query: bool = False) -> List[float]:
         """
@@ -157,20 +265,54 @@ class RAGEngine:
         Returns:
             вектор embedding
         """
-        # Только Voyage AI
-        if self.embedding_provider == "voyage" and self.voyage_client:
-            try:
-                if is_query:
-                    return self.voyage_client.embed_query(text)
-                else:
-                    return self.voyage_client.embed(text)
-            except Exception as e:
-                logger.error(f"Ошибка Voyage AI: {e}")
-                raise
+        self._require_embedder()
+        
+        if is_query and self.query_cache is not None:
+            cached = self.query_cache.get(self._query_cache_model, text)
+            if cached is not None:
+                return cached
+        
+        try:
+            if is_query:
+                embedding = self.embedder.embed_query(text)
+                if self.query_cache is not None:
+                    self.query_cache.put(self._query_cache_model, text, embedding)
+                return embedding
+            else:
+                return self.embedder.embed(text)
+        except Exception as e:
+            logger.error(f"Ошибка провайдера эмбеддингов ({self.embedding_provider}): {e}")
+            raise
+    
+    async def acreate_embedding(self, text: str, is_query: bool = False) -> List[float]:
+        """
+        Асинхронное создание embedding (не блокирует event loop)
+        
+        Args:
+            text: входной текст
+            is_query: True если это поисковый запрос
+            
+        Returns:
+            вектор embedding
+        """
+        self._require_embedder()
+        
+        if is_query and self.query_cache is not None:
+            cached = self.query_cache.get(self._query_cache_model, text)
+            if cached is not None:
+                return cached
         
-        # Если мы здесь, значит, что-то пошло не так
-        logger.error("Не настроен провайдер эмбеддингов")
-        raise ValueError("Не настроен провайдер эмбеддингов")
+        try:
+            if is_query:
+                embedding = await self.embedder.aembed_query(text)
+                if self.query_cache is not None:
+                    self.query_cache.put(self._query_cache_model, text, embedding)
+                return embedding
+            else:
+                return await self.embedder.aembed(text)
+        except Exception as e:
+            logger.error(f"Ошибка провайдера эмбеддингов ({self.embedding_provider}): {e}")
+            raise
     
     def search(self, query: str, top_k: Optional[int] = None) -> List[Dict]:
         """
@@ -183,7 +325,7 @@ class RAGEngine:
         Returns:
             список найденных документов
         """
-        if not self.index:
+        if self.vector_store is None:
             logger.error("Индекс не инициализирован")
             return []
         
@@ -191,57 +333,361 @@ class RAGEngine:
             top_k = self.top_k
         
         try:
-            # Создаем embedding для запроса (is_query=True для Voyage)
-            query_embedding = self.create_embedding(query, is_query=True)
-            
-            # Формируем фильтр по типу агента
-            search_filter = None
-            if self.agent_type:
-                search_filter = {"agent_type": self.agent_type}
-                logger.info(f"Поиск с фильтром: {search_filter}")
-            
-            # Ищем похожие векторы с фильтром
-            results = self.index.query(
-                vector=query_embedding,
-                top_k=top_k,
-                include_metadata=True,
-                filter=search_filter  # Фильтр по типу агента!
-            )
+            # Номер документа в вопросе — ищем только в его файлах
+            file_filter = None
+            if self.identifier_fast_path:
+                filenames = self._identifier_files(query)
+                if filenames:
+                    file_filter = {"filename": {"$in": filenames}}
+                    documents = self._lexical_lookup(query, top_k, file_filter)
+                    if documents:
+                        return self._mark_file_filtered(documents)
             
-            # Форматируем результаты
-            documents = []
-            for match in results['matches']:
-                documents.append({
-                    'id': match['id'],
-                    'score': match['score'],
-                    'text': match['metadata'].get('text', ''),
-                    'metadata': {k: v for k, v in match['metadata'].items() if k != 'text'}
-                })
+            documents = self._hybrid_search(query, top_k, file_filter)
+            if documents and file_filter is not None:
+                return self._mark_file_filtered(documents)
+            if not documents and file_filter is not None:
+                # Файлы загружены до реестра/BM25 или не содержат ответа — ищем везде
+                documents = self._hybrid_search(query, top_k)
+            return documents
+        
+        except Exception as e:
+            logger.error(f"Ошибка при поиске: {e}")
+            return []
+    
+    async def asearch(self, query: str, top_k: Optional[int] = None) -> List[Dict]:
+        """
+        Асинхронный search: эмбеддинг запроса — через async-клиент,
+        SQLite и SDK хранилища векторов — в ограниченном пуле потоков
+        """
+        if self.vector_store is None:
+            logger.error("Индекс не инициализирован")
+            return []
+        
+        if top_k is None:
+            top_k = self.top_k
+        
+        try:
+            file_filter = None
+            if self.identifier_fast_path:
+                filenames = await self._run_blocking(self._identifier_files, query)
+                if filenames:
+                    file_filter = {"filename": {"$in": filenames}}
+                    documents = await self._run_blocking(self._lexical_lookup, query, top_k, file_filter)
+                    if documents:
+                        return self._mark_file_filtered(documents)
             
+            documents = await self._ahybrid_search(query, top_k, file_filter)
+            if documents and file_filter is not None:
+                return self._mark_file_filtered(documents)
+            if not documents and file_filter is not None:
+                documents = await self._ahybrid_search(query, top_k)
             return documents
         
         except Exception as e:
             logger.error(f"Ошибка при поиске: {e}")
             return []
     
+    @staticmethod
+    def _mark_file_filtered(documents: List[Dict]) -> List[Dict]:
+        """Результаты поиска только по файлам документа из вопроса (см. rerank)"""
+        for document in documents:
+            document['file_filtered'] = True
+        return documents
+    
+    async def _run_blocking(self, func, *args):
+        """Блокирующий вызов в пуле потоков запросов (не занимает event loop)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io_pool, partial(func, *args))
+    
+    def _identifier_files(self, query: str) -> List[str]:
+        """Файлы документов, номера которых названы в вопросе (по реестру)"""
+        if self.registry is None:
+            return []
+        identifiers = analyze_query(query)
+        filenames = []
+        for identifier in identifiers:
+            for filename in self.registry.find_filenames(self._registry_agent, identifier['number']):
+                if filename not in filenames and filename_matches(filename, identifier):
+                    filenames.append(filename)
+        if filenames:
+            numbers = ", ".join(f"{i['doc_type']} {i['number']}" for i in identifiers)
+            logger.info(f"⚡ В запросе {numbers} → {len(filenames)} файлов")
+        elif identifiers and not self._registry_empty_warned:
+            if self.registry.stats(self._registry_agent)['documents'] == 0:
+                # Документы загружались на другой машине (админ-панель), реестр сюда не попал
+                self._registry_empty_warned = True
+                logger.warning(
+                    f"⚠️ Реестр документов пуст (агент: {self.agent_type}) — поиск по номеру "
+                    f"документа не работает; DOCUMENT_REGISTRY_PATH должен быть общим с админ-панелью"
+                )
+        return filenames
+    
+    def _lexical_lookup(self, query: str, top_k: int, file_filter: Dict) -> List[Dict]:
+        """BM25-поиск по файлам документа — без эмбеддинга запроса и векторного поиска"""
+        if self.lexical_index is None:
+            return []
+        matches = self.lexical_index.search(self._registry_agent, query, top_k, filter=file_filter)
+        if not matches:
+            return []
+        # score — доля от лучшего совпадения, исходная оценка BM25 — в lexical_score
+        best = matches[0]['score'] or 1.0
+        for match in matches:
+            match['lexical_score'] = match['score']
+            match['score'] = match['score'] / best
+        return self._hydrate(matches)
+    
+    def _hybrid_search(
+        self,
+        query: str,
+        top_k: int,
+        file_filter: Optional[Dict] = None
+    ) -> List[Dict]:
+        """Векторный поиск (и BM25 параллельно, если включён) со слиянием результатов"""
+        # BM25 идёт параллельно с эмбеддингом запроса и векторным поиском
+        lexical_future = None
+        if self.lexical_index is not None:
+            lexical_future = self._lexical_pool.submit(
+                self.lexical_index.search, self._registry_agent, query, top_k * 2, file_filter
+            )
+        
+        # Создаем embedding для запроса (is_query=True для Voyage)
+        query_embedding = self.create_embedding(query, is_query=True)
+        matches = self._vector_query(query_embedding, top_k, file_filter, lexical_future is not None)
+        
+        if lexical_future is not None:
+            matches = self._fuse(matches, lexical_future.result())[:top_k]
+        
+        return self._hydrate(matches)
+    
+    async def _ahybrid_search(
+        self,
+        query: str,
+        top_k: int,
+        file_filter: Optional[Dict] = None
+    ) -> List[Dict]:
+        """Асинхронный _hybrid_search: блокирующие вызовы — в пулах потоков"""
+        loop = asyncio.get_running_loop()
+        lexical_future = None
+        if self.lexical_index is not None:
+            lexical_future = loop.run_in_executor(
+                self._lexical_pool,
+                self.lexical_index.search, self._registry_agent, query, top_k * 2, file_filter
+            )
+        
+        query_embedding = await self.acreate_embedding(query, is_query=True)
+        matches = await self._run_blocking(
+            self._vector_query, query_embedding, top_k, file_filter, lexical_future is not None
+        )
+        
+        if lexical_future is not None:
+            matches = self._fuse(matches, await lexical_future)[:top_k]
+        
+        return await self._run_blocking(self._hydrate, matches)
+    
+    def _vector_query(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        file_filter: Optional[Dict],
+        hybrid: bool
+    ) -> List[Dict]:
+        """Запрос к хранилищу векторов (для гибридного поиска — вдвое больше кандидатов)"""
+        # Фильтр по типу агента нужен только в общем разделе индекса
+        search_filter = dict(file_filter or {})
+        if self.agent_type and self.namespace is None:
+            search_filter["agent_type"] = self.agent_type
+        if search_filter:
+            logger.info(f"Поиск с фильтром: {search_filter}")
+        
+        # Ищем похожие векторы с фильтром
+        return self.vector_store.query(
+            vector=query_embedding,
+            top_k=top_k * 2 if hybrid else top_k,
+            include_metadata=True,
+            filter=search_filter or None
+        )
+    
+    def _fuse(self, dense: List[Dict], lexical: List[Dict]) -> List[Dict]:
+        """
+        Reciprocal rank fusion результатов векторного и BM25-поиска
+        
+        score результата — сумма 1/(k + ранг) по спискам, нормированная
+        на максимум (1.0 — первое место в обоих списках); исходные оценки
+        сохраняются в dense_score и lexical_score. Если BM25 ничего не нашёл,
+        векторные результаты возвращаются как есть, с исходными score
+        """
+        if not lexical:
+            return dense
+        k = self.hybrid_rrf_k
+        fused: Dict[str, Dict] = {}
+        for source, matches in (("dense_score", dense), ("lexical_score", lexical)):
+            for rank, match in enumerate(matches, start=1):
+                item = fused.get(match['id'])
+                if item is None:
+                    item = fused[match['id']] = {
+                        'id': match['id'],
+                        'score': 0.0,
+                        'metadata': match['metadata'],
+                        'dense_score': None,
+                        'lexical_score': None
+                    }
+                item['score'] += 1.0 / (k + rank)
+                item[source] = match['score']
+        
+        best = 2.0 / (k + 1)
+        for item in fused.values():
+            item['score'] /= best
+        
+        logger.info(f"🔀 Гибридный поиск: {len(dense)} векторных + {len(lexical)} BM25 → {len(fused)}")
+        return sorted(fused.values(), key=lambda item: item['score'], reverse=True)
+    
+    def _hydrate(self, matches: List[Dict]) -> List[Dict]:
+        """
+        Результаты поиска с текстами чанков: из локального хранилища текстов,
+        из метаданных вектора, а для результатов BM25 (их метаданные без текста) —
+        из метаданных, полученных одним fetch к хранилищу векторов
+        """
+        texts = {}
+        if self.chunk_store is not None and matches:
+            texts = self.chunk_store.get_many([match['id'] for match in matches])
+        
+        unresolved = [
+            match['id'] for match in matches
+            if not texts.get(match['id']) and not match['metadata'].get('text')
+        ]
+        if unresolved:
+            try:
+                for vector_id, vector in self.vector_store.fetch(unresolved).items():
+                    if vector['metadata'].get('text'):
+                        texts[vector_id] = vector['metadata']['text']
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось получить тексты чанков из хранилища векторов: {e}")
+        
+        # Форматируем результаты
+        documents = []
+        missing = []
+        for match in matches:
+            # Векторы, загруженные до хранилища текстов, несут текст в метаданных
+            text = texts.get(match['id']) or match['metadata'].get('text', '')
+            if not text:
+                missing.append(match['metadata'].get('filename') or match['id'])
+                continue
+            document = {
+                'id': match['id'],
+                'score': match['score'],
+                'text': text,
+                'metadata': {k: v for k, v in match['metadata'].items() if k != 'text'}
+            }
+            for key in ('dense_score', 'lexical_score'):
+                if key in match:
+                    document[key] = match[key]
+            documents.append(document)
+        
+        if missing:
+            # Текст лежит в CHUNK_STORE_PATH другой машины (например, админ-панели)
+            logger.warning(
+                f"⚠️ Нет текста у {len(missing)} найденных чанков "
+                f"({', '.join(sorted(set(missing))[:5])}) — проверьте CHUNK_STORE_PATH"
+            )
+        return documents
+    
+    def rerank(self, documents: List[Dict], top_n: Optional[int] = None) -> List[Dict]:
+        """
+        MMR-переранжирование результатов поиска перед генерацией ответа
+        
+        Из кандидатов выбираются top_n фрагментов с лучшим балансом
+        релевантности (score) и непохожести на уже выбранные, не больше
+        rerank_max_per_file из одного файла и не ниже rerank_min_score.
+        Ограничение на файл не действует, если поиск шёл по файлам документа
+        из вопроса или все кандидаты из одного файла — иначе от ГОСТа
+        в контекст попали бы только два фрагмента
+        
+        Args:
+            documents: результаты search
+            top_n: сколько фрагментов оставить (по умолчанию top_k)
+            
+        Returns:
+            выбранные фрагменты в порядке выбора
+        """
+        if top_n is None:
+            top_n = self.top_k
+        if self.rerank_candidates <= 0 or len(documents) <= 1:
+            return documents[:top_n]
+        
+        groups = [doc['metadata'].get('filename', '') for doc in documents]
+        max_per_file = self.rerank_max_per_file
+        if len(set(groups)) == 1 or any(doc.get('file_filtered') for doc in documents):
+            max_per_file = 0
+        
+        try:
+            embeddings = self._rerank_embeddings(documents)
+            selected = mmr_select(
+                relevance=np.array([doc['score'] for doc in documents], dtype=np.float32),
+                embeddings=embeddings,
+                top_n=top_n,
+                lambda_=self.rerank_lambda,
+                groups=groups,
+                max_per_group=max_per_file,
+                min_score=self.rerank_min_score
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Переранжирование не удалось ({e}), берём первые {top_n}")
+            return documents[:top_n]
+        
+        logger.info(f"📊 MMR: {len(documents)} кандидатов → {len(selected)} фрагментов")
+        return [documents[i] for i in selected]
+    
+    async def arerank(self, documents: List[Dict], top_n: Optional[int] = None) -> List[Dict]:
+        """Асинхронный rerank (fetch эмбеддингов и MMR — в пуле потоков)"""
+        return await self._run_blocking(self.rerank, documents, top_n)
+    
+    def _rerank_embeddings(self, documents: List[Dict]) -> np.ndarray:
+        """
+        Эмбеддинги кандидатов — одним fetch к хранилищу векторов
+        (поиск их не запрашивает: rerank нужен только части вызовов search)
+        """
+        try:
+            fetched = self.vector_store.fetch([doc['id'] for doc in documents])
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось получить эмбеддинги кандидатов: {e}")
+            fetched = {}
+        
+        # Без эмбеддинга строка нулевая — фрагмент не штрафуется за похожесть
+        embeddings = np.zeros((len(documents), self.embedding_dimension), dtype=np.float32)
+        for i, doc in enumerate(documents):
+            values = fetched.get(doc['id'], {}).get('values')
+            if values:
+                embeddings[i] = values
+        return embeddings
+    
     def delete_documents_by_filename(self, filename: str) -> bool:
         """Удаление всех чанков документа по имени файла"""
-        if not self.index:
+        if self.vector_store is None:
             logger.error("Индекс не инициализирован")
             return False
     
         try:
-            # Создаем фильтр для удаления
-            delete_filter = {
-                "filename": {"$eq": filename}
-            }
-        
-            # Если указан тип агента, добавляем его в фильтр
-            if self.agent_type:
-                delete_filter["agent_type"] = {"$eq": self.agent_type}
-        
-            # Удаляем документы
-            self.index.delete(filter=delete_filter)
+            # Реестр знает id всех чанков — удаляем по id, без сканирования по фильтру
+            chunks = self.registry.chunks(self._registry_agent, filename) if self.registry is not None else []
+            if chunks:
+                self._delete_vectors([chunk['vector_id'] for chunk in chunks])
+            else:
+                # Документ загружен до появления реестра — удаляем по метаданным
+                delete_filter = {
+                    "filename": {"$eq": filename}
+                }
+            
+                # Если указан тип агента и раздел общий, добавляем его в фильтр
+                if self.agent_type and self.namespace is None:
+                    delete_filter["agent_type"] = {"$eq": self.agent_type}
+            
+                self.vector_store.delete(filter=delete_filter)
+                if self.lexical_index is not None:
+                    self.lexical_index.delete_file(self._registry_agent, filename)
+            
+            if self.registry is not None:
+                self.registry.remove(self._registry_agent, filename)
             logger.info(f"✅ Удалены чанки документа: {filename} (агент: {self.agent_type})")
             return True
         
@@ -249,115 +695,646 @@ class RAGEngine:
             logger.error(f"❌ Ошибка при удалении: {e}")
             return False
     
+    @property
+    def namespace(self) -> Optional[str]:
+        """Раздел индекса агента (None — общий раздел с фильтром по agent_type)"""
+        if self.vector_namespaces and self.agent_type:
+            return self.agent_type
+        return None
+    
+    @property
+    def _registry_agent(self) -> str:
+        """Ключ агента в реестре документов"""
+        return self.agent_type or ""
+    
     def list_documents(self) -> List[str]:
         """
-        Получение списка всех документов агента
+        Получение списка всех документов агента (из реестра, без запросов к индексу)
         
         Returns:
             список имён файлов
         """
-        if not self.index:
-            logger.error("Индекс не инициализирован")
+        if self.registry is None:
+            logger.error("Реестр документов не настроен")
             return []
         
         try:
-            # Получаем статистику индекса
-            stats = self.index.describe_index_stats()
-            
-            # В Pinecone нет прямого способа получить список уникальных метаданных
-            # Возвращаем информацию о количестве векторов
-            namespaces = stats.get('namespaces', {})
-            
-            logger.info(f"📊 Статистика индекса: {stats}")
-            
-            return []  # Pinecone не поддерживает список документов напрямую
+            documents = self.registry.list_documents(self._registry_agent)
+            if not documents and not self._registry_backfilled:
+                # Файлы загружены до появления реестра — восстанавливаем его по индексу
+                self.backfill_registry()
+                documents = self.registry.list_documents(self._registry_agent)
+            return [doc['filename'] for doc in documents]
         
         except Exception as e:
             logger.error(f"❌ Ошибка при получении списка: {e}")
             return []
     
+    def backfill_registry(self) -> int:
+        """
+        Однократное заполнение реестра по метаданным векторов агента
+        (для документов, загруженных до появления реестра)
+        
+        Returns:
+            число добавленных в реестр файлов
+        """
+        self._registry_backfilled = True
+        if self.registry is None:
+            return 0
+        self._ensure_index()
+        
+        files: Dict[str, Dict[int, tuple]] = {}
+        for vector_id, metadata in self._scan_vectors():
+            filename = metadata.get('filename')
+            if not filename:
+                continue
+            # В общем разделе лежат векторы всех агентов
+            if self.namespace is None and self.agent_type and metadata.get('agent_type') != self.agent_type:
+                continue
+            chunks = files.setdefault(filename, {})
+            chunk_id = int(metadata.get('chunk_id', len(chunks)))
+            chunks.setdefault(chunk_id, (
+                chunk_id,
+                vector_id,
+                DocumentRegistry.text_hash(metadata.get('text', ''))
+            ))
+        
+        added = 0
+        for filename, chunks in files.items():
+            if not self.registry.exists(self._registry_agent, filename):
+                self.registry.record(self._registry_agent, filename, list(chunks.values()))
+                added += 1
+        if added:
+            logger.info(f"📋 Реестр восстановлен по индексу: {added} файлов (агент: {self.agent_type})")
+        return added
+    
+    def _scan_vectors(self, batch_size: int = 100) -> List[tuple]:
+        """(id, метаданные) векторов раздела агента"""
+        try:
+            vectors = []
+            for ids in self.vector_store.list_ids(batch_size):
+                for vector_id, vector in self.vector_store.fetch(ids).items():
+                    vectors.append((vector_id, vector['metadata']))
+            return vectors
+        except Exception as e:
+            logger.warning(f"⚠️ Хранилище не отдаёт список id ({e}), сканируем запросом")
+        
+        # Pod-индексы Pinecone не умеют list — как раньше, запрос с фильтром (до 1000 векторов)
+        scan_filter = {"agent_type": self.agent_type} if self.agent_type and self.namespace is None else None
+        matches = self.vector_store.query(
+            vector=[1.0] + [0.0] * (self.embedding_dimension - 1),
+            top_k=1000,
+            include_metadata=True,
+            filter=scan_filter
+        )
+        return [(match['id'], match['metadata']) for match in matches]
+    
+    def get_document(self, filename: str) -> Optional[Dict]:
+        """
+        Сведения о загруженном документе из реестра
+        
+        Returns:
+            {filename, content_hash, size, chunks, ingested_at} или None
+        """
+        if self.registry is None:
+            return None
+        return self.registry.get(self._registry_agent, filename)
+    
     def init_index(self, pinecone_api_key: str = None):
-        """Инициализация индекса Pinecone"""
-        from pinecone import Pinecone
+        """
+        Инициализация хранилища векторов (Pinecone или локального).
+        Локальное хранилище открывает файлы лениво, при первом запросе
+        """
+        self.vector_store = self._open_store(self.namespace, pinecone_api_key)
+        if self.namespace is not None:
+            self._warn_unmigrated(pinecone_api_key)
+    
+    def _open_store(self, namespace: Optional[str], pinecone_api_key: str = None) -> VectorStore:
+        """Хранилище векторов раздела (None — общий раздел)"""
+        return create_vector_store(
+            self.vector_store_backend,
+            dimension=self.embedding_dimension,
+            pinecone_api_key=pinecone_api_key or self.pinecone_api_key,
+            index_name=self.index_name,
+            path=self.vector_store_path,
+            ann=self.ann_index,
+            ann_nlist=self.ann_nlist,
+            ann_nprobe=self.ann_nprobe,
+            dtype=self.vector_store_dtype,
+            namespace=namespace
+        )
+    
+    def _warn_unmigrated(self, pinecone_api_key: str = None):
+        """Предупреждение, если namespace агента пуст, а в общем разделе есть векторы"""
+        try:
+            if self.vector_store.stats().get('total_vector_count', 0) > 0:
+                return
+            legacy = self._open_store(None, pinecone_api_key).stats().get('total_vector_count', 0)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось проверить namespace {self.namespace}: {e}")
+            return
+        if legacy > 0:
+            logger.warning(
+                f"⚠️ ВНИМАНИЕ: namespace «{self.namespace}» пуст, а в общем разделе {legacy} векторов: "
+                f"поиск агента ничего не найдёт. Перенесите векторы "
+                f"(python -m backend.utils.migrate_namespaces) или задайте VECTOR_NAMESPACES=false"
+            )
+    
+    def for_agent(self, agent_type: str) -> "RAGEngine":
+        """
+        Движок другого агента на общих ресурсах этого: клиент эмбеддингов,
+        кэши, реестр, хранилище текстов, BM25-индекс, пулы потоков и
+        клиент DeepSeek. Подключение к индексу Pinecone тоже общее —
+        у агентов различается только namespace.
+        
+        Кэш эмбеддингов запросов общий и не различает агентов: это верно,
+        пока у всех агентов один провайдер и одна модель эмбеддингов (они
+        берутся из исходного движка и здесь не меняются). Агенту с другой
+        моделью нужен отдельный RAGEngine, а не for_agent.
         
-        api_key = pinecone_api_key or self.pinecone_api_key
-        pc = Pinecone(api_key=api_key)
-        self.index = pc.Index(self.index_name)
-        logger.info(f"✅ Pinecone индекс подключен: {self.index_name}")
+        Закрывать общие ресурсы (aclose) нужно у исходного движка: aclose
+        движка-представления ничего не закрывает.
+        """
+        engine = copy.copy(self)
+        engine.agent_type = agent_type
+        engine._owns_resources = False
+        engine._registry_backfilled = False
+        engine.vector_store = None
+        if self.vector_store is not None:
+            engine.init_index()
+        return engine
     
-    def add_documents(self, documents: List[Dict], batch_size: int = 100):
+    def _lookup_cached_embeddings(self, texts: List[str]):
         """
-        Добавление документов в векторную базу
-        Использует батчинг эмбеддингов для обхода rate limit
-
-        Args:
-            documents: список документов [{id, text, metadata}, ...]
-            batch_size: размер батча для загрузки
+        Поиск эмбеддингов документов в постоянном кэше
+        
+        Returns:
+            (ключи кэша, эмбеддинги с None на месте промахов, индексы промахов)
         """
-        from pinecone import Pinecone
-
-        # Инициализация Pinecone если не было
-        if not self.index:
-            pc = Pinecone(api_key=self.pinecone_api_key)
-            self.index = pc.Index(self.index_name)
-
-        # Собираем все тексты для батч-эмбеддинга
-        texts = [doc['text'] for doc in documents]
-
-        # Получаем все эмбеддинги ОДНИМ запросом (батч)
-        logger.info(f"📊 Создание эмбеддингов для {len(texts)} чанков одним запросом...")
-
-        if self.embedding_provider == "voyage" and self.voyage_client:
-            embeddings = self.voyage_client.embed_batch(texts, input_type="document")
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        if self.embedding_cache is None:
+            return [], embeddings, list(range(len(texts)))
+        
+        keys = [
+            EmbeddingCache.make_key(self.embedder.model, "document", text)
+            for text in texts
+        ]
+        cached = self.embedding_cache.get_many(keys)
+        missing = []
+        for i, key in enumerate(keys):
+            if key in cached:
+                embeddings[i] = cached[key]
+            else:
+                missing.append(i)
+        
+        logger.info(f"💾 Кэш эмбеддингов: {len(texts) - len(missing)} попаданий, {len(missing)} промахов")
+        return keys, embeddings, missing
+    
+    def _store_embeddings(
+        self,
+        keys: List[str],
+        embeddings: List[Optional[List[float]]],
+        missing: List[int],
+        fresh: List[List[float]]
+    ):
+        """Подстановка свежих эмбеддингов на места промахов и запись в кэш"""
+        for i, embedding in zip(missing, fresh):
+            embeddings[i] = embedding
+        if self.embedding_cache is not None:
+            self.embedding_cache.put_many({keys[i]: embeddings[i] for i in missing})
+    
+    def _ingest_stats(self, plan: Dict, misses: int) -> Dict:
+        """Итоги загрузки: сколько чанков пропущено, обновлено, удалено и взято из кэша"""
+        changed = len(plan['changed'])
+        return {
+            "chunks": plan['total'],
+            "unchanged": plan['total'] - changed,
+            "upserted": changed,
+            "deleted": len(plan['stale']),
+            "cache_hits": changed - misses,
+            "cache_misses": misses
+        }
+    
+    def _ensure_index(self):
+        """Подключение к хранилищу, если оно ещё не инициализировано"""
+        if self.vector_store is None:
+            self.init_index()
+    
+    @staticmethod
+    def _chunk_id(doc: Dict, i: int):
+        """Номер чанка: из метаданных, иначе позиция чанка в загружаемом списке"""
+        return doc.get('metadata', {}).get('chunk_id', i)
+    
+    def _vector_id(self, doc: Dict, i: int) -> str:
+        """
+        Id вектора для чанка документа: хэш (agent_type, filename, chunk_id).
+        Фиксированной длины, только ASCII — кириллические имена файлов
+        не схлопываются в одинаковые id, как при вырезании не-ASCII символов
+        """
+        metadata = doc.get('metadata', {})
+        filename = metadata.get('filename')
+        if filename:
+            parts = (
+                self.agent_type or metadata.get('agent_type') or "",
+                filename,
+                str(self._chunk_id(doc, i))
+            )
         else:
-            logger.error("Не настроен провайдер эмбеддингов")
-            raise ValueError("Не настроен провайдер эмбеддингов")
-
-        # Формируем векторы
+            # Документ без имени файла — по его собственному id
+            parts = (self.agent_type or "", doc['id'], str(i))
+        
+        digest = hashlib.blake2b(digest_size=16)
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+    
+    def _plan_ingest(self, documents: List[Dict], force: bool = False) -> Dict:
+        """
+        Сравнение чанков с реестром: что загружать, что удалить
+        
+        Чанк не изменился, если в реестре у файла есть вектор с тем же id
+        и тем же хэшем текста. Векторы файла, которых нет в новой версии, — устаревшие.
+        Прежние векторы файлов без записи в реестре (загруженных до него или
+        без реестра) находятся по метаданным и удаляются после загрузки новых.
+        
+        Returns:
+            {total, ids, hashes, changed: [индексы документов], stale: [id векторов],
+             unregistered: [имена файлов]}
+        """
+        ids = [self._vector_id(doc, i) for i, doc in enumerate(documents)]
+        hashes = [DocumentRegistry.text_hash(doc['text']) for doc in documents]
+        filenames = sorted({doc.get('metadata', {}).get('filename') for doc in documents} - {None, ""})
+        plan = {"total": len(documents), "ids": ids, "hashes": hashes, "stale": [], "unregistered": []}
+        
+        if self.registry is None:
+            plan['changed'] = list(range(len(documents)))
+            plan['unregistered'] = filenames
+            return plan
+        
+        stored: Dict[str, str] = {}
+        new_ids = set(ids)
+        for filename in filenames:
+            chunks = self.registry.chunks(self._registry_agent, filename)
+            if not chunks:
+                plan['unregistered'].append(filename)
+            for chunk in chunks:
+                stored[chunk['vector_id']] = chunk['text_hash']
+                if chunk['vector_id'] not in new_ids:
+                    plan['stale'].append(chunk['vector_id'])
+        
+        if force:
+            plan['changed'] = list(range(len(documents)))
+        else:
+            plan['changed'] = [
+                i for i in range(len(documents)) if stored.get(ids[i]) != hashes[i]
+            ]
+        
+        logger.info(
+            f"🔍 Изменения: {len(plan['changed'])} новых/изменённых чанков, "
+            f"{len(documents) - len(plan['changed'])} без изменений, "
+            f"{len(plan['stale'])} устаревших"
+        )
+        return plan
+    
+    def _build_vectors(
+        self,
+        documents: List[Dict],
+        indexes: List[int],
+        ids: List[str],
+        embeddings: List[List[float]]
+    ) -> List[Dict]:
+        """
+        Формирование векторов для upsert из документов и эмбеддингов
+        
+        Args:
+            documents: все чанки загрузки
+            indexes: какие из них загружать (позиции в documents)
+            ids: id векторов всех чанков (как в плане загрузки)
+            embeddings: эмбеддинги загружаемых чанков, по порядку indexes
+        """
         vectors = []
-        for i, doc in enumerate(documents):
+        for i, embedding in zip(indexes, embeddings):
+            doc = documents[i]
             # Копируем метаданные документа
             metadata = doc.get('metadata', {}).copy()
-            # Добавляем обязательные поля
-            metadata['text'] = doc['text'][:8000]
+            # Без локального хранилища текст едет в метаданных (с лимитом размера)
+            if self.chunk_store is None:
+                metadata['text'] = doc['text'][:8000]
+            # Имя файла и номер чанка остаются в метаданных — id теперь хэш
+            # (номер — тот же, из которого посчитан id и запись в реестре)
+            metadata['chunk_id'] = self._chunk_id(doc, i)
             # 🔑 КРИТИЧЕСКИ ВАЖНО: добавляем agent_type из инстанса RAGEngine
             if self.agent_type:
                 metadata['agent_type'] = self.agent_type
             
             vectors.append({
-                'id': re.sub(r'[^\x00-\x7F]', '', doc['id'] + f'_chunk_{i}'),
-                'values': embeddings[i],
+                'id': ids[i],
+                'values': embedding,
                 'metadata': metadata
             })
+        return vectors
+    
+    def _register_documents(self, documents: List[Dict], plan: Dict):
+        """Запись загруженных файлов в реестр: чанки, хэши, размер, время загрузки"""
+        if self.registry is None:
+            return
+        
+        files: Dict[str, List] = {}
+        sources: Dict[str, str] = {}
+        for i, doc in enumerate(documents):
+            metadata = doc.get('metadata', {})
+            filename = metadata.get('filename')
+            if not filename:
+                continue
+            chunks = files.setdefault(filename, [])
+            chunks.append((
+                self._chunk_id(doc, i),
+                plan['ids'][i],
+                plan['hashes'][i]
+            ))
+            if metadata.get('source'):
+                sources[filename] = metadata['source']
+        
+        for filename, chunks in files.items():
+            source = sources.get(filename)
+            size = os.path.getsize(source) if source and os.path.exists(source) else None
+            self.registry.record(self._registry_agent, filename, chunks, size)
+    
+    def _split_upsert_batches(self, vectors: List[Dict], batch_size: int) -> List[List[Dict]]:
+        """
+        Разбивка векторов на батчи по размеру JSON-представления
+        (не больше upsert_max_bytes и не больше batch_size векторов)
+        """
+        batches = []
+        batch: List[Dict] = []
+        batch_bytes = 0
+        for vector in vectors:
+            size = len(json.dumps(vector, ensure_ascii=False).encode("utf-8")) + 1
+            if batch and (batch_bytes + size > self.upsert_max_bytes or len(batch) >= batch_size):
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+            batch.append(vector)
+            batch_bytes += size
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    def _upsert_batch(self, batch: List[Dict]) -> Optional[Exception]:
+        """
+        Загрузка одного батча с повторами (экспоненциальная задержка с jitter)
+        
+        Returns:
+            None при успехе, иначе последняя ошибка
+        """
+        for attempt in range(self.upsert_max_retries + 1):
+            try:
+                self.vector_store.upsert(batch)
+                return None
+            except Exception as e:
+                if attempt == self.upsert_max_retries:
+                    return e
+                logger.warning(f"⚠️ Ошибка upsert (попытка {attempt + 1}): {e}")
+                time.sleep(random.uniform(0, min(30.0, 2 ** attempt)))
+    
+    def _upsert_vectors(self, vectors: List[Dict], batch_size: int = 1000):
+        """
+        Загрузка векторов в хранилище: батчи по размеру запроса,
+        параллельно в upsert_concurrency потоков. Каждый батч повторяется
+        отдельно — успешные батчи повторно не отправляются
+        """
+        batches = self._split_upsert_batches(vectors, batch_size)
+        if not batches:
+            return
+        
+        workers = max(1, min(self.upsert_concurrency, len(batches)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            errors = list(pool.map(self._upsert_batch, batches))
+        
+        failed = [(batch, error) for batch, error in zip(batches, errors) if error is not None]
+        uploaded = sum(len(batch) for batch, error in zip(batches, errors) if error is None)
+        logger.info(
+            f"📤 Загружено {uploaded} векторов в {len(batches) - len(failed)} батчах "
+            f"(агент: {self.agent_type})"
+        )
+        if failed:
+            lost = sum(len(batch) for batch, _ in failed)
+            raise RuntimeError(
+                f"Не удалось загрузить {len(failed)} батчей ({lost} векторов): {failed[0][1]}"
+            )
+    
+    def _delete_vectors(self, ids: List[str], batch_size: int = 1000):
+        """Удаление векторов (и их текстов) по id батчами"""
+        for i in range(0, len(ids), batch_size):
+            self.vector_store.delete(ids=ids[i:i + batch_size])
+        if self.chunk_store is not None:
+            self.chunk_store.delete_many(ids)
+        if self.lexical_index is not None:
+            self.lexical_index.delete_many(ids)
+        if ids:
+            logger.info(f"🧹 Удалено {len(ids)} векторов (агент: {self.agent_type})")
+    
+    def _apply_ingest(self, documents: List[Dict], plan: Dict, embeddings: List, batch_size: int):
+        """Запись текстов и upsert изменённых чанков, удаление устаревших, обновление реестра"""
+        # Прежние векторы файлов без записи в реестре (id собираются до записи новых)
+        previous = []
+        for filename in plan['unregistered']:
+            previous.extend(self._file_vector_ids(filename))
+        
+        changed = plan['changed']
+        vectors = self._build_vectors(documents, changed, plan['ids'], embeddings)
+        # Тексты пишутся до векторов: найденный вектор всегда имеет текст
+        if self.chunk_store is not None:
+            self.chunk_store.put_many({plan['ids'][i]: documents[i]['text'] for i in changed})
+        self._upsert_vectors(vectors, batch_size)
+        if self.lexical_index is not None:
+            self.lexical_index.add_many(self._registry_agent, [
+                (
+                    vector['id'],
+                    documents[i]['text'],
+                    {k: v for k, v in vector['metadata'].items() if k != 'text'}
+                )
+                for i, vector in zip(changed, vectors)
+            ])
+        # Удаляем после upsert: при сбое загрузки старая версия остаётся целой
+        new_ids = set(plan['ids'])
+        self._delete_vectors(plan['stale'] + [i for i in dict.fromkeys(previous) if i not in new_ids])
+        self._register_documents(documents, plan)
+    
+    def _file_vector_ids(self, filename: str, limit: int = 10000) -> List[str]:
+        """Id векторов файла по метаданным (для файлов, которых нет в реестре)"""
+        file_filter = {"filename": {"$eq": filename}}
+        if self.agent_type and self.namespace is None:
+            file_filter["agent_type"] = {"$eq": self.agent_type}
+        try:
+            matches = self.vector_store.query(
+                vector=[1.0] + [0.0] * (self.embedding_dimension - 1),
+                top_k=limit,
+                include_metadata=False,
+                filter=file_filter
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Прежние чанки {filename} не найдены ({e}) — возможны дубли")
+            return []
+        if len(matches) >= limit:
+            logger.warning(f"⚠️ У {filename} больше {limit} векторов — часть прежних чанков останется")
+        return [match['id'] for match in matches]
+    
+    def add_documents(self, documents: List[Dict], batch_size: int = 1000, force: bool = False):
+        """
+        Добавление документов в векторную базу
+        Использует батчинг эмбеддингов для обхода rate limit
+        
+        Повторная загрузка файла инкрементальна: эмбеддируются и загружаются
+        только новые и изменённые чанки, исчезнувшие удаляются. Поэтому чанки
+        одного файла передаются целиком, одним вызовом.
+
+        Args:
+            documents: список документов [{id, text, metadata}, ...]
+            batch_size: максимум векторов в одном upsert-батче
+            force: загрузить все чанки, не сверяясь с реестром
 
-        # Загружаем в Pinecone батчами
-        for i in range(0, len(vectors), batch_size):
-            batch = vectors[i:i+batch_size]
-            self.index.upsert(vectors=batch)
-            logger.info(f"📤 Загружено {len(batch)} векторов (агент: {self.agent_type})")
+        Returns:
+            статистика загрузки {chunks, unchanged, upserted, deleted, cache_hits, cache_misses}
+        """
+        self._require_embedder()
 
-        logger.info(f"✅ Всего добавлено {len(documents)} документов (агент: {self.agent_type})")
+        # Инициализация хранилища если не было
+        self._ensure_index()
 
-    def generate_answer(
+        plan = self._plan_ingest(documents, force)
+
+        # Собираем тексты изменённых чанков для батч-эмбеддинга
+        texts = [documents[i]['text'] for i in plan['changed']]
+
+        # Получаем эмбеддинги батчами (много текстов в одном запросе)
+        logger.info(f"📊 Создание эмбеддингов для {len(texts)} чанков...")
+
+        keys, embeddings, missing = self._lookup_cached_embeddings(texts)
+        if missing:
+            fresh = self.embedder.embed_batch(
+                [texts[i] for i in missing], input_type="document"
+            )
+            self._store_embeddings(keys, embeddings, missing, fresh)
+
+        self._apply_ingest(documents, plan, embeddings, batch_size)
+
+        logger.info(f"✅ Всего добавлено {len(texts)} документов (агент: {self.agent_type})")
+        return self._ingest_stats(plan, len(missing))
+
+    async def aadd_documents(self, documents: List[Dict], batch_size: int = 1000, force: bool = False):
+        """
+        Асинхронное добавление документов: эмбеддинги через общий AsyncClient,
+        синхронный Pinecone SDK уходит в отдельный поток
+
+        Args:
+            documents: список документов [{id, text, metadata}, ...]
+            batch_size: максимум векторов в одном upsert-батче
+            force: загрузить все чанки, не сверяясь с реестром
+
+        Returns:
+            статистика загрузки {chunks, unchanged, upserted, deleted, cache_hits, cache_misses}
+        """
+        self._require_embedder()
+        await asyncio.to_thread(self._ensure_index)
+
+        plan = self._plan_ingest(documents, force)
+        texts = [documents[i]['text'] for i in plan['changed']]
+        logger.info(f"📊 Создание эмбеддингов для {len(texts)} чанков (async)...")
+
+        keys, embeddings, missing = self._lookup_cached_embeddings(texts)
+        if missing:
+            fresh = await self.embedder.aembed_batch(
+                [texts[i] for i in missing], input_type="document"
+            )
+            self._store_embeddings(keys, embeddings, missing, fresh)
+
+        await asyncio.to_thread(self._apply_ingest, documents, plan, embeddings, batch_size)
+
+        logger.info(f"✅ Всего добавлено {len(texts)} документов (агент: {self.agent_type})")
+        return self._ingest_stats(plan, len(missing))
+
+    def rate_stats(self) -> Dict:
+        """Текущие скорости регулятора запросов по провайдерам"""
+        return rate_governor.stats()
+
+    def cache_stats(self) -> Dict:
+        """Счётчики попаданий кэшей эмбеддингов (документов и запросов)"""
+        return {
+            "documents": self.embedding_cache.stats() if self.embedding_cache is not None else None,
+            "queries": self.query_cache.stats() if self.query_cache is not None else None
+        }
+
+    async def aclose(self):
+        """Освобождение сетевых ресурсов (общие AsyncClient Voyage и DeepSeek)"""
+        if not self._owns_resources:
+            return
+        if self.embedder is not None:
+            await self.embedder.aclose()
+        if self._llm_client is not None:
+            await self._llm_client.aclose()
+            self._llm_client = None
+    
+    def _get_llm_client(self) -> httpx.AsyncClient:
+        """Общий AsyncClient для DeepSeek: соединения переиспользуются между вопросами"""
+        if self._llm_client is None:
+            self._llm_client = httpx.AsyncClient(timeout=60.0)
+        return self._llm_client
+
+    def _compress_passages(self, query: str, passages: List[Dict]) -> List[Dict]:
+        """Экстрактивное сжатие отрывков (при ошибке — отрывки без изменений)"""
+        if self.context_compression == "embedding":
+            score = partial(self._sentence_similarity, query)
+        else:
+            score = partial(term_scores, query)
+        
+        try:
+            compressed = compress_passages(
+                passages,
+                score,
+                keep_ratio=self.compression_keep_ratio,
+                neighbours=self.compression_neighbours
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Сжатие контекста не удалось: {e}")
+            return passages
+        
+        before = sum(len(passage['text']) for passage in passages)
+        after = sum(len(passage['text']) for passage in compressed)
+        logger.info(f"🧹 Сжатие контекста ({self.context_compression}): {before} → {after} символов")
+        return compressed
+    
+    def _sentence_similarity(self, query: str, sentences: List[str]) -> np.ndarray:
+        """Близость предложений к вопросу: эмбеддинг вопроса — из кэша запросов"""
+        query_embedding = self.create_embedding(query, is_query=True)
+        keys, embeddings, missing = self._lookup_cached_embeddings(sentences)
+        if missing:
+            fresh = self.embedder.embed_batch(
+                [sentences[i] for i in missing], input_type="document"
+            )
+            self._store_embeddings(keys, embeddings, missing, fresh)
+        return embedding_scores(query_embedding, embeddings)
+    
+    def _build_messages(
         self,
         query: str,
         context_documents: List[Dict],
-        model: str = "deepseek-chat",
         system_prompt: Optional[str] = None
-    ) -> str:
-        """
-        Генерация ответа на основе найденных документов
-        """
-        # Используем DeepSeek API через httpx
-        if not self.base_url:
-            logger.error("Base URL не настроен для DeepSeek API")
-            return "Ошибка настройки API"
-        
-        # Формируем контекст
+    ) -> List[Dict]:
+        """Сообщения chat completions: системный промпт и вопрос с контекстом"""
+        # Формируем контекст: соседние чанки склеены, перекрытия убраны, бюджет токенов соблюдён
+        passages = merge_adjacent(context_documents, self.chunk_overlap)
+        if self.context_compression:
+            passages = self._compress_passages(query, passages)
+        passages = fill_budget(passages, self.context_max_tokens)
         context = "\n\n".join([
-            f"Документ {i+1}:\n{doc['text']}"
-            for i, doc in enumerate(context_documents)
+            f"Документ {i+1} ({passage['filename'] or 'без имени'}):\n{passage['text']}"
+            for i, passage in enumerate(passages)
         ])
+        logger.info(
+            f"📦 Контекст: {len(context_documents)} фрагментов → {len(passages)} отрывков, "
+            f"~{sum(passage['tokens'] for passage in passages)} токенов"
+        )
         
         if system_prompt is None:
             system_prompt = """Ты - AI-ассистент для поиска информации в документах.
@@ -371,26 +1348,54 @@ class RAGEngine:
 
 Ответ:"""
         
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    def _completion_request(self, messages: List[Dict], model: str, stream: bool = False) -> Dict:
+        """Параметры запроса к /chat/completions"""
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": 0.1,  # ✅ УМЕНЬШЕНО: для более точных ответов
+            "max_tokens": 1000
+        }
+        if stream:
+            payload["stream"] = True
+        return {
+            "url": f"{self.base_url.strip()}/chat/completions",  # ✅ ДОБАВЛЕН .strip()!
+            "headers": {
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            },
+            "json": payload
+        }
+    
+    def generate_answer(
+        self,
+        query: str,
+        context_documents: List[Dict],
+        model: str = "deepseek-chat",
+        system_prompt: Optional[str] = None
+    ) -> str:
+        """
+        Генерация ответа на основе найденных документов
+        """
+        # Используем DeepSeek API через httpx
+        if not self.base_url:
+            logger.error("Base URL не настроен для DeepSeek API")
+            return "Ошибка настройки API"
+        
+        messages = self._build_messages(query, context_documents, system_prompt)
+        
         try:
-            # Используем httpx для запроса к DeepSeek API
+            # Используем httpx для запроса к DeepSeek API (через общий регулятор с повторами)
             with httpx.Client(timeout=60.0) as client:
-                response = client.post(
-                    f"{self.base_url.strip()}/chat/completions",  # ✅ ДОБАВЛЕН .strip()!
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": model,
-                        "messages": [
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_prompt}
-                        ],
-                        "temperature": 0.1,  # ✅ УМЕНЬШЕНО: для более точных ответов
-                        "max_tokens": 1000
-                    }
+                request = self._completion_request(messages, model)
+                response = rate_governor.get("deepseek").call(
+                    lambda: client.post(**request)
                 )
-                response.raise_for_status()
                 data = response.json()
                 
                 return data["choices"][0]["message"]["content"]
@@ -398,6 +1403,76 @@ class RAGEngine:
         except Exception as e:
             logger.error(f"Ошибка при генерации: {e}")
             return "Ошибка при генерации ответа."
+    
+    async def agenerate_answer(
+        self,
+        query: str,
+        context_documents: List[Dict],
+        model: str = "deepseek-chat",
+        system_prompt: Optional[str] = None
+    ) -> str:
+        """Асинхронный generate_answer (не блокирует event loop)"""
+        if not self.base_url:
+            logger.error("Base URL не настроен для DeepSeek API")
+            return "Ошибка настройки API"
+        
+        try:
+            messages = await self._run_blocking(self._build_messages, query, context_documents, system_prompt)
+            request = self._completion_request(messages, model)
+            client = self._get_llm_client()
+            response = await rate_governor.get("deepseek").acall(
+                lambda: client.post(**request)
+            )
+            return response.json()["choices"][0]["message"]["content"]
+        
+        except Exception as e:
+            logger.error(f"Ошибка при генерации: {e}")
+            return "Ошибка при генерации ответа."
+    
+    async def astream_answer(
+        self,
+        query: str,
+        context_documents: List[Dict],
+        model: str = "deepseek-chat",
+        system_prompt: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Потоковая генерация ответа: фрагменты текста по мере их появления
+        (chat completions с stream=True, server-sent events)
+        
+        Ошибки не подменяются текстом, как в generate_answer, а выбрасываются:
+        часть ответа к этому моменту уже может быть показана пользователю
+        """
+        if not self.base_url:
+            raise ValueError("Base URL не настроен для DeepSeek API")
+        
+        messages = await self._run_blocking(self._build_messages, query, context_documents, system_prompt)
+        request = self._completion_request(messages, model, stream=True)
+        
+        client = self._get_llm_client()
+        
+        async def send() -> httpx.Response:
+            response = await client.send(client.build_request("POST", **request), stream=True)
+            if response.status_code >= 400:
+                # Тело ошибки читаем сразу: соединение возвращается в пул до повтора
+                await response.aread()
+            return response
+        
+        response = await rate_governor.get("deepseek").acall(send)
+        try:
+            async for line in response.aiter_lines():
+                # Пустые строки разделяют события, ": ..." — keep-alive комментарии
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                delta = choices[0].get("delta", {}).get("content") if choices else None
+                if delta:
+                    yield delta
+        finally:
+            await response.aclose()
 
 if __name__ == "__main__":
     print("RAG Engine модуль готов!")
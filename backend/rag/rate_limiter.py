@@ -0,0 +1,306 @@
+"""
+Rate Limiter - общий адаптивный регулятор запросов к внешним провайдерам
+(Voyage AI, DeepSeek)
+
+- token bucket на провайдера (запросы в минуту + опционально токены в минуту)
+- AIMD-адаптация: 429 снижает скорость, успешные ответы постепенно её возвращают
+- учёт заголовка Retry-After, экспоненциальная задержка с jitter
+- бюджет повторов, чтобы ретраи не умножали нагрузку при сбоях провайдера
+"""
+from typing import Awaitable, Callable, Dict, Optional
+from email.utils import parsedate_to_datetime
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Лимиты по умолчанию (переопределяются через <PROVIDER>_RPM / <PROVIDER>_TPM)
+DEFAULT_LIMITS = {
+    "voyage": {"rpm": 300, "tpm": 1000000},
+    "deepseek": {"rpm": 60, "tpm": None},
+}
+
+# Статусы, при которых запрос имеет смысл повторить
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Значение Retry-After в секундах (число секунд или HTTP-дата)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryBudget:
+    """
+    Бюджет повторов: каждый успешный запрос пополняет бюджет на ratio,
+    каждый повтор расходует единицу. Пустой бюджет — повторов нет.
+    """
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+
+class ProviderGovernor:
+    """Регулятор запросов к одному провайдеру"""
+
+    def __init__(
+        self,
+        name: str,
+        rpm: float,
+        tpm: Optional[float] = None,
+        min_rpm: float = 1.0,
+        max_retries: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0
+    ):
+        """
+        Args:
+            name: имя провайдера (для логов)
+            rpm: потолок запросов в минуту (квота провайдера)
+            tpm: потолок токенов в минуту (None — не ограничивать)
+            min_rpm: нижняя граница скорости при адаптации
+            max_retries: максимум повторов одного запроса
+            base_delay: базовая задержка экспоненциального backoff
+            max_delay: максимальная задержка между попытками
+        """
+        self.name = name
+        self.max_rate = rpm / 60.0
+        self.min_rate = min_rpm / 60.0
+        self.rate = self.max_rate
+        self.token_rate = tpm / 60.0 if tpm else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_budget = RetryBudget()
+
+        # Ёмкость корзины запросов — секунда трафика (но не меньше одного запроса),
+        # корзины токенов — минута, как и сама квота TPM
+        self._requests = max(1.0, self.rate)
+        self._token_capacity = tpm or 0.0
+        self._tokens = self._token_capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+        self.requests_total = 0
+        self.throttled_total = 0
+        self.retries_total = 0
+
+    # -- token bucket ---------------------------------------------------
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(max(1.0, self.rate), self._requests + elapsed * self.rate)
+        if self.token_rate:
+            self._tokens = min(self._token_capacity, self._tokens + elapsed * self.token_rate)
+
+    def _reserve(self, tokens: int = 0) -> float:
+        """
+        Резервирование слота в корзине.
+        Корзина может уйти в минус — это очередь ожидающих.
+
+        Returns:
+            сколько секунд нужно подождать до отправки запроса
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._requests -= 1.0
+            wait = max(0.0, -self._requests / self.rate)
+            if self.token_rate and tokens:
+                # Запрос больше ёмкости корзины ждёт не дольше, чем её полное пополнение
+                self._tokens -= min(tokens, self._token_capacity)
+                wait = max(wait, -self._tokens / self.token_rate)
+            wait = max(wait, self._blocked_until - now)
+            self.requests_total += 1
+            return wait
+
+    def acquire(self, tokens: int = 0):
+        """Дождаться разрешения на запрос (синхронно)"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int = 0):
+        """Дождаться разрешения на запрос (асинхронно)"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    # -- адаптация ------------------------------------------------------
+
+    def on_success(self):
+        """Успешный ответ: аддитивно возвращаем скорость к потолку"""
+        self.retry_budget.deposit()
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 50.0)
+
+    def on_throttled(self, retry_after: Optional[float]):
+        """Ответ 429: мультипликативно снижаем скорость и учитываем Retry-After"""
+        with self._lock:
+            self.throttled_total += 1
+            old_rate = self.rate
+            self.rate = max(self.min_rate, self.rate * 0.5)
+            # Сбрасываем накопленный запас корзины: следующие запросы идут уже по новой скорости
+            self._requests = min(self._requests, 0.0)
+            if retry_after is not None:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+        logger.warning(
+            f"⚠️ {self.name}: rate limit, скорость {old_rate * 60:.0f} → {self.rate * 60:.0f} RPM"
+            + (f", Retry-After {retry_after:.1f} сек" if retry_after is not None else "")
+        )
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Экспоненциальная задержка с полным jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _should_retry(self, attempt: int, error: Exception) -> bool:
+        if attempt >= self.max_retries:
+            logger.error(f"❌ {self.name}: все попытки исчерпаны: {error}")
+            return False
+        if not self.retry_budget.withdraw():
+            logger.error(f"❌ {self.name}: бюджет повторов исчерпан: {error}")
+            return False
+        self.retries_total += 1
+        logger.warning(f"⚠️ {self.name}: ошибка (попытка {attempt + 1}): {error}")
+        return True
+
+    def _inspect(self, response: httpx.Response) -> Optional[Exception]:
+        """
+        Разбор ответа: None — успех, исключение — повторяемая ошибка.
+        Неповторяемые ошибки (4xx кроме 429) выбрасываются сразу.
+        """
+        if response.status_code in RETRYABLE_STATUSES:
+            if response.status_code == 429:
+                self.on_throttled(parse_retry_after(response.headers.get("Retry-After")))
+            try:
+                response.raise_for_status()
+            except httpx.HTTPStatusError as e:
+                return e
+        response.raise_for_status()
+        self.on_success()
+        return None
+
+    # -- выполнение запросов --------------------------------------------
+
+    def call(self, send: Callable[[], httpx.Response], tokens: int = 0) -> httpx.Response:
+        """
+        Выполнить запрос через регулятор (синхронно)
+
+        Args:
+            send: функция, отправляющая запрос и возвращающая httpx.Response
+            tokens: оценка токенов запроса (для лимита TPM)
+        """
+        attempt = 0
+        while True:
+            self.acquire(tokens)
+            try:
+                response = send()
+                error = self._inspect(response)
+            except httpx.TransportError as e:
+                error = e
+            if error is None:
+                return response
+            if not self._should_retry(attempt, error):
+                raise error
+            # После 429 ожидание уже заложено в корзину и Retry-After
+            if not (isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 429):
+                time.sleep(self.backoff_delay(attempt))
+            attempt += 1
+
+    async def acall(
+        self,
+        send: Callable[[], Awaitable[httpx.Response]],
+        tokens: int = 0
+    ) -> httpx.Response:
+        """Выполнить запрос через регулятор (асинхронно)"""
+        attempt = 0
+        while True:
+            await self.aacquire(tokens)
+            try:
+                response = await send()
+                error = self._inspect(response)
+            except httpx.TransportError as e:
+                error = e
+            if error is None:
+                return response
+            if not self._should_retry(attempt, error):
+                raise error
+            if not (isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 429):
+                await asyncio.sleep(self.backoff_delay(attempt))
+            attempt += 1
+
+    def stats(self) -> Dict:
+        """Текущее состояние регулятора"""
+        return {
+            "rpm": round(self.rate * 60, 1),
+            "max_rpm": round(self.max_rate * 60, 1),
+            "tpm": round(self.token_rate * 60) if self.token_rate else None,
+            "retry_budget": round(self.retry_budget.tokens, 2),
+            "requests": self.requests_total,
+            "throttled": self.throttled_total,
+            "retries": self.retries_total
+        }
+
+
+class RateGovernor:
+    """Реестр регуляторов по провайдерам — один на процесс"""
+
+    def __init__(self):
+        self._providers: Dict[str, ProviderGovernor] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: str) -> ProviderGovernor:
+        """Регулятор провайдера (создаётся при первом обращении)"""
+        with self._lock:
+            if provider not in self._providers:
+                defaults = DEFAULT_LIMITS.get(provider, {"rpm": 60, "tpm": None})
+                prefix = provider.upper()
+                rpm = float(os.getenv(f"{prefix}_RPM", defaults["rpm"]))
+                tpm = os.getenv(f"{prefix}_TPM", defaults["tpm"])
+                self._providers[provider] = ProviderGovernor(
+                    provider,
+                    rpm=rpm,
+                    tpm=float(tpm) if tpm else None
+                )
+                logger.info(f"✅ Регулятор {provider}: {rpm:.0f} RPM")
+            return self._providers[provider]
+
+    def stats(self) -> Dict[str, Dict]:
+        """Текущие скорости всех провайдеров"""
+        with self._lock:
+            providers = dict(self._providers)
+        return {name: governor.stats() for name, governor in providers.items()}
+
+
+rate_governor = RateGovernor()
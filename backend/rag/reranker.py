@@ -0,0 +1,70 @@
+"""
+Reranker - отбор разнообразных фрагментов перед генерацией ответа
+Maximal Marginal Relevance на NumPy: на каждом шаге выбирается фрагмент
+с лучшим балансом релевантности и непохожести на уже выбранные.
+Перекрывающиеся чанки одного файла почти совпадают по эмбеддингам,
+поэтому в промпт попадает один из них, а не шесть.
+"""
+from typing import List, Optional
+
+import numpy as np
+
+
+def mmr_select(
+    relevance: np.ndarray,
+    embeddings: np.ndarray,
+    top_n: int,
+    lambda_: float = 0.7,
+    groups: Optional[List] = None,
+    max_per_group: int = 0,
+    min_score: Optional[float] = None
+) -> List[int]:
+    """
+    Индексы выбранных фрагментов в порядке выбора
+
+    Args:
+        relevance: релевантность фрагментов запросу (n,)
+        embeddings: эмбеддинги фрагментов (n, d); нулевая строка — эмбеддинга нет
+        top_n: сколько фрагментов выбрать
+        lambda_: вес релевантности (1.0 — чистая релевантность, 0.0 — чистое разнообразие)
+        groups: группа каждого фрагмента (имя файла) для ограничения max_per_group
+        max_per_group: максимум фрагментов из одной группы (0 — без ограничения)
+        min_score: фрагменты с релевантностью ниже порога не выбираются
+    """
+    n = len(relevance)
+    if n == 0 or top_n <= 0:
+        return []
+
+    relevance = np.asarray(relevance, dtype=np.float32)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    unit = embeddings / norms
+    similarity = unit @ unit.T
+
+    available = np.ones(n, dtype=bool)
+    if min_score is not None:
+        available &= relevance >= min_score
+
+    group_codes = None
+    if groups is not None and max_per_group > 0:
+        _, group_codes = np.unique(np.asarray(groups, dtype=object).astype(str), return_inverse=True)
+        group_counts = np.zeros(group_codes.max() + 1, dtype=np.int32)
+
+    redundancy = np.zeros(n, dtype=np.float32)
+    selected: List[int] = []
+    while len(selected) < top_n and available.any():
+        scores = lambda_ * relevance - (1.0 - lambda_) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best]) if len(selected) > 1 else similarity[best].copy()
+
+        if group_codes is not None:
+            group = group_codes[best]
+            group_counts[group] += 1
+            if group_counts[group] >= max_per_group:
+                available &= group_codes != group
+
+    return selected
@@ -0,0 +1,959 @@
+"""
+Vector Store - хранилища векторов для RAGEngine
+- PineconeVectorStore: удалённый индекс Pinecone
+- LocalVectorStore: в процессе, на NumPy (float32-матрица + колоночные метаданные),
+  на диске — mmap-снимок + журнал добавлений
+
+Данные агентов разделяются namespace (Pinecone) или отдельными
+коллекциями — подкаталогами (local), поэтому запросам агента
+не нужен фильтр по agent_type.
+
+Формат векторов и фильтров — как у Pinecone:
+    вектор: {"id": str, "values": [float], "metadata": {...}}
+    фильтр: {"agent_type": "ntd"} или {"filename": {"$eq": "..."}, ...}
+"""
+from typing import Any, Dict, Iterator, List, Optional
+from pathlib import Path
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from backend.rag.ann_index import IVFFlatIndex
+
+logger = logging.getLogger(__name__)
+
+
+class VectorStore:
+    """Интерфейс хранилища векторов"""
+
+    def upsert(self, vectors: List[Dict]):
+        """Добавление или замена векторов по id"""
+        raise NotImplementedError
+
+    def query(
+        self,
+        vector: List[float],
+        top_k: int,
+        filter: Optional[Dict] = None,
+        include_metadata: bool = True,
+        include_values: bool = False
+    ) -> List[Dict]:
+        """
+        Поиск ближайших векторов по косинусной близости
+
+        Returns:
+            [{"id", "score", "metadata"}, ...] по убыванию score
+            (+ "values" при include_values)
+        """
+        raise NotImplementedError
+
+    def delete(self, ids: Optional[List[str]] = None, filter: Optional[Dict] = None):
+        """Удаление векторов по id или по фильтру метаданных"""
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        """Статистика хранилища (как минимум total_vector_count)"""
+        raise NotImplementedError
+
+    def fetch(self, ids: List[str]) -> Dict[str, Dict]:
+        """Векторы по id: {id: {"id", "values", "metadata"}} для найденных"""
+        raise NotImplementedError
+
+    def list_ids(self, batch_size: int = 100) -> Iterator[List[str]]:
+        """Все id хранилища порциями (для миграций)"""
+        raise NotImplementedError
+
+
+class PineconeVectorStore(VectorStore):
+    """Обёртка над pinecone.Index (все операции — в пределах одного namespace)"""
+
+    def __init__(self, api_key: str, index_name: str, namespace: Optional[str] = None):
+        self.index = _pinecone_index(api_key, index_name)
+        self.index_name = index_name
+        # "" — namespace по умолчанию
+        self.namespace = namespace or ""
+        logger.info(f"✅ Pinecone индекс подключен: {index_name} (namespace: {self.namespace or 'default'})")
+
+    def upsert(self, vectors: List[Dict]):
+        self.index.upsert(vectors=vectors, namespace=self.namespace)
+
+    def query(
+        self,
+        vector: List[float],
+        top_k: int,
+        filter: Optional[Dict] = None,
+        include_metadata: bool = True,
+        include_values: bool = False
+    ) -> List[Dict]:
+        results = self.index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=include_metadata,
+            include_values=include_values,
+            filter=filter,
+            namespace=self.namespace
+        )
+        matches = []
+        for match in results["matches"]:
+            item = {
+                "id": match["id"],
+                "score": match["score"],
+                "metadata": dict(match.get("metadata") or {})
+            }
+            if include_values:
+                item["values"] = list(match.get("values") or [])
+            matches.append(item)
+        return matches
+
+    def delete(self, ids: Optional[List[str]] = None, filter: Optional[Dict] = None):
+        if ids is not None:
+            self.index.delete(ids=ids, namespace=self.namespace)
+        elif filter is not None:
+            self.index.delete(filter=filter, namespace=self.namespace)
+
+    def stats(self) -> Dict:
+        stats = self.index.describe_index_stats()
+        namespace = (stats.get("namespaces") or {}).get(self.namespace) or {}
+        return {
+            "backend": "pinecone",
+            "index_name": self.index_name,
+            "namespace": self.namespace,
+            "total_vector_count": namespace.get("vector_count", 0),
+            "index_vector_count": stats.get("total_vector_count", 0),
+            "dimension": stats.get("dimension")
+        }
+
+    def fetch(self, ids: List[str]) -> Dict[str, Dict]:
+        response = self.index.fetch(ids=ids, namespace=self.namespace)
+        return {
+            vector_id: {
+                "id": vector_id,
+                "values": list(vector["values"]),
+                "metadata": dict(vector.get("metadata") or {})
+            }
+            for vector_id, vector in response["vectors"].items()
+        }
+
+    def list_ids(self, batch_size: int = 100) -> Iterator[List[str]]:
+        # index.list доступен только для serverless-индексов
+        for ids in self.index.list(namespace=self.namespace, limit=batch_size):
+            yield list(ids)
+
+
+class _CategoricalColumn:
+    """Колонка метаданных со словарным кодированием (быстрые фильтры на равенство)"""
+
+    MISSING = -1
+
+    def __init__(self, capacity: int):
+        self.codes = np.full(capacity, self.MISSING, dtype=np.int32)
+        self.values: List[Any] = []
+        self.lookup: Dict[Any, int] = {}
+
+    def encode(self, value: Any) -> int:
+        code = self.lookup.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.lookup[value] = code
+        return code
+
+    def set(self, row: int, value: Any):
+        self.codes[row] = self.MISSING if value is None else self.encode(value)
+
+    def get(self, row: int) -> Any:
+        code = self.codes[row]
+        return None if code == self.MISSING else self.values[code]
+
+    def resize(self, capacity: int):
+        codes = np.full(capacity, self.MISSING, dtype=np.int32)
+        n = min(capacity, len(self.codes))
+        codes[:n] = self.codes[:n]
+        self.codes = codes
+
+    def mask(self, op: str, operand: Any, size: int) -> np.ndarray:
+        codes = self.codes[:size]
+        if op == "$eq":
+            code = self.lookup.get(operand)
+            return codes == code if code is not None else np.zeros(size, dtype=bool)
+        if op == "$ne":
+            code = self.lookup.get(operand)
+            return codes != code if code is not None else np.ones(size, dtype=bool)
+        if op in ("$in", "$nin"):
+            wanted = [self.lookup[v] for v in operand if v in self.lookup]
+            mask = np.isin(codes, wanted)
+            return mask if op == "$in" else ~mask
+        raise ValueError(f"Неподдерживаемый оператор фильтра: {op}")
+
+
+class _ObjectColumn:
+    """Колонка метаданных произвольных значений (текст, числа)"""
+
+    def __init__(self, capacity: int):
+        self.data = np.empty(capacity, dtype=object)
+
+    def set(self, row: int, value: Any):
+        self.data[row] = value
+
+    def get(self, row: int) -> Any:
+        return self.data[row]
+
+    def resize(self, capacity: int):
+        data = np.empty(capacity, dtype=object)
+        n = min(capacity, len(self.data))
+        data[:n] = self.data[:n]
+        self.data = data
+
+    def mask(self, op: str, operand: Any, size: int) -> np.ndarray:
+        data = self.data[:size]
+        if op == "$eq":
+            return data == operand
+        if op == "$ne":
+            return data != operand
+        if op in ("$in", "$nin"):
+            mask = np.array([value in operand for value in data], dtype=bool)
+            return mask if op == "$in" else ~mask
+        raise ValueError(f"Неподдерживаемый оператор фильтра: {op}")
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Хранилище векторов в памяти процесса.
+    Векторы — float32-матрица нормированных строк из двух сегментов:
+    базовый снимок (memory-mapped файл, общий для всех процессов через
+    page cache ОС) и хвост новых векторов в памяти, восстанавливаемый
+    из журнала добавлений. Поиск — матричное умножение + argpartition.
+    Метаданные — колонки; поля из filter_fields кодируются словарём,
+    и фильтр по ним сводится к сравнению int32-массивов.
+    Опционально — IVF-индекс для приближённого поиска на больших объёмах.
+
+    Формат каталога (поколение g меняется при каждом снимке):
+        manifest.json      — текущее поколение, размерность, dtype, число строк
+        vectors.g.npy      — снимок векторов (float32 или float16), открывается через mmap
+        meta.g.json        — id и колонки метаданных (словари категорий, прочие значения)
+        codes.g.npy        — int32-коды категориальных колонок
+        ivf.g.npz          — обученный IVF-индекс снимка (если есть)
+        log.g.jsonl/.f32   — журнал upsert/delete после снимка и векторы к нему
+
+    Писатель должен быть один (admin-панель или загрузчик); читатели
+    (боты) раз в refresh_interval подхватывают журнал и новые снимки.
+    """
+
+    DEFAULT_FILTER_FIELDS = ("agent_type", "filename", "doc_type")
+    FORMAT_VERSION = 1
+
+    # Строк в блоке при потоковом чтении снимка
+    _BLOCK = 65536
+
+    def __init__(
+        self,
+        dimension: int,
+        path: Optional[str] = None,
+        filter_fields: tuple = DEFAULT_FILTER_FIELDS,
+        ann_index: Optional[IVFFlatIndex] = None,
+        dtype: str = "float32",
+        checkpoint_rows: int = 20000,
+        refresh_interval: float = 1.0
+    ):
+        """
+        Args:
+            dimension: размерность векторов
+            path: каталог для хранения на диске (None — только в памяти)
+            filter_fields: поля метаданных со словарным кодированием
+            ann_index: IVF-индекс для приближённого поиска (None — только точный)
+            dtype: тип векторов в снимке на диске ('float32' или 'float16')
+            checkpoint_rows: после скольких строк в журнале писать новый снимок
+            refresh_interval: как часто (сек) читатель проверяет журнал и снимки
+        """
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Неподдерживаемый dtype хранилища: {dtype}")
+
+        self.dimension = dimension
+        self.path = Path(path) if path else None
+        self.filter_fields = tuple(filter_fields)
+        self.ann_index = ann_index
+        self.dtype = dtype
+        self.checkpoint_rows = checkpoint_rows
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+
+        self._reset_state()
+        # Файлы открываются лениво — при первом обращении
+        self._opened = self.path is None
+
+    # -- служебное ------------------------------------------------------
+
+    def _reset_state(self):
+        self._base = np.empty((0, self.dimension), dtype=np.float32)
+        self._delta = np.zeros((1024, self.dimension), dtype=np.float32)
+        self._delta_n = 0
+        self._capacity = 1024
+        self._size = 0
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        self._ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._columns: Dict[str, Any] = {}
+
+        self._generation = 0
+        self._log_offset = 0
+        self._log_rows = 0
+        self._last_refresh = time.monotonic()
+        if self.ann_index is not None:
+            self.ann_index.reset()
+
+    def __len__(self) -> int:
+        self._ensure_open()
+        with self._lock:
+            self._refresh()
+            return len(self._rows)
+
+    def _ensure_open(self):
+        if self._opened:
+            return
+        with self._lock:
+            if not self._opened:
+                self._open()
+                self._opened = True
+
+    def _column(self, key: str):
+        column = self._columns.get(key)
+        if column is None:
+            if key in self.filter_fields:
+                column = _CategoricalColumn(self._capacity)
+            else:
+                column = _ObjectColumn(self._capacity)
+            self._columns[key] = column
+        return column
+
+    def _grow(self, needed: int):
+        """Рост массивов строк (alive, колонки) до needed"""
+        if needed <= self._capacity:
+            return
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._alive = alive
+        for column in self._columns.values():
+            column.resize(capacity)
+        self._capacity = capacity
+
+    def _grow_delta(self, needed: int):
+        """Рост хвоста векторов в памяти до needed строк"""
+        if needed <= len(self._delta):
+            return
+        capacity = len(self._delta)
+        while capacity < needed:
+            capacity *= 2
+        delta = np.zeros((capacity, self.dimension), dtype=np.float32)
+        delta[:self._delta_n] = self._delta[:self._delta_n]
+        self._delta = delta
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _gather(self, rows: np.ndarray) -> np.ndarray:
+        """Векторы строк (из снимка и/или хвоста) как float32-матрица"""
+        rows = np.asarray(rows, dtype=np.int64)
+        base_n = len(self._base)
+        if self._delta_n == 0:
+            return np.asarray(self._base[rows], dtype=np.float32)
+
+        out = np.empty((len(rows), self.dimension), dtype=np.float32)
+        in_base = rows < base_n
+        out[in_base] = self._base[rows[in_base]]
+        out[~in_base] = self._delta[rows[~in_base] - base_n]
+        return out
+
+    def _scores(self, query: np.ndarray) -> np.ndarray:
+        """Косинусная близость запроса ко всем строкам"""
+        scores = np.empty(self._size, dtype=np.float32)
+        base_n = len(self._base)
+        for start in range(0, base_n, self._BLOCK):
+            block = self._base[start:start + self._BLOCK]
+            scores[start:start + len(block)] = np.asarray(block, dtype=np.float32) @ query
+        scores[base_n:] = self._delta[:self._delta_n] @ query
+        return scores
+
+    def _metadata(self, row: int) -> Dict:
+        metadata = {}
+        for key, column in self._columns.items():
+            value = column.get(row)
+            if value is not None:
+                metadata[key] = value
+        return metadata
+
+    def _filter_mask(self, filter: Optional[Dict]) -> np.ndarray:
+        size = self._size
+        mask = self._alive[:size].copy()
+        for key, condition in (filter or {}).items():
+            if isinstance(condition, dict):
+                conditions = condition.items()
+            else:
+                conditions = [("$eq", condition)]
+            column = self._columns.get(key)
+            for op, operand in conditions:
+                if column is None:
+                    # Поля нет ни у одного вектора: совпадают только отрицания
+                    if op not in ("$ne", "$nin"):
+                        return np.zeros(size, dtype=bool)
+                    continue
+                mask &= column.mask(op, operand, size)
+        return mask
+
+    def _update_ann(self, rows: np.ndarray):
+        """Инкрементальное обновление IVF-индекса (или его обучение по достижении порога)"""
+        if self.ann_index is None:
+            return
+        alive = np.flatnonzero(self._alive[:self._size])
+        if self.ann_index.needs_training(len(alive)):
+            self.ann_index.train(self._gather(alive), alive)
+        else:
+            self.ann_index.add(self._gather(rows), rows)
+
+    # -- изменения в памяти ---------------------------------------------
+
+    def _apply_upsert(self, items: List[Dict], values: np.ndarray):
+        """Добавление строк в хвост; прежние строки тех же id помечаются удалёнными"""
+        replaced = [self._rows[item["id"]] for item in items if item["id"] in self._rows]
+        if replaced:
+            self._apply_delete(replaced)
+
+        self._grow(self._size + len(items))
+        self._grow_delta(self._delta_n + len(items))
+        start = self._size
+        for item, embedding in zip(items, values):
+            vector_id = item["id"]
+            if vector_id in self._rows:
+                # Дубликат id внутри одного батча — побеждает последний
+                self._apply_delete([self._rows[vector_id]])
+            row = self._size
+            self._size += 1
+            self._delta[self._delta_n] = embedding
+            self._delta_n += 1
+            self._ids.append(vector_id)
+            self._rows[vector_id] = row
+            self._alive[row] = True
+            for key, value in (item.get("metadata") or {}).items():
+                self._column(key).set(row, value)
+
+        self._update_ann(np.arange(start, self._size))
+
+    def _apply_delete(self, rows: List[int]):
+        for row in rows:
+            del self._rows[self._ids[row]]
+            self._ids[row] = None
+            self._alive[row] = False
+            for column in self._columns.values():
+                column.set(row, None)
+
+        if self.ann_index is not None:
+            self.ann_index.remove(np.asarray(rows, dtype=np.int64))
+
+    def _compact_in_memory(self):
+        """Физическое удаление «мёртвых» строк хранилища без файлов"""
+        keep = np.flatnonzero(self._alive[:self._size])
+        labels = self.ann_index.labels(keep) if self.ann_index is not None else None
+
+        self._delta[:len(keep)] = self._delta[keep]
+        self._delta_n = len(keep)
+        self._alive[:] = False
+        self._alive[:len(keep)] = True
+        for column in self._columns.values():
+            if isinstance(column, _CategoricalColumn):
+                column.codes[:len(keep)] = column.codes[keep]
+                column.codes[len(keep):] = column.MISSING
+            else:
+                column.data[:len(keep)] = column.data[keep]
+                column.data[len(keep):] = None
+        self._ids = [self._ids[row] for row in keep]
+        self._rows = {vector_id: row for row, vector_id in enumerate(self._ids)}
+        self._size = len(keep)
+
+        if self.ann_index is not None and self.ann_index.is_trained:
+            indexed = np.flatnonzero(labels != IVFFlatIndex.TOMBSTONE)
+            self.ann_index.assign(indexed, labels[indexed])
+
+    def _maybe_compact(self):
+        """Снимок (или компактизация в памяти), когда накопился журнал или удаления"""
+        dead = self._size - len(self._rows)
+        many_dead = dead >= 1024 and dead >= self._size // 4
+        if self.path is None:
+            if many_dead:
+                self._compact_in_memory()
+        elif many_dead or self._log_rows >= self.checkpoint_rows:
+            self.checkpoint()
+
+    # -- VectorStore ----------------------------------------------------
+
+    def upsert(self, vectors: List[Dict]):
+        if not vectors:
+            return
+
+        values = np.asarray([v["values"] for v in vectors], dtype=np.float32)
+        if values.shape[1] != self.dimension:
+            raise ValueError(
+                f"Размерность вектора {values.shape[1]} не совпадает с хранилищем ({self.dimension})"
+            )
+        values = self._normalize(values).astype(np.float32)
+        items = [{"id": v["id"], "metadata": v.get("metadata") or {}} for v in vectors]
+
+        self._ensure_open()
+        with self._lock:
+            self._refresh(force=True)
+            self._log_upsert(items, values)
+            self._apply_upsert(items, values)
+            self._maybe_compact()
+
+    def query(
+        self,
+        vector: List[float],
+        top_k: int,
+        filter: Optional[Dict] = None,
+        include_metadata: bool = True,
+        include_values: bool = False,
+        exact: bool = False,
+        nprobe: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Args:
+            exact: принудительно точный поиск (в обход IVF-индекса)
+            nprobe: переопределение nprobe IVF-индекса для этого запроса
+        """
+        query = self._normalize(np.asarray(vector, dtype=np.float32))
+
+        self._ensure_open()
+        with self._lock:
+            self._refresh()
+            if self._size == 0:
+                return []
+
+            mask = self._filter_mask(filter)
+            candidates = np.flatnonzero(mask)
+            if len(candidates) == 0:
+                return []
+
+            k = min(top_k, len(candidates))
+            rows = None
+
+            # Приближённый поиск — только когда кандидатов много: на малых
+            # объёмах (и при селективном фильтре) точный поиск быстрее
+            use_ann = (
+                not exact
+                and self.ann_index is not None
+                and self.ann_index.is_trained
+                and len(candidates) >= self.ann_index.min_vectors
+            )
+            if use_ann:
+                rows, scores = self.ann_index.search(self._gather, query, k, mask, nprobe)
+                if len(rows) < k:
+                    rows = None  # в пробах мало кандидатов — добираем точным поиском
+
+            if rows is None:
+                # Если фильтр отсекает большую часть — считаем только по кандидатам
+                if len(candidates) < self._size // 2:
+                    scores = self._gather(candidates) @ query
+                    top = np.argpartition(-scores, k - 1)[:k]
+                    rows = candidates[top]
+                else:
+                    scores = self._scores(query)
+                    scores[~mask] = -np.inf
+                    top = np.argpartition(-scores, k - 1)[:k]
+                    rows = top
+                scores = scores[top]
+                order = np.argsort(-scores)
+                rows, scores = rows[order], scores[order]
+
+            matches = [
+                {
+                    "id": self._ids[row],
+                    "score": float(score),
+                    "metadata": self._metadata(row) if include_metadata else {}
+                }
+                for row, score in zip(rows.tolist(), scores.tolist())
+            ]
+            if include_values:
+                for match, values in zip(matches, self._gather(rows).astype(np.float32).tolist()):
+                    match["values"] = values
+            return matches
+
+    def delete(self, ids: Optional[List[str]] = None, filter: Optional[Dict] = None):
+        self._ensure_open()
+        with self._lock:
+            self._refresh(force=True)
+            if ids is not None:
+                rows = [self._rows[i] for i in ids if i in self._rows]
+            elif filter is not None:
+                rows = np.flatnonzero(self._filter_mask(filter)).tolist()
+            else:
+                return
+            if not rows:
+                return
+
+            self._log_delete([self._ids[row] for row in rows])
+            self._apply_delete(rows)
+            self._maybe_compact()
+
+    def stats(self) -> Dict:
+        self._ensure_open()
+        with self._lock:
+            self._refresh()
+        return {
+            "backend": "local",
+            "path": str(self.path) if self.path else None,
+            "total_vector_count": len(self._rows),
+            "dimension": self.dimension,
+            "dtype": str(self._base.dtype) if len(self._base) else self.dtype,
+            "generation": self._generation,
+            "snapshot_rows": len(self._base),
+            "log_rows": self._log_rows,
+            "ann": self.ann_index.stats() if self.ann_index is not None else None
+        }
+
+    def fetch(self, ids: List[str]) -> Dict[str, Dict]:
+        self._ensure_open()
+        with self._lock:
+            self._refresh()
+            rows = [self._rows[i] for i in ids if i in self._rows]
+            values = self._gather(np.asarray(rows, dtype=np.int64)) if rows else []
+            return {
+                self._ids[row]: {
+                    "id": self._ids[row],
+                    "values": vector.tolist(),
+                    "metadata": self._metadata(row)
+                }
+                for row, vector in zip(rows, values)
+            }
+
+    def list_ids(self, batch_size: int = 100) -> Iterator[List[str]]:
+        self._ensure_open()
+        with self._lock:
+            self._refresh()
+            ids = list(self._rows)
+        for i in range(0, len(ids), batch_size):
+            yield ids[i:i + batch_size]
+
+    # -- файлы ----------------------------------------------------------
+
+    def _file(self, name: str, generation: Optional[int] = None) -> Path:
+        generation = self._generation if generation is None else generation
+        return self.path / name.format(g=generation)
+
+    def _read_manifest(self) -> Optional[Dict]:
+        try:
+            with open(self.path / "manifest.json", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _open(self):
+        """Открытие снимка через mmap (без копирования) и проигрывание журнала"""
+        for attempt in range(3):
+            manifest = self._read_manifest()
+            if manifest is None:
+                return
+            try:
+                self._open_generation(manifest)
+                return
+            except FileNotFoundError:
+                # Писатель успел выпустить новый снимок и удалить старый — читаем заново
+                self._reset_state()
+                if attempt == 2:
+                    raise
+
+    def _open_generation(self, manifest: Dict):
+        if manifest["dimension"] != self.dimension:
+            raise ValueError(
+                f"Размерность хранилища {manifest['dimension']} не совпадает с ожидаемой ({self.dimension})"
+            )
+        generation = manifest["generation"]
+        self._base = np.load(self._file("vectors.{g}.npy", generation), mmap_mode="r")
+        with open(self._file("meta.{g}.json", generation), encoding="utf-8") as f:
+            meta = json.load(f)
+        codes = np.load(self._file("codes.{g}.npy", generation))
+
+        n = len(meta["ids"])
+        self._grow(n)
+        self._ids = list(meta["ids"])
+        self._rows = {vector_id: row for row, vector_id in enumerate(self._ids)}
+        self._alive[:n] = True
+        self._size = n
+
+        for key, spec in meta["columns"].items():
+            column = self._column(key)
+            if spec["kind"] == "categorical":
+                column.values = list(spec["values"])
+                column.lookup = {value: code for code, value in enumerate(column.values)}
+                column.codes[:n] = codes[:, spec["index"]]
+            else:
+                for row, value in enumerate(spec["data"]):
+                    column.data[row] = value
+
+        self._generation = generation
+        self._log_offset = 0
+        self._log_rows = 0
+
+        ivf_file = self._file("ivf.{g}.npz")
+        if self.ann_index is not None and ivf_file.exists():
+            self.ann_index.load(ivf_file)
+
+        self._replay_log()
+        if self.ann_index is not None and not self.ann_index.is_trained:
+            self._update_ann(np.empty(0, dtype=np.int64))
+        logger.info(
+            f"✅ Локальное хранилище открыто: {self.path} "
+            f"(поколение {generation}, {len(self._rows)} векторов, mmap {self._base.dtype})"
+        )
+
+    def _refresh(self, force: bool = False):
+        """Подхват изменений другого процесса: новый снимок или хвост журнала"""
+        if self.path is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.refresh_interval:
+            return
+        self._last_refresh = now
+
+        manifest = self._read_manifest()
+        if manifest is None:
+            return
+        if manifest["generation"] != self._generation:
+            self._reset_state()
+            self._open()
+            return
+        self._replay_log()
+
+    def _replay_log(self):
+        """Применение новых записей журнала (только целых строк)"""
+        try:
+            with open(self._file("log.{g}.jsonl"), "rb") as f:
+                f.seek(self._log_offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return
+        if not chunk:
+            return
+
+        end = chunk.rfind(b"\n") + 1
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record["op"] == "upsert":
+                count = len(record["items"])
+                values = np.fromfile(
+                    self._file("log.{g}.f32"),
+                    dtype=np.float32,
+                    count=count * self.dimension,
+                    offset=record["start"] * self.dimension * 4
+                ).reshape(count, self.dimension)
+                self._apply_upsert(record["items"], values)
+                self._log_rows = max(self._log_rows, record["start"] + count)
+            elif record["op"] == "delete":
+                rows = [self._rows[i] for i in record["ids"] if i in self._rows]
+                self._apply_delete(rows)
+        self._log_offset += end
+
+    def _append_log(self, record: Dict):
+        with open(self._file("log.{g}.jsonl"), "ab") as f:
+            f.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+            self._log_offset = f.tell()
+
+    def _ensure_manifest(self):
+        """Пустой снимок нулевого поколения для нового каталога"""
+        if self._read_manifest() is not None:
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._write_snapshot(np.empty(0, dtype=np.int64), generation=0)
+
+    def _log_upsert(self, items: List[Dict], values: np.ndarray):
+        if self.path is None:
+            return
+        self._ensure_manifest()
+        # Сначала векторы, затем запись журнала: читатель не увидит запись без данных
+        with open(self._file("log.{g}.f32"), "ab") as f:
+            f.write(values.astype(np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._append_log({"op": "upsert", "start": self._log_rows, "items": items})
+        self._log_rows += len(items)
+
+    def _log_delete(self, ids: List[str]):
+        if self.path is None:
+            return
+        self._ensure_manifest()
+        self._append_log({"op": "delete", "ids": ids})
+
+    def _write_snapshot(self, keep: np.ndarray, generation: int):
+        """Запись снимка поколения generation из живых строк keep и переключение манифеста"""
+        n = len(keep)
+        vectors = np.lib.format.open_memmap(
+            self._file("vectors.{g}.npy.tmp", generation),
+            mode="w+",
+            dtype=self.dtype,
+            shape=(n, self.dimension)
+        )
+        for start in range(0, n, self._BLOCK):
+            block = keep[start:start + self._BLOCK]
+            vectors[start:start + len(block)] = self._gather(block)
+        vectors.flush()
+        del vectors
+
+        columns = {}
+        categorical = []
+        for key, column in self._columns.items():
+            if isinstance(column, _CategoricalColumn):
+                used, codes = np.unique(column.codes[keep], return_inverse=True)
+                values = [column.values[c] for c in used if c != column.MISSING]
+                # Перекодировка без неиспользуемых значений словаря
+                if len(used) and used[0] == column.MISSING:
+                    codes = codes.astype(np.int32) - 1
+                columns[key] = {"kind": "categorical", "values": values, "index": len(categorical)}
+                categorical.append(codes.astype(np.int32))
+            else:
+                columns[key] = {"kind": "object", "data": column.data[keep].tolist()}
+        codes = np.stack(categorical, axis=1) if categorical else np.empty((n, 0), dtype=np.int32)
+
+        meta = {"ids": [self._ids[row] for row in keep], "columns": columns}
+        with open(self._file("meta.{g}.json.tmp", generation), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        with open(self._file("codes.{g}.npy.tmp", generation), "wb") as f:
+            np.save(f, codes)
+
+        for name in ("vectors.{g}.npy", "meta.{g}.json", "codes.{g}.npy"):
+            os.replace(self._file(name + ".tmp", generation), self._file(name, generation))
+        if self.ann_index is not None and self.ann_index.is_trained:
+            with open(self._file("ivf.{g}.npz", generation), "wb") as f:
+                self.ann_index.save(f, self.ann_index.labels(keep))
+        for name in ("log.{g}.jsonl", "log.{g}.f32"):
+            open(self._file(name, generation), "wb").close()
+
+        manifest = {
+            "format": self.FORMAT_VERSION,
+            "generation": generation,
+            "dimension": self.dimension,
+            "dtype": self.dtype,
+            "rows": n
+        }
+        with open(self.path / "manifest.json.tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(self.path / "manifest.json.tmp", self.path / "manifest.json")
+
+    def checkpoint(self):
+        """
+        Новый снимок: живые строки (снимок + журнал) пишутся в файлы
+        следующего поколения, журнал обнуляется, старые файлы удаляются.
+        Читатели со старым mmap продолжают работать до своего refresh.
+        """
+        if self.path is None:
+            return
+        self._ensure_open()
+        with self._lock:
+            old = self._generation
+            keep = np.flatnonzero(self._alive[:self._size])
+            self._write_snapshot(keep, generation=old + 1)
+            logger.info(f"💾 Снимок хранилища: поколение {old + 1}, {len(keep)} векторов")
+
+            self._reset_state()
+            self._open()
+            self._remove_old_generations()
+
+    def _remove_old_generations(self):
+        """
+        Удаление файлов прошлых поколений. Там, где открытый mmap
+        не даёт удалить файл (Windows), он удаляется при следующем снимке
+        """
+        for file in self.path.iterdir():
+            parts = file.name.split(".")
+            if len(parts) < 3 or not parts[1].isdigit() or int(parts[1]) >= self._generation:
+                continue
+            try:
+                file.unlink()
+            except OSError:
+                pass
+
+
+# Локальные хранилища с общим путём разделяются между RAGEngine одного процесса
+_local_stores: Dict[str, LocalVectorStore] = {}
+_local_stores_lock = threading.Lock()
+
+# Подключения к индексам Pinecone — тоже: namespace агентов отличаются только параметром запроса
+_pinecone_indexes: Dict[tuple, Any] = {}
+_pinecone_lock = threading.Lock()
+
+
+def _pinecone_index(api_key: str, index_name: str):
+    """Общий pinecone.Index (с пулом соединений) для ключа и имени индекса"""
+    key = (api_key, index_name)
+    with _pinecone_lock:
+        if key not in _pinecone_indexes:
+            from pinecone import Pinecone
+
+            _pinecone_indexes[key] = Pinecone(api_key=api_key).Index(index_name)
+        return _pinecone_indexes[key]
+
+
+def create_vector_store(
+    backend: str,
+    dimension: int,
+    pinecone_api_key: Optional[str] = None,
+    index_name: Optional[str] = None,
+    path: Optional[str] = None,
+    ann: Optional[str] = None,
+    ann_nlist: int = 0,
+    ann_nprobe: int = 16,
+    dtype: str = "float32",
+    namespace: Optional[str] = None
+) -> VectorStore:
+    """
+    Создание хранилища векторов по имени из конфигурации
+
+    Args:
+        backend: 'pinecone' или 'local'
+        dimension: размерность векторов
+        pinecone_api_key: ключ Pinecone (для backend='pinecone')
+        index_name: имя индекса Pinecone
+        path: каталог локального хранилища (для backend='local')
+        ann: приближённый индекс локального хранилища ('ivf' или None)
+        ann_nlist: число кластеров IVF (0 — sqrt(N))
+        ann_nprobe: сколько списков IVF сканировать при поиске
+        dtype: тип векторов в снимке локального хранилища ('float32' или 'float16')
+        namespace: раздел данных агента — namespace Pinecone или подкаталог
+            локального хранилища (None — общий раздел по умолчанию)
+    """
+    if backend == "pinecone":
+        return PineconeVectorStore(pinecone_api_key, index_name, namespace)
+
+    if backend == "local":
+        ann_index = None
+        if ann == "ivf":
+            ann_index = IVFFlatIndex(dimension, nlist=ann_nlist, nprobe=ann_nprobe)
+        elif ann:
+            raise ValueError(f"Неизвестный ANN-индекс: {ann}")
+
+        if not path:
+            logger.info(f"✅ Локальное хранилище векторов в памяти (dim={dimension})")
+            return LocalVectorStore(dimension, ann_index=ann_index)
+        if namespace:
+            path = os.path.join(path, namespace)
+        key = os.path.abspath(path)
+        with _local_stores_lock:
+            if key not in _local_stores:
+                _local_stores[key] = LocalVectorStore(
+                    dimension, path=path, ann_index=ann_index, dtype=dtype
+                )
+                logger.info(f"✅ Локальное хранилище векторов: {path}")
+            return _local_stores[key]
+
+    raise ValueError(f"Неизвестное хранилище векторов: {backend}")
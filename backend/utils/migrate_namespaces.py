@@ -0,0 +1,149 @@
+"""
+Namespace Migration - перенос векторов из общего раздела индекса
+в разделы агентов (namespace Pinecone или коллекции локального хранилища)
+
+Векторы распределяются по metadata['agent_type']; векторы без типа
+агента остаются на месте. Повторный запуск безопасен: перенесённые
+векторы из общего раздела удаляются.
+"""
+import sys
+from pathlib import Path
+import logging
+from typing import Dict, Iterator, List
+
+# Корень репозитория — для импорта backend.* при запуске как скрипта
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from backend.config import config
+from backend.rag.document_registry import DocumentRegistry
+from backend.rag.vector_store import VectorStore, create_vector_store
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+AGENT_TYPES = ("ntd", "docs")
+
+
+def open_store(namespace: str = None) -> VectorStore:
+    """Хранилище из конфигурации (namespace None — общий раздел)"""
+    return create_vector_store(
+        config.VECTOR_STORE,
+        dimension=config.EMBEDDING_DIMENSION,
+        pinecone_api_key=config.PINECONE_API_KEY,
+        index_name=config.PINECONE_INDEX,
+        path=config.VECTOR_STORE_PATH or None,
+        dtype=config.VECTOR_STORE_DTYPE,
+        namespace=namespace
+    )
+
+
+def registry_ids(batch_size: int) -> Iterator[List[str]]:
+    """Id векторов из реестра документов (если индекс не умеет list)"""
+    if not config.DOCUMENT_REGISTRY_PATH:
+        return
+    registry = DocumentRegistry(config.DOCUMENT_REGISTRY_PATH)
+    try:
+        for agent_type in AGENT_TYPES:
+            ids = [
+                chunk['vector_id']
+                for doc in registry.list_documents(agent_type)
+                for chunk in registry.chunks(agent_type, doc['filename'])
+            ]
+            for i in range(0, len(ids), batch_size):
+                yield ids[i:i + batch_size]
+    finally:
+        registry.close()
+
+
+def source_ids(source: VectorStore, batch_size: int) -> Iterator[List[str]]:
+    """Id векторов общего раздела порциями"""
+    try:
+        yield from source.list_ids(batch_size)
+    except Exception as e:
+        logger.warning(f"⚠️ Хранилище не отдаёт список id ({e}), берём id из реестра документов")
+        yield from registry_ids(batch_size)
+
+
+def migrate(batch_size: int = 100, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Перенос векторов в разделы агентов
+
+    Args:
+        batch_size: сколько векторов читать и записывать за раз
+        dry_run: только посчитать, ничего не менять
+
+    Returns:
+        число перенесённых векторов по агентам (+ 'skipped' без типа агента)
+    """
+    source = open_store()
+    targets = {agent_type: open_store(agent_type) for agent_type in AGENT_TYPES}
+    counts = {agent_type: 0 for agent_type in AGENT_TYPES}
+    counts['skipped'] = 0
+    moved: List[str] = []
+
+    for ids in source_ids(source, batch_size):
+        vectors = source.fetch(ids)
+        groups: Dict[str, List[Dict]] = {agent_type: [] for agent_type in AGENT_TYPES}
+        for vector in vectors.values():
+            agent_type = vector['metadata'].get('agent_type')
+            if agent_type in groups:
+                groups[agent_type].append(vector)
+            else:
+                counts['skipped'] += 1
+
+        for agent_type, group in groups.items():
+            if not group:
+                continue
+            if not dry_run:
+                targets[agent_type].upsert(group)
+            moved.extend(vector['id'] for vector in group)
+            counts[agent_type] += len(group)
+        logger.info(f"📤 Перенесено: {counts}")
+
+    # Удаляем из общего раздела после полного прохода — не ломаем постраничный list
+    if not dry_run:
+        for i in range(0, len(moved), 1000):
+            source.delete(ids=moved[i:i + 1000])
+        if moved:
+            logger.info(f"🧹 Удалено из общего раздела: {len(moved)} векторов")
+
+    return counts
+
+
+def main():
+    """Главная функция для запуска миграции"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Перенос векторов из общего раздела в namespace/коллекции агентов'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=100,
+        help='Размер порции векторов'
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Только посчитать векторы, ничего не переносить'
+    )
+
+    args = parser.parse_args()
+
+    try:
+        counts = migrate(batch_size=args.batch_size, dry_run=args.dry_run)
+    except Exception as e:
+        logger.error(f"❌ Ошибка миграции: {e}")
+        sys.exit(1)
+
+    logger.info(f"\n" + "="*60)
+    logger.info(f"📊 Итоги миграции{' (dry run)' if args.dry_run else ''}:")
+    for agent_type in AGENT_TYPES:
+        logger.info(f"   ✅ {agent_type}: {counts[agent_type]}")
+    logger.info(f"   ⚠️ Без agent_type: {counts['skipped']}")
+    logger.info("="*60)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from backend.config import config
 from backend.utils.document_processor import DocumentProcessor
-from backend.rag.rag_engine import RAGEngine
+from backend.rag.factory import create_rag_engine
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -26,27 +26,14 @@ class DocumentUploader:
         """
         self.agent_type = agent_type
         
-        # Используем единый индекс для обоих агентов
-        index_name = config.PINECONE_INDEX
-        
         # Инициализация компонентов
         self.processor = DocumentProcessor(
             chunk_size=config.CHUNK_SIZE,
             chunk_overlap=config.CHUNK_OVERLAP
         )
         
-        self.rag = RAGEngine(
-            api_key=config.get_api_key(),
-            pinecone_api_key=config.PINECONE_API_KEY,
-            index_name=index_name,
-            agent_type=agent_type,
-            embedding_model=config.EMBEDDING_MODEL,
-            embedding_dimension=config.EMBEDDING_DIMENSION,
-            base_url=config.get_base_url(),
-            ai_provider=config.AI_PROVIDER,
-            voyage_api_key=config.VOYAGE_API_KEY,
-            embedding_provider=config.EMBEDDING_PROVIDER
-        )
+        # Единый индекс для обоих агентов, параметры — из конфигурации
+        self.rag = create_rag_engine(agent_type)
     
     def upload_file(self, file_path: str):
         """
@@ -90,8 +77,15 @@ class DocumentUploader:
             
             # Загрузка в векторную БД
             logger.info(f"\n📤 Загрузка в векторную базу...")
-            self.rag.add_documents(documents)
-            logger.info(f"✅ Загружено {len(documents)} чанков")
+            stats = self.rag.add_documents(documents)
+            logger.info(
+                f"✅ Загружено {stats['upserted']} чанков из {len(documents)} "
+                f"({stats['unchanged']} без изменений, {stats['deleted']} устаревших удалено)"
+            )
+            logger.info(
+                f"   - Кэш эмбеддингов: {stats['cache_hits']} попаданий, "
+                f"{stats['cache_misses']} промахов"
+            )
         
         except Exception as e:
             logger.error(f"❌ Ошибка при обработке файла: {e}")